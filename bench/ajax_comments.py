@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Замер разбора ответа ajaxresponsecomment (``User._parse_ajax_comments``).
+
+Сравнивает пакетный разбор всех комментариев одним документом
+с разбором каждого комментария отдельно, как это делалось раньше.
+Запуск из корня репозитория::
+
+    python bench/ajax_comments.py [количество_комментариев]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'test'), ROOT]
+
+from tabun_api import utils, parse_comment, parse_deleted_comment  # noqa: E402
+from testutil import UserTest  # noqa: E402
+from test_comments import build_comment  # noqa: E402
+
+
+def build_data(count):
+    comments = {}
+    for i in range(1, count + 1):
+        pid = i // 2 or None
+        comments[str(i)] = {'id': i, 'pid': pid, 'html': build_comment(i, pid)}
+    return {'comments': comments, 'bStateError': False, 'sMsg': ''}
+
+
+def parse_each(data, target_id):
+    # Старый способ: каждый комментарий экранируется и парсится отдельно
+    comms = {}
+    for comm in dict(data['comments']).values():
+        sect = utils.parse_html_fragment(utils.escape_comment_contents(comm['html'].encode('utf-8')))[0]
+        pcomm = parse_comment(sect, target_id, None, comm['pid'])
+        if not pcomm and sect.get('id', '').startswith('comment_id_'):
+            pcomm = parse_deleted_comment(sect, target_id, None, comm['pid'])
+        if pcomm:
+            comms[pcomm.comment_id] = pcomm
+    return comms
+
+
+def best_of(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    data = build_data(count)
+    user = UserTest()
+
+    batched = user._parse_ajax_comments(data, 132085, 'blog', 'x')
+    single = parse_each(data, 132085)
+    assert sorted(batched) == sorted(single)
+
+    print('comments: {}'.format(len(batched)))
+    print('per-snippet: {:.1f} ms'.format(best_of(lambda: parse_each(data, 132085))))
+    print('batched:     {:.1f} ms'.format(best_of(lambda: user._parse_ajax_comments(data, 132085, 'blog', 'x'))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Замер последовательных запросов с пулом keep-alive соединений и без него.
+
+Использует локальный HTTP-сервер из ``test/test_transport.py``, так что
+замеряются в основном накладные расходы на установку соединения.
+Запуск из корня репозитория::
+
+    python bench/connection_pool.py [число_запросов]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import time
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'test'), ROOT]
+
+from test_transport import LocalServer, make_user  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    server = LocalServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        for pool in (None, True):
+            user = make_user(server, pool)
+            start = time.time()
+            for _ in range(count):
+                user.urlread('/x')
+            elapsed = time.time() - start
+            print('connection_pool={!s:<5} {} requests in {:.2f} s ({:.3f} ms/req), {} connections'.format(
+                pool, count, elapsed, elapsed / count * 1000, len(server.connections)
+            ))
+            server.connections.clear()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Замер подготовки большой страницы с комментами к парсингу.
+
+Сравнивает ``utils.preprocess_page`` с цепочкой ``replace_cloudflare_emails``,
+``escape_topic_contents`` и ``escape_comment_contents`` по времени и пиковому
+расходу памяти (пик доступен только на Python 3, через ``tracemalloc``).
+Страница собирается из ``test/data/132085.html``, комменты которой повторены
+нужное число раз. Запуск из корня репозитория::
+
+    python bench/preprocess.py [число_повторов]
+
+В версиях без ``preprocess_page`` замеряется только цепочка, так что скрипт
+можно запустить и на старом коммите, чтобы сравнить с прежней реализацией.
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'test'), ROOT]
+
+from tabun_api import utils  # noqa: E402
+import testutil  # noqa: E402
+
+
+def build_page(repeat):
+    raw = testutil.load_file('132085.html')
+    start = raw.index(b'<div class="comment-wrapper"')
+    end = raw.rindex(b'<!-- /content -->')
+    return raw[:start] + raw[start:end] * repeat + raw[end:]
+
+
+def chain(data):
+    data = utils.replace_cloudflare_emails(data)
+    data = utils.escape_topic_contents(data, True)
+    return utils.escape_comment_contents(data)
+
+
+def preprocess(data):
+    return utils.preprocess_page(data, True)
+
+
+def peak_memory(func, data):
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    page = build_page(repeat)
+    print('page: {} KiB, {} sections'.format(len(page) // 1024, page.count(b'<section')))
+
+    expected = chain(page)
+    funcs = [('chain', chain)]
+    if hasattr(utils, 'preprocess_page'):
+        funcs.append(('preprocess_page', preprocess))
+    for name, func in funcs:
+        assert func(page) == expected
+        best = min(timeit.repeat(lambda: func(page), number=1, repeat=20)) * 1000
+        peak = peak_memory(func, page)
+        print('{:<16} {:.2f} ms, peak traced {}'.format(
+            name, best, '{} KiB'.format(peak // 1024) if peak is not None else 'n/a'
+        ))
+
+
+if __name__ == '__main__':
+    main()
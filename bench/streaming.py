@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Замер ``get_posts`` с потоковым разбором страницы и без него.
+
+Поднимает локальный HTTP-сервер, который отдаёт главную страницу
+(``test/data/index.html`` с постами, повторёнными нужное число раз)
+кусками по 16 КиБ с задержкой между ними, как медленное соединение.
+Запуск из корня репозитория::
+
+    python bench/streaming.py [число_повторов]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import time
+import threading
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'test'), ROOT]
+
+import tabun_api as api  # noqa: E402
+from tabun_api.compat import PY2  # noqa: E402
+import testutil  # noqa: E402
+
+if PY2:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+CHUNK_SIZE = 16 * 1024
+CHUNK_DELAY = 0.01
+
+
+class ThrottledServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, page):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ThrottledHandler)
+        self.page = page
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        page = self.server.page
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        for i in range(0, len(page), CHUNK_SIZE):
+            self.wfile.write(page[i:i + CHUNK_SIZE])
+            self.wfile.flush()
+            time.sleep(CHUNK_DELAY)
+
+
+def build_page(repeat):
+    raw = testutil.load_file('index.html')
+    end_marker = b'</article> <!-- /.topic -->'
+    start = raw.index(b'<article ')
+    end = raw.rindex(end_marker) + len(end_marker)
+    return raw[:start] + raw[start:end] * repeat + raw[end:]
+
+
+def make_user(server=None, **kwargs):
+    if server is not None:
+        kwargs['http_host'] = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    return api.User(
+        session_id='abcdef9876543210abcdef9876543210',
+        security_ls_key='0123456789abcdef0123456789abcdef',
+        avoid_cf=False,
+        compression=False,
+        **kwargs
+    )
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    page = build_page(repeat)
+
+    server = ThrottledServer(page)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        print('page: {} KiB, {} KiB every {} ms'.format(len(page) // 1024, CHUNK_SIZE // 1024, int(CHUNK_DELAY * 1000)))
+        user = make_user()
+        parse_only = min(timeit.repeat(lambda: user.get_posts('/', raw_data=page), number=1, repeat=5))
+        print('parse only:      {:.3f} s'.format(parse_only))
+
+        for streaming in (False, True):
+            user = make_user(server, streaming=streaming)
+            count = len(user.get_posts('/'))
+            times = timeit.repeat(lambda: user.get_posts('/'), number=1, repeat=5)
+            print('streaming={!s:<5}  {} posts, best {:.3f} s, avg {:.3f} s'.format(
+                streaming, count, min(times), sum(times) / len(times)
+            ))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Микро-замер парсеров, которые берут выражения из ``tabun_api.xpaths``.
+
+Каждый парсер замеряется дважды: со скомпилированными выражениями
+(``lxml.etree.XPath``, как в библиотеке) и с вычислением строк через
+``element.xpath('...')`` при каждом вызове, как было до появления
+модуля ``xpaths``. Запуск из корня репозитория::
+
+    python bench/xpaths.py [число_повторов]
+"""
+
+from __future__ import unicode_literals, print_function
+
+import os
+import sys
+import timeit
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'test'), ROOT]
+
+import tabun_api as api  # noqa: E402
+from tabun_api import utils, xpaths  # noqa: E402
+import testutil  # noqa: E402
+from test_comments import build_comments_page  # noqa: E402
+
+
+def iter_groups(group):
+    yield group
+    for value in vars(group).values():
+        if isinstance(value, xpaths.XPathGroup):
+            for subgroup in iter_groups(value):
+                yield subgroup
+
+
+def string_xpath(expression):
+    return lambda node, **variables: node.xpath(expression, **variables)
+
+
+@contextmanager
+def uncompiled():
+    # Временно подменяет все скомпилированные выражения вызовом node.xpath(строка)
+    groups = [g for name in xpaths.__all__ for g in [getattr(xpaths, name)] if isinstance(g, xpaths.XPathGroup)]
+    saved = []
+    for root in groups:
+        for group in iter_groups(root):
+            for key, expression in group.expressions.items():
+                saved.append((group, key, getattr(group, key)))
+                setattr(group, key, string_xpath(expression))
+    try:
+        yield
+    finally:
+        for group, key, value in saved:
+            setattr(group, key, value)
+
+
+def build_cases():
+    cases = []
+
+    raw = testutil.load_file('index.html')
+    raw = utils.find_substring(raw, b'<article ', b'</article> <!-- /.topic -->', extend=True)
+    articles = [x for x in utils.parse_html_fragment(utils.escape_topic_contents(raw, True)) if getattr(x, 'tag', None) == 'article']
+    cases.append(('parse_post x{}'.format(len(articles)), lambda: [api.parse_post(x) for x in articles]))
+
+    raw = build_comments_page(300)
+    raw = utils.find_substring(raw, b'<div class="comments', b'<!-- /content -->', extend=True, with_end=False)
+    sections = list(utils.parse_html_fragment(utils.preprocess_page(raw, True))[0].iter('section'))
+    cases.append(('parse_comment x{}'.format(len(sections)), lambda: [api.parse_comment(x, 1) for x in sections]))
+
+    items = [x for x in utils.parse_html(testutil.load_file('activity.html')).iter('li') if 'stream-item' in (x.get('class') or '')]
+    cases.append(('parse_activity x{}'.format(len(items)), lambda: [api.parse_activity(x) for x in items]))
+
+    user = testutil.UserTest()
+    raw = testutil.load_file('profile.html')
+    cases.append(('get_profile', lambda: user.get_profile('test', raw_data=raw)))
+
+    rows = ''.join(
+        '<tr><td class="cell-name"><span class="blog-link-with-avatar"><a class="avatar"><img src="a.png"/></a>'
+        '<a class="blog-title-wrapper" href="/blog/b{0}/"><span>Blog {0}</span></a>'
+        '<span class="nickname">u{0}</span></span></td>'
+        '<td class="cell-topics">{0}</td><td class="cell-readers" id="r_{0}">{0}</td><td>1.5</td></tr>'.format(i)
+        for i in range(100)
+    )
+    trs = list(utils.parse_html('<table>' + rows + '</table>').iter('tr'))
+
+    def blogs_rows():
+        new = xpaths.blogs_list.new
+        for tr in trs:
+            cell = new.name_cell(tr)[0]
+            new.avatar(cell)
+            new.closed(new.link(cell)[0])
+            new.creator(cell)
+            new.topics(tr)
+            xpaths.blogs_list.readers(tr)
+
+    cases.append(('blogs_list rows x{}'.format(len(trs)), blogs_rows))
+    return cases
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    print('{:<24} {:>10} {:>10}'.format('', 'strings', 'compiled'))
+    for name, func in build_cases():
+        with uncompiled():
+            before = best_of(func, repeat)
+        after = best_of(func, repeat)
+        print('{:<24} {:>7.2f} ms {:>7.2f} ms'.format(name, before, after))
+
+
+if __name__ == '__main__':
+    main()
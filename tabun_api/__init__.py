@@ -6,8 +6,11 @@ from __future__ import print_function, unicode_literals
 import os
 import re
 import ssl
+import copy
 import time
+import inspect
 import logging
+import functools
 import warnings
 import threading
 from hashlib import md5
@@ -15,10 +18,17 @@ from datetime import datetime
 from socket import timeout as socket_timeout
 from json import JSONDecoder
 
-from . import errors, types, utils, compat
+from . import errors, types, utils, compat, transport, ratelimit, cache, retry, userpool, xpaths, document, tree
 from .errors import TabunError, TabunResultError
+from .transport import ConnectionPool, SingleFlight
+from .ratelimit import IntervalLimiter, TokenBucketLimiter
+from .cache import ResponseCache, CommentCache
+from .retry import RetryPolicy, CircuitBreaker
+from .userpool import UserPool
+from .document import PageDocument
+from .tree import CommentTree
 from .types import Post, Download, Comment, Blog, StreamItem, UserInfo, Poll, TalkItem, ActivityItem, EditablePost, EditableBlog
-from .compat import PY2, BaseCookie, urequest, text_types, text, binary, html_unescape
+from .compat import PY2, BaseCookie, urequest, queue, text_types, text, binary, html_unescape
 
 
 __version__ = '0.7.16'
@@ -41,10 +51,50 @@ http_headers = {
 #: Регулярка для парсинга ссылки на пост.
 post_url_regex = re.compile(r"/blog/(([A-z0-9_\-\.]{1,})/)?([0-9]{1,}).html")
 
+#: Регулярка для парсинга ссылки на блог.
+blog_url_regex = re.compile(r"/blog/([A-z0-9_\-\.]{1,})/?$")
+
 #: Регулярка для парсинга прикреплённых файлов.
 post_file_regex = re.compile(r'^Скачать \"(.+)" \(([0-9]*(\.[0-9]*)?) (Кб|Мб)\)$')
 
 
+if PY2:
+    def _get_callargs(func, *args, **kwargs):
+        return inspect.getcallargs(func, *args, **kwargs)  # pylint: disable=deprecated-method
+else:
+    def _get_callargs(func, *args, **kwargs):
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        return bound.arguments
+
+
+def coalesced(func):
+    """Декоратор для методов ``User``, объединяющий одинаковые одновременные
+    вызовы через ``user.single_flight`` (если он включен). Вызовы с ``raw_data``
+    не объединяются, потому что не отправляют запросов. Дождавшиеся чужого
+    вызова получают неглубокую копию результата, так что изменение полученного
+    объекта в одном потоке не видно в других.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.single_flight is None:
+            return func(self, *args, **kwargs)
+        callargs = _get_callargs(func, self, *args, **kwargs)
+        if callargs.get('raw_data'):
+            return func(self, *args, **kwargs)
+        key = (func.__name__, self.get_session_identity()) + tuple(sorted(
+            (k, v) for k, v in callargs.items() if k != 'self'
+        ))
+        try:
+            hash(key)
+        except TypeError:
+            return func(self, *args, **kwargs)
+        return self.single_flight.do(key, lambda: func(self, *args, **kwargs), copy_func=copy.copy)
+
+    return wrapper
+
+
 class NoRedirect(urequest.HTTPRedirectHandler):
     def http_error_302(self, req, fp, code, msg, headers):
         return fp
@@ -121,6 +171,78 @@ class User(object):
       в ``http_host``
     * любое другое значение — проверять все SSL-сертификаты
 
+    По умолчанию каждый запрос открывает новое соединение (а для HTTPS ещё и проходит
+    TLS-рукопожатие). Если запросов много, можно передать в ``connection_pool`` значение
+    ``True`` или объект :class:`~tabun_api.transport.ConnectionPool` (его можно использовать
+    в нескольких объектах ``User`` одновременно), и тогда соединения будут
+    переиспользоваться. Пул соединений нельзя использовать вместе с прокси
+    (в том числе заданным через ``TABUN_API_PROXY``): при указании обоих
+    конструктор выкидывает ``ValueError``.
+
+    Ответы сервера запрашиваются в сжатом виде (gzip, deflate или brotli,
+    если установлен модуль ``brotli``) и разжимаются по мере чтения; число
+    полученных по сети и разжатых байт можно посмотреть в
+    ``user.decompress_handler.stats``. Отключается через ``compression=False``.
+
+    По умолчанию ошибки сервера сразу выкидываются как исключения. Если
+    передать в ``retry_policy`` объект :class:`~tabun_api.retry.RetryPolicy`,
+    то идемпотентные GET-запросы при ошибках 502–504 и сетевых ошибках будут
+    повторяться с нарастающими паузами, а с ``circuit_breaker`` при лежащем
+    сервере запросы будут сразу завершаться ошибкой. Отправка форм (комментарии,
+    посты, голоса и т.п.) автоматически никогда не повторяется.
+
+    Если несколько потоков одновременно запрашивают одну и ту же страницу,
+    можно передать в ``single_flight`` значение ``True`` или объект
+    :class:`~tabun_api.transport.SingleFlight`, и тогда одинаковые GET-запросы
+    через :func:`~tabun_api.User.urlread` и :func:`~tabun_api.User.read_page`
+    (а также вызовы ``get_post``, ``get_blog`` и ``get_profile``) будут
+    выполняться один раз, а все потоки получат общий результат. Учтите, что
+    распарсенный объект в этом случае тоже общий.
+
+    Страницы, которые часто перечитываются, можно кэшировать, передав
+    в ``response_cache`` объект :class:`~tabun_api.cache.ResponseCache`
+    (со своими временем жизни страниц, ограничением размера и, по желанию,
+    каталогом для хранения на диске). Кэш используется прозрачно для
+    всех методов, скачивающих страницы через ``urlread`` или ``read_page``.
+
+    Если в ``comment_cache`` передан объект :class:`~tabun_api.cache.CommentCache`,
+    :func:`~tabun_api.User.get_comments` при повторном чтении страницы не парсит
+    заново комменты, код которых не изменился, а возвращает прошлые объекты.
+
+    При ``streaming=True`` методы ``get_posts``, ``get_comments`` и
+    ``get_activity`` парсят страницу по кусочкам (по ``stream_chunk_size``
+    байт) прямо во время её скачивания (см.
+    :class:`~tabun_api.utils.StreamingFragmentParser`), так что время ожидания
+    сети и время парсинга не складываются. Если включены ``single_flight``
+    или ``response_cache``, страница всё равно скачивается целиком.
+
+    При ``early_close=True`` методы, парсящие страницы (``get_posts``,
+    ``get_post``, ``get_comments``, ``get_profile``, ``get_activity`` и т.п.),
+    перестают читать ответ и закрывают соединение, как только получен конец
+    основного содержимого страницы (``content_end``, то есть
+    ``<!-- /content -->``): подвал, а на некоторых страницах и сайдбар, не
+    скачиваются. Шапка с информацией о пользователе идёт раньше содержимого,
+    так что контекст (см. :func:`~tabun_api.User.get_main_context`) не
+    страдает. С ``response_cache`` страницы всё равно скачиваются целиком,
+    чтобы в кэш не попадали обрезанные.
+
+    Паузы между запросами соблюдаются ограничителем из поля ``limiter``
+    (см. :mod:`tabun_api.ratelimit`). По умолчанию это
+    :class:`~tabun_api.ratelimit.IntervalLimiter`, выдерживающий паузу
+    ``query_interval`` секунд между любыми запросами. Вместо него в ``limiter``
+    можно передать, например, :class:`~tabun_api.ratelimit.TokenBucketLimiter`
+    с отдельными лимитами для страниц, ajax-запросов и загрузок; один
+    ограничитель можно использовать в нескольких объектах ``User``, чтобы они
+    делили общий лимит. Присваивание ``query_interval`` возвращает
+    ограничитель по умолчанию.
+
+    Объект ``User`` можно использовать из нескольких потоков одновременно.
+    Аргумент ``max_in_flight`` задаёт, сколько запросов этого объекта могут
+    одновременно ждать ответа сервера (по умолчанию 1, как и раньше; None —
+    без ограничений). Обновление ``security_ls_key``, ``extra_cookies``,
+    ``talk_unread`` и прочих полей с данными сессии защищено блокировкой
+    ``lock``; если меняете их сами при работающих потоках, берите её тоже.
+
     У класса также есть следующие поля:
 
     * ``username`` — имя пользователя или None
@@ -128,6 +250,8 @@ class User(object):
     * ``skill`` — силушка (после ``update_userinfo``)
     * ``rating`` — кармушка (после ``update_userinfo``)
     * ``timeout`` — таймаут ожидания ответа от сервера (для функции ``urlopen``, по умолчанию 20)
+    * ``query_interval`` — пауза между запросами в секундах (по умолчанию 0)
+    * ``limiter`` — ограничитель частоты запросов
     * ``session_id``, ``security_ls_key``, ``key`` — ну вы поняли
     * ``session_cookie_name`` — название печеньки, в которую положить ``session_id``
       (по умолчанию TABUNSESSIONID)
@@ -141,7 +265,7 @@ class User(object):
     talk_unread = 0
     skill = None
     rating = None
-    query_interval = 0
+    limiter = None
     proxy = None
     http_host = None
     override_headers = {}
@@ -150,6 +274,16 @@ class User(object):
     noredir = None
     opener_nossl = None
     noredir_nossl = None
+    connection_pool = None
+    decompress_handler = None
+    retry_policy = None
+    single_flight = None
+    response_cache = None
+    comment_cache = None
+    streaming = False
+    stream_chunk_size = 16 * 1024
+    early_close = False
+    content_end = b'<!-- /content -->'
 
     def __init__(
         self,
@@ -166,6 +300,16 @@ class User(object):
         override_headers=None,
         extra_cookies=None,
         phpsessid=None,
+        connection_pool=None,
+        limiter=None,
+        max_in_flight=1,
+        single_flight=None,
+        response_cache=None,
+        comment_cache=None,
+        compression=True,
+        retry_policy=None,
+        streaming=False,
+        early_close=False,
     ):
         if phpsessid is not None:
             warnings.warn('phpsessid is deprecated; use session_id instead of it', FutureWarning, stacklevel=2)
@@ -189,13 +333,28 @@ class User(object):
         self.avoid_cf = bool(avoid_cf)
 
         self.jd = JSONDecoder()
-        self.lock = threading.Lock()
-        self.wait_lock = threading.Lock()
-
-        self.configure_opener(proxy, ssl_params)
+        # Защищает данные сессии; сетевые запросы под ней не выполняются
+        self.lock = threading.RLock()
+        self.max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+        if single_flight is True:
+            single_flight = SingleFlight()
+        elif single_flight is False:
+            single_flight = None
+        self.single_flight = single_flight
+        self.response_cache = response_cache
+        self.comment_cache = comment_cache
+        self.retry_policy = retry_policy
+        self.streaming = bool(streaming)
+        self.early_close = bool(early_close)
+
+        own_limiter = limiter is None
+        self.limiter = limiter if limiter is not None else IntervalLimiter()
+
+        self.configure_opener(proxy, ssl_params, connection_pool, compression)
 
         # init
-        self.last_query_time = 0
         self.talk_unread = 0
 
         if session_id:
@@ -230,9 +389,31 @@ class User(object):
             self.login(login, passwd)
 
         # reset after urlopen
-        self.last_query_time = 0
+        # (общий с другими объектами ограничитель не трогаем)
+        if own_limiter:
+            self.limiter.reset()
         self.talk_unread = 0
 
+    @property
+    def query_interval(self):
+        return getattr(self.limiter, 'interval', 0)
+
+    @query_interval.setter
+    def query_interval(self, value):
+        if isinstance(self.limiter, IntervalLimiter):
+            self.limiter.interval = value
+        else:
+            self.limiter = IntervalLimiter(value)
+
+    @property
+    def last_query_time(self):
+        return getattr(self.limiter, 'last_query_time', 0)
+
+    @last_query_time.setter
+    def last_query_time(self, value):
+        if isinstance(self.limiter, IntervalLimiter):
+            self.limiter.last_query_time = value
+
     @property
     def phpsessid(self):
         warnings.warn('phpsessid is deprecated; use session_id instead of it', FutureWarning, stacklevel=2)
@@ -263,10 +444,22 @@ class User(object):
             result = result.encode('utf-8')
         return result
 
-    def configure_opener(self, proxy=None, ssl_params=None):
+    def configure_opener(self, proxy=None, ssl_params=None, connection_pool=None, compression=True):
         ssl_params = ssl_params or {}
         handlers = []
 
+        # Сжатие ответов; обработчик общий для всех openers, чтобы считать общую статистику
+        if compression:
+            self.decompress_handler = transport.DecompressHandler()
+            handlers.append(self.decompress_handler)
+        else:
+            self.decompress_handler = None
+
+        if connection_pool is True:
+            connection_pool = ConnectionPool()
+        elif connection_pool is False:
+            connection_pool = None
+
         if proxy is None:
             proxy = os.getenv('TABUN_API_PROXY')
 
@@ -277,6 +470,10 @@ class User(object):
                 proxy = text(proxy).split(',')
             proxy = '{0}://{1}:{2}'.format(*proxy)
 
+        if proxy and connection_pool is not None:
+            # KeepAliveHandler открывает соединения сам, мимо SocksiPyHandler
+            raise ValueError('proxy and connection_pool cannot be used together')
+
         if proxy:
             # FIXME: а тут настройки SSL игнорируются
             # https://github.com/Anorov/PySocks/issues/36
@@ -289,15 +486,25 @@ class User(object):
             handlers.append(SocksiPyHandler(**utils.build_proxy_params(proxy)))
             self.proxy = proxy
 
-        self.opener = urequest.build_opener(*handlers)
-        self.noredir = urequest.build_opener(*(handlers + [NoRedirect]))
+        # KeepAliveHandler заменяет стандартные HTTPHandler и HTTPSHandler
+        self.connection_pool = connection_pool
+        if self.connection_pool is not None:
+            pool_handlers = [transport.KeepAliveHandler(self.connection_pool)]
+        else:
+            pool_handlers = []
+
+        self.opener = urequest.build_opener(*handlers + pool_handlers)
+        self.noredir = urequest.build_opener(*(handlers + pool_handlers + [NoRedirect]))
 
         # Если просят пропускать проверку SSL-сертификата сервера
         if ssl_params.get('verify_mode') in ('skip_all', 'skip_current_host'):
             ctx_sv = ssl.create_default_context()
             ctx_sv.check_hostname = False
             ctx_sv.verify_mode = ssl.CERT_NONE
-            h_sv = urequest.HTTPSHandler(context=ctx_sv)
+            if self.connection_pool is not None:
+                h_sv = transport.KeepAliveHandler(self.connection_pool, context=ctx_sv)
+            else:
+                h_sv = urequest.HTTPSHandler(context=ctx_sv)
 
             self.opener_nossl = urequest.build_opener(*handlers + [h_sv])
             self.noredir_nossl = urequest.build_opener(*handlers + [h_sv, NoRedirect])
@@ -309,23 +516,23 @@ class User(object):
         if pos > 0:
             ls_key = raw_data[pos:]
             ls_key = ls_key[ls_key.find(b"'") + 1:]
-            self.security_ls_key = ls_key[:ls_key.find(b"'")].decode('utf-8', 'replace')
+            with self.lock:
+                self.security_ls_key = ls_key[:ls_key.find(b"'")].decode('utf-8', 'replace')
 
     def update_userinfo(self, raw_data):
         """Парсит security_ls_key, имя пользователя, рейтинг и число непрочитанных сообщений
         с переданного кода страницы и записывает в объект.
         Возвращает имя пользователя или None при его отсутствии.
         """
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         self.update_security_ls_key(raw_data)
 
         userinfo = utils.find_substring(raw_data, b'<div class="dropdown-user"', b"</header>", with_end=False)
         if not userinfo:
             auth_panel = utils.find_substring(raw_data, b'<ul class="auth"', b'</header>', with_end=False)
             if auth_panel and 'Войти'.encode('utf-8') in auth_panel:
-                self.username = None
-                self.talk_unread = 0
-                self.skill = None
-                self.rating = None
+                self._set_userinfo(None)
             else:
                 utils.logger.warning('update_userinfo received unknown data')
             return None
@@ -333,49 +540,49 @@ class User(object):
         node = utils.parse_html_fragment(userinfo)[0]
         dd_user = node.xpath('//*[@id="dropdown-user"]')
         if not dd_user:
-            self.username = None
-            self.talk_unread = 0
-            self.skill = None
-            self.rating = None
-            return None
+            return self._set_userinfo(None)
         dd_user = dd_user[0]
 
         username = dd_user.xpath('a[@class="username"][1]/text()')
-        if username and username[0]:
-            self.username = username[0]
-        else:
-            self.username = None
-            self.talk_unread = 0
-            self.skill = None
-            self.rating = None
-            return None
+        if not username or not username[0]:
+            return self._set_userinfo(None)
+        username = username[0]
 
         talk_count = dd_user.xpath('.//*[@class="item-messages"]/*[@class="new-messages"]/text()')
         if not talk_count:
-            self.talk_unread = 0
+            talk_unread = 0
         else:
-            self.talk_unread = int(talk_count[0].strip().lstrip("+"))
+            talk_unread = int(talk_count[0].strip().lstrip("+"))
 
         strength = dd_user.xpath('.//*[@class="strength"]/text()')
         if not strength:
             # На новом Табуне (2024-06) сила скрыта
-            self.skill = 0.0
+            skill = 0.0
         else:
-            self.skill = utils.parse_fancy_float(strength[0])
+            skill = utils.parse_fancy_float(strength[0])
 
         rating_vote_count = dd_user.xpath('.//*[@class="vote-count"]/text()')
         if rating_vote_count:
             # Новый Табун (2025-10)
-            self.rating = utils.parse_fancy_float(rating_vote_count[0])
+            rating = utils.parse_fancy_float(rating_vote_count[0])
         else:
             # Старый Табун
             rating = dd_user.xpath('.//*[starts-with(@class, "rating")]/text()')
             if not rating:
-                self.rating = 0.0
+                rating = 0.0
             else:
-                self.rating = utils.parse_fancy_float(rating[0])
+                rating = utils.parse_fancy_float(rating[0])
+
+        return self._set_userinfo(username, talk_unread, skill, rating)
 
-        return self.username
+    def _set_userinfo(self, username, talk_unread=0, skill=None, rating=None):
+        # Записываем всё разом, чтобы другие потоки не видели половину обновления
+        with self.lock:
+            self.username = username
+            self.talk_unread = talk_unread
+            self.skill = skill
+            self.rating = rating
+        return username
 
     def login(self, login, password, return_path=None, remember=True):
         """Логинится и записывает печеньку key в случае успеха. Параметр return_path нафиг не нужен, remember - галочка «Запомнить меня»."""
@@ -399,11 +606,12 @@ class User(object):
         data = self.jd.decode(data.decode('utf-8'))
         if data.get('bStateError'):
             raise TabunResultError(data.get("sMsg", ""))
-        self.username = login
 
         cookies = utils.get_cookies_dict(resp.headers)
-        if 'key' in cookies:
-            self.key = cookies.get('key')
+        with self.lock:
+            self.username = login
+            if 'key' in cookies:
+                self.key = cookies.get('key')
 
     def check_login(self):
         """Генерирует исключение, если нет ``session_id`` или ``security_ls_key``."""
@@ -418,22 +626,32 @@ class User(object):
             {
                 'http_host': 'https://tabun.everypony.ru',
                 'url': 'https://tabun.everypony.ru/blog/2.html',
-                'username': 'Orhideous'
+                'username': 'Orhideous',
+                'layout': 'new'
             }
 
+        ``layout`` — вёрстка страницы, определённая :func:`~tabun_api.utils.detect_layout`;
+        парсеры постов и комментов берут её из контекста.
+
         :param raw_data: исходный код страницы
-        :type raw_data: bytes
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
         :param url: переопределение URL контекста при необходимости
         :type url: строка или None
         :rtype: dict
         """
 
+        if isinstance(raw_data, PageDocument):
+            if url is None:
+                return raw_data.context
+            raw_data = raw_data.raw_data
+
         if url and url.startswith('/'):
             url = self.http_host + url
         context = {
             'http_host': self.http_host,
             'url': url,
             'username': None,
+            'layout': utils.detect_layout(raw_data),
         }
 
         userinfo = utils.find_substring(raw_data, b'<div class="dropdown-user"', b"</header>", with_end=False)
@@ -474,15 +692,17 @@ class User(object):
         if headers:
             request_headers.update({k.title(): v for k, v in headers.items()})
 
-        if with_cookies and self.session_id:
-            cookiedict = {
-                self.session_cookie_name: self.session_id,
-                'key': self.key,
-                'LIVESTREET_SECURITY_KEY': self.security_ls_key,
-            }
-        else:
-            cookiedict = {}
-        cookiedict.update(self.extra_cookies)
+        # Снимок печенек под блокировкой: другой поток может как раз их обновлять
+        with self.lock:
+            if with_cookies and self.session_id:
+                cookiedict = {
+                    self.session_cookie_name: self.session_id,
+                    'key': self.key,
+                    'LIVESTREET_SECURITY_KEY': self.security_ls_key,
+                }
+            else:
+                cookiedict = {}
+            cookiedict.update(self.extra_cookies)
         cookie = '; '.join('{}={}'.format(k, v) for k, v in cookiedict.items())
         if cookie:
             request_headers['Cookie'] = cookie
@@ -497,10 +717,11 @@ class User(object):
         return url
 
     def _netwrap(self, func, *args, **kwargs):
-        lock = kwargs.pop('_lock', False)
+        # _lock — ограничивает число одновременных запросов значением max_in_flight
+        lock = kwargs.pop('_lock', False) and self._in_flight
         try:
             if lock:
-                with self.lock:
+                with lock:
                     return func(*args, **kwargs)
             else:
                 return func(*args, **kwargs)
@@ -528,53 +749,44 @@ class User(object):
         """Отправляет запрос (строку со ссылкой или объект ``Request``).
         Возвращает результат вызова ``urllib.urlopen`` (объект ``urllib.addinfourl``).
         Используется в методе ``urlopen``.
-        Если установлен ``query_interval``, то метод может сделать паузу перед запросом
-        для соблюдения интервала. Таймаут на эту паузу не влияет.
+        Перед запросом метод может сделать паузу, если этого требует ограничитель
+        ``limiter`` (например, для соблюдения ``query_interval``). Таймаут на эту
+        паузу не влияет. Если задан ``retry_policy``, идемпотентные запросы
+        при временных ошибках повторяются.
         """
 
-        if self.query_interval <= 0:
-            nowait = True
+        url = request.get_full_url()
+        if isinstance(url, binary):
+            url = url.decode('utf-8')
+        kind = ratelimit.guess_request_kind(request.get_method(), url)
 
-        # Выстраиваем «очередь» запросов с помощью блокировки;
-        # каждый из запросов в этой блокировке поспит query_interval секунд
-        if not nowait:
-            self.wait_lock.acquire()
+        if timeout is None:
+            timeout = self.timeout
 
-        try:
-            # Если последний запрос был недавно, спим
-            sleeptime = 0
-            if not nowait:
-                sleeptime = self.last_query_time - time.time() + self.query_interval
-                if sleeptime > 0:
-                    time.sleep(sleeptime)
-
-            # Записываем время запроса перед отправкой, а не после, для компенсации сетевых задержек
-            # А для компенсации локальных задержек время считаем сами вместо time.time()
-            self.last_query_time = time.time() if sleeptime <= 0 else (self.last_query_time + self.query_interval)
-
-            # И уже теперь готовим и отправляем запрос
-            if timeout is None:
-                timeout = self.timeout
-
-            url = request.get_full_url()
-            if isinstance(url, binary):
-                url = url.decode('utf-8')
-
-            opener = self.opener if redir else self.noredir
-
-            # Иногда бывает надо пропускать проверку SSL-сертификата
-            if self.opener_nossl and self.noredir_nossl:
-                if self.ssl_params.get('verify_mode') == 'skip_all':
+        opener = self.opener if redir else self.noredir
+
+        # Иногда бывает надо пропускать проверку SSL-сертификата
+        if self.opener_nossl and self.noredir_nossl:
+            if self.ssl_params.get('verify_mode') == 'skip_all':
+                opener = self.opener_nossl if redir else self.noredir_nossl
+            elif self.ssl_params.get('verify_mode') == 'skip_current_host':
+                if url == self.http_host or url.startswith(self.http_host + '/'):
                     opener = self.opener_nossl if redir else self.noredir_nossl
-                elif self.ssl_params.get('verify_mode') == 'skip_current_host':
-                    if url == self.http_host or url.startswith(self.http_host + '/'):
-                        opener = self.opener_nossl if redir else self.noredir_nossl
 
+        def send():
+            # Если последний запрос был недавно, ограничитель поспит
+            self.limiter.acquire(kind, nowait)
             return self._netwrap(opener.open, request, timeout=timeout, _lock=True)
 
-        finally:
-            if not nowait:
-                self.wait_lock.release()
+        if self.retry_policy is None:
+            return send()
+        return self.retry_policy.call(request, send, self.sleep_func, self._can_retry)
+
+    def _can_retry(self, exc):
+        # Задачку CloudFlare решает urlopen, повторять запрос бесполезно
+        if self.avoid_cf and exc.code == 503 and isinstance(exc.exc, urequest.HTTPError):
+            return not exc.exc.headers.get('CF-RAY')
+        return True
 
     def start_cf_avoiding(self, resp):
         import js2py
@@ -582,7 +794,8 @@ class User(object):
         data = self._netwrap(resp.read)
 
         # Загружаем печеньки CloudFlare
-        self.extra_cookies.update(utils.get_cookies_dict(resp.headers))
+        with self.lock:
+            self.extra_cookies.update(utils.get_cookies_dict(resp.headers))
 
         # Парсим форму, которую будем отправлять через 5 секунд
         form = utils.find_substring(
@@ -654,7 +867,8 @@ class User(object):
                 raise
 
         # В ответе CloudFlare просит поставить ещё печенек
-        self.extra_cookies.update(utils.get_cookies_dict(resp2.headers))
+        with self.lock:
+            self.extra_cookies.update(utils.get_cookies_dict(resp2.headers))
 
         return resp2.code // 100 == 3
 
@@ -663,7 +877,8 @@ class User(object):
         """Отправляет HTTP-запрос и возвращает результат вызова ``urllib.urlopen`` (объект ``addinfourl``).
 
         Во избежание случайной DoS-атаки между несколькими запросами подряд имеется пауза
-        в ``user.query_interval`` секунд (по умолчанию 0; отключается через ``nowait=True``).
+        в ``user.query_interval`` секунд (по умолчанию 0; отключается через ``nowait=True``)
+        или другие ограничения, заданные в ``user.limiter``.
 
         :param url: ссылка, на которую отправляется запрос, или сам объект ``Request``
         :type url: строка или Request
@@ -692,16 +907,210 @@ class User(object):
                 # Обход DDoS Protection от CloudFlare
                 self.start_cf_avoiding(exc.exc)
 
-    def urlread(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None):
+    def urlread(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None, until=None):
         """Как ``return self.urlopen(*args, **kwargs).read()``, но с перехватом
         исключений, возникших в процессе чтения (см. :func:`~tabun_api.User.saferead`).
         """
 
+        return self.read_page(url, data, headers, redir, nowait, with_cookies, timeout, avoid_cf, until)[1]
+
+    def read_page(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None, until=None):
+        """Как :func:`~tabun_api.User.urlread`, но возвращает кортеж из итоговой
+        ссылки (после перенаправлений) и содержимого страницы. Итоговая ссылка
+        нужна для парсинга комментариев и профилей через ``raw_data``.
+
+        GET-запросы без дополнительных заголовков могут браться из кэша
+        ``response_cache``, а если включен ``single_flight``, одинаковые
+        одновременные такие запросы объединяются в один.
+
+        Если включен ``early_close`` и указан ``until`` (bytes), то чтение
+        ответа прекращается, как только в нём встретится ``until``; страница
+        при этом будет обрезана где-то после него.
+        """
+
+        if not self.early_close or self.response_cache is not None:
+            until = None
+
+        if (
+            (self.single_flight is None and self.response_cache is None)
+            or data is not None or headers or not isinstance(url, text_types)
+        ):
+            return self._fetch_page(url, data, headers, redir, nowait, with_cookies, timeout, avoid_cf, until)[:2]
+
+        full_url = self.http_host + url if url.startswith('/') else url
+        identity = self.get_session_identity() if with_cookies else None
+
+        def fetch(validators=None):
+            return self._fetch_page(url, None, validators or None, redir, nowait, with_cookies, timeout, avoid_cf, until)
+
+        def read():
+            if self.response_cache is None:
+                return fetch()[:2]
+            cache_key = self.response_cache.make_key(identity, full_url, redir)
+            return self.response_cache.fetch(cache_key, full_url, fetch)
+
+        if self.single_flight is None:
+            return read()
+        key = ('read_page', identity, full_url, bool(redir), until)
+        return self.single_flight.do(key, read, size_func=lambda x: len(x[1]))
+
+    def _fetch_page(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None, until=None):
+        # Возвращает (итоговая ссылка, содержимое, заголовки ответа, код ответа)
         resp = self.urlopen(url, data, headers, redir, nowait, with_cookies, timeout, avoid_cf)
+        if until is None:
+            return resp.url, self.saferead(resp), resp.headers, resp.code
+        return resp.url, self._read_until(resp, until), resp.headers, resp.code
+
+    def _read_until(self, resp, until=None, feed=None):
+        # Читает ответ кусками до конца или до until, скармливая куски в feed,
+        # после чего закрывает его (недочитанное соединение в пул не вернётся)
+        chunks = []
+        tail = b''
         try:
-            return self._netwrap(resp.read)
+            while True:
+                chunk = self._netwrap(resp.read, self.stream_chunk_size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if feed is not None:
+                    feed(chunk)
+                if until is not None:
+                    # until мог разрезаться между кусками
+                    window = tail + chunk
+                    if until in window:
+                        break
+                    tail = window[max(0, len(window) - len(until) + 1):]
         finally:
             resp.close()
+        return b''.join(chunks)
+
+    def _stream_page(self, url, parser_factory, until=None):
+        # Возвращает (итоговая ссылка, содержимое, результат парсинга или None).
+        # parser_factory(final_url) создаёт utils.StreamingFragmentParser
+        if not self.streaming or self.single_flight is not None or self.response_cache is not None:
+            url, raw_data = self.read_page(url, until=until)
+            return url, raw_data, None
+
+        if not self.early_close:
+            until = None
+        resp = self.urlopen(url)
+        try:
+            parser = parser_factory(resp.url)
+        except:
+            resp.close()
+            raise
+        raw_data = self._read_until(resp, until, parser.feed)
+        return resp.url, raw_data, parser.close()
+
+    def get_session_identity(self):
+        """Возвращает хэшируемый объект, различающийся для разных сессий
+        (с точностью до сайта и печенек сессии). Используется в ключах
+        ``single_flight`` и ``response_cache``.
+        """
+        with self.lock:
+            return (self.http_host, self.session_id, self.key)
+
+    def fetch_many(self, urls, kind='posts', workers=4, ordered=False):
+        """Скачивает и парсит много страниц одновременно в ``workers`` потоках.
+        Является генератором и выдаёт кортежи ``(url, result, exc)`` по мере
+        готовности (или в порядке ``urls`` при ``ordered=True``). ``url`` — ссылка
+        из списка ``urls``; ``result`` — результат парсинга или None, если
+        произошла ошибка; ``exc`` — исключение, возникшее при скачивании или
+        парсинге этой страницы (остальные страницы продолжат обрабатываться).
+
+        ``kind`` определяет парсер, которому передаётся скачанная страница:
+
+        * ``posts`` — :func:`~tabun_api.User.get_posts`
+        * ``comments`` — :func:`~tabun_api.User.get_comments`
+        * ``profile`` — :func:`~tabun_api.User.get_profile`
+        * ``blog`` — :func:`~tabun_api.User.get_blog`
+        * ``raw`` — без парсинга, ``result`` будет содержимым страницы (bytes)
+
+        Также можно передать свою функцию вида ``func(url, raw_data)``, где
+        ``url`` — итоговая ссылка после перенаправлений.
+
+        Паузы ``query_interval`` (и другие ограничения ``limiter``) соблюдаются
+        как обычно. Число одновременных запросов дополнительно ограничено
+        значением ``max_in_flight`` (см. конструктор), так что для реального
+        ускорения его стоит увеличить до ``workers``.
+
+        Если генератор закрыть, не дочитав, то новые страницы скачиваться
+        не будут, а уже начатые запросы завершатся в фоне.
+
+        :param urls: ссылки на страницы
+        :type urls: коллекция строк
+        :param kind: тип страниц или функция для их парсинга
+        :param int workers: число потоков
+        :param bool ordered: выдавать результаты в порядке ``urls``, а не по мере готовности
+        :rtype: генератор кортежей (строка, результат, исключение или None)
+        """
+
+        parsers = {
+            'posts': lambda url, raw_data: self.get_posts(url, raw_data=raw_data),
+            'comments': lambda url, raw_data: self.get_comments(url, raw_data=raw_data),
+            'profile': lambda url, raw_data: self.get_profile(url=url, raw_data=raw_data),
+            'blog': self._fetch_blog,
+            'raw': lambda url, raw_data: raw_data,
+        }
+        if callable(kind):
+            parser = kind
+        elif kind in parsers:
+            parser = parsers[kind]
+        else:
+            raise ValueError('Unknown kind: {!r}'.format(kind))
+        # Свои парсеры и raw могут нуждаться во всей странице
+        until = self.content_end if parser is not parsers['raw'] and not callable(kind) else None
+
+        urls = list(urls)
+        if not urls:
+            return
+
+        tasks = queue.Queue()
+        for i, url in enumerate(urls):
+            tasks.put((i, url))
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    i, url = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    final_url, raw_data = self.read_page(url, until=until)
+                    result = (url, parser(final_url, raw_data), None)
+                except Exception as exc:
+                    result = (url, None, exc)
+                results.put((i, result))
+
+        threads = []
+        for _ in range(max(1, min(workers, len(urls)))):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        try:
+            pending = {}
+            next_index = 0
+            for _ in range(len(urls)):
+                i, result = results.get()
+                if not ordered:
+                    yield result
+                    continue
+                pending[i] = result
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+        finally:
+            stop.set()
+
+    def _fetch_blog(self, url, raw_data):
+        blog = parse_blog_url(url)
+        if not blog:
+            raise ValueError('Invalid blog URL: {}'.format(url))
+        return self.get_blog(blog, raw_data=raw_data)
 
     def saferead(self, resp):
         """Вызывает функцию read у переданного объекта с перехватом ошибок
@@ -770,7 +1179,10 @@ class User(object):
         fields = dict(fields or ())
         fields['security_ls_key'] = self.security_ls_key
         data = self.send_form_and_read(url, fields or {}, files, headers=headers)
+        return self._decode_ajax_response(data, throw_if_error)
 
+    def _decode_ajax_response(self, data, throw_if_error=True):
+        # Разбор ответа на ajax-запрос; вынесено из ajax для tabun_api.aio
         if data.lstrip().startswith(b'<textarea>{'):
             # Вроде это какой-то костыль для старых браузеров
             data = utils.find_substring(data, b'>', b'</', extend=True, with_start=False, with_end=False)
@@ -1311,10 +1723,13 @@ class User(object):
         последней страницы. Номера могут повторяться, если так в коде страницы.
         Если пагинаций ноль или больше одного, возвращается ``(None, None)``.
 
-        :param bytes raw_data: код страницы
+        :param raw_data: код страницы
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
         :rtype: ``(int, list)``
         """
 
+        if isinstance(raw_data, PageDocument):
+            return raw_data.pagination
         assert isinstance(raw_data, binary)
         f1 = raw_data.find(b'<div class="pagination">')
         if f1 < 0:
@@ -1397,33 +1812,89 @@ class User(object):
         assert current_page is not None
         return current_page, pages
 
-    def get_posts(self, url="/index/newall/", raw_data=None):
+    def get_page_document(self, url):
+        """Скачивает страницу и возвращает её как :class:`~tabun_api.PageDocument`,
+        который можно передать в ``raw_data`` нескольких методов.
+
+        :param url: ссылка на страницу
+        :type url: строка
+        :rtype: :class:`~tabun_api.PageDocument`
+        """
+
+        url, raw_data = self.read_page(url, until=self.content_end)
+        return PageDocument(self, raw_data, url)
+
+    def get_posts(self, url="/index/newall/", raw_data=None, light=False, since_id=None, known_ids=None):
         """Возвращает список постов со страницы или RSS.
         Если постов нет — кидает исключение TabunError("No post").
 
         Сортирует в порядке, обратном порядку на странице (т.е. на странице новые
         посты вверху, а в возвращаемом списке новые посты в его конце).
 
+        При ``light=True`` достаются только заголовки постов (номер, автор, блог,
+        название, дата, теги, рейтинг, число комментов и т.п.), а ``body``
+        и ``raw_body`` остаются None; опросы и прикреплённые файлы тоже
+        не парсятся. Тексты постов при этом выкидываются ещё до построения
+        дерева, что заметно быстрее — удобно для тех, кто лишь ищет новые посты.
+        На RSS не влияет.
+
+        Если указан ``since_id`` или ``known_ids`` (коллекция id уже известных
+        постов), то возвращаются только посты до первого известного: с id больше
+        ``since_id`` и не из ``known_ids``. Считается, что новые посты на странице
+        идут первыми, поэтому первый известный пост и всё, что после него,
+        вырезается из кода страницы ещё до экранирования и парсинга. При
+        регулярной проверке ленты это сводит работу к поиску по байтам
+        и парсингу лишь нескольких новых постов. Поскольку старые по id посты
+        могут быть опубликованы позже новых, для ленты надёжнее ``known_ids``.
+
         :param url: ссылка на страницу, с которой достать посты
         :type url: строка
-        :param bytes raw_data: код страницы (чтобы не скачивать его по ссылке)
+        :param raw_data: код страницы (чтобы не скачивать его по ссылке)
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
+        :param bool light: не доставать тексты постов
+        :param int since_id: id последнего уже известного поста
+        :param known_ids: id уже известных постов
         :rtype: список объектов :class:`~tabun_api.Post`
         """
 
         if url.startswith('/'):
             url = self.http_host + url
 
-        if not raw_data:
-            resp = self.urlopen(url)
-            url = resp.url
-            raw_data = self.saferead(resp)
-            del resp
-        raw_data = utils.replace_cloudflare_emails(raw_data)
+        document = None
+        if isinstance(raw_data, PageDocument):
+            document = raw_data
+            url = document.url or url
+            raw_data = document.raw_data
+
+        is_known = utils.known_id_checker(since_id, known_ids)
+
+        fragments = None
+        parsed = {}  # {article: Post} — посты, распарсенные ещё во время скачивания
+        if not raw_data and is_known is not None:
+            # Известные посты выкидываются до парсинга, парсить по ходу скачивания нечего
+            url, raw_data = self.read_page(url, until=self.content_end)
+        elif not raw_data:
+            def parser_factory(final_url):
+                def on_article(item):
+                    parsed[item] = parse_post(item, layout=parser.layout, light=light)
+
+                parser = utils.StreamingFragmentParser(
+                    b"<article ", b"</article> <!-- /.topic -->", b"</article>", extend=True,
+                    preprocess=lambda x: utils.preprocess_page(
+                        x, not final_url.split('?', 1)[0].endswith('.html'), comments=False, light=light,
+                    ),
+                    on_element=on_article,
+                    tag='article',
+                )
+                return parser
+
+            url, raw_data, fragments = self._stream_page(url, parser_factory, until=self.content_end)
 
         posts = []
 
         f = raw_data.find(b"<rss")
         if f < 250 and f >= 0:
+            raw_data = utils.replace_cloudflare_emails(raw_data)
             node = utils.lxml.etree.fromstring(raw_data)  # pylint: disable=no-member
             channel = node.find("channel")
             if channel is None:
@@ -1434,30 +1905,57 @@ class User(object):
             # TODO: заюзать новое экранирование
             for item in items:
                 post = parse_rss_post(item, context={'http_host': self.http_host, 'username': self.username, 'url': url})
-                if post:
+                if post and (is_known is None or not is_known(post.post_id)):
                     posts.append(post)
 
             return posts
 
-        context = self.get_main_context(raw_data, url=url)
-
-        data = utils.find_substring(raw_data, b"<article ", b"</article> <!-- /.topic -->", extend=True)
-        if not data:
-            raise TabunError("No post")
-
-        can_be_short = not url.split('?', 1)[0].endswith('.html')
-        escaped_data = utils.escape_topic_contents(data, can_be_short)
-        # items = filter(lambda x: not isinstance(x, text_types) and x.tag == "article", utils.parse_html_fragment(escaped_data))
-        items = [x for x in utils.parse_html_fragment(escaped_data) if not isinstance(x, text_types) and x.tag == "article"]
+        if document is not None:
+            # Страница уже подготовлена и распарсена целиком
+            context = document.context
+            items = document.articles
+            if not items:
+                raise TabunError("No post")
+            if is_known is not None:
+                for i, item in enumerate(items):
+                    vote_elem = xpaths.post.vote_area(item)
+                    if vote_elem and is_known(int(vote_elem[0].get('id').rsplit('_', 1)[-1])):
+                        del items[i:]
+                        break
+        else:
+            raw_data = utils.replace_cloudflare_emails(raw_data)
+            context = self.get_main_context(raw_data, url=url)
+
+            if fragments is None:
+                data = utils.find_substring(raw_data, b"<article ", b"</article> <!-- /.topic -->", extend=True)
+                if not data:
+                    raise TabunError("No post")
+                if is_known is not None:
+                    data = utils.cut_known_items(data, b"<article ", b"</article>", utils.topic_id_b, is_known)
+
+                can_be_short = not url.split('?', 1)[0].endswith('.html')
+                if light:
+                    escaped_data = utils.preprocess_page(data, can_be_short, comments=False, light=True)
+                else:
+                    escaped_data = utils.escape_topic_contents(data, can_be_short)
+                fragments = utils.parse_html_fragment(escaped_data)
+            # items = filter(lambda x: not isinstance(x, text_types) and x.tag == "article", fragments)
+            items = [x for x in fragments if not isinstance(x, text_types) and x.tag == "article"]
         items.reverse()
 
         for item in items:
-            post = parse_post(item, context=context)
+            if item in parsed:
+                post = parsed[item]
+                if post:
+                    post.context = merge_context(context, post.context)
+            else:
+                post = parse_post(item, context=context, light=light)
             if post:
                 posts.append(post)
 
         return posts
 
+    @coalesced
     def get_post(self, post_id, blog=None, raw_data=None):
         """Возвращает пост по номеру.
 
@@ -1471,7 +1969,8 @@ class User(object):
         :param int post_id: ID скачиваемого поста
         :param blog: url-имя блога (опционально, для оптимизации)
         :type blog: строка
-        :param bytes raw_data: код страницы (чтобы не скачивать его)
+        :param raw_data: код страницы (чтобы не скачивать его)
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
         :rtype: :class:`~tabun_api.Post` или ``None``
         """
 
@@ -1481,14 +1980,13 @@ class User(object):
             url = "/blog/" + text(post_id) + ".html"
 
         if not raw_data:
-            resp = self.urlopen(url)
-            url = resp.url
-            raw_data = self.saferead(resp)
-            del resp
+            url, raw_data = self.read_page(url, until=self.content_end)
 
         posts = self.get_posts(url, raw_data=raw_data)
         if not posts:
             return
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
 
         if len(posts) != 1:
             raise TabunError('Many posts on page {}'.format(repr(url)))
@@ -1525,35 +2023,121 @@ class User(object):
 
         return post
 
-    def get_comments(self, url="/comments/", raw_data=None):
+    def get_comments(self, url="/comments/", raw_data=None, engine='tree', light=False, since_id=None, known_ids=None, via='page'):
         """Парсит комменты со страницы по указанной ссылке.
         Допустимы как страницы постов, так и страницы ленты комментов.
         Но из ленты комментов доступны не все данные ``context``.
 
+        При ``engine='iterparse'`` комменты парсятся по одному прямо по ходу
+        разбора страницы, а уже разобранные куски дерева сразу выкидываются,
+        так что на постах с тысячами комментов память не растёт вместе
+        с их числом. Результат тот же, что и при ``engine='tree'``
+        (по умолчанию), кроме порядка ключей в словаре.
+
+        Если передан :class:`~tabun_api.PageDocument`, комменты достаются из его
+        дерева, и ``engine`` ни на что не влияет.
+
+        При ``light=True`` тексты комментов не достаются (``body`` и ``raw_body``
+        остаются None) и выкидываются ещё до построения дерева; всё остальное
+        (автор, дата, рейтинг, родитель и т.п.) на месте.
+
+        Если указан ``since_id`` или ``known_ids`` (коллекция id уже известных
+        комментов), то возвращаются только комменты с id больше ``since_id``
+        и не из ``known_ids``. В ленте комментов, где новые идут первыми, первый
+        известный коммент и всё, что после него, вырезается из кода страницы
+        ещё до экранирования и парсинга; на странице поста известные комменты
+        просто не парсятся.
+
+        При ``via='ajax'`` комменты поста запрашиваются не со страницы, а через
+        ajaxresponsecomment (как в :func:`~tabun_api.User.get_comments_from`):
+        страница с постом, шапкой и сайдбаром не скачивается и не парсится,
+        а id родителей приходят прямо в ответе. Если так нельзя (ссылка не на
+        пост, гость, передан ``raw_data``, ошибка запроса), комменты достаются
+        со страницы как обычно. Путь, которым они получены, записывается
+        в контекст каждого коммента: ``via`` — ``ajax`` или ``page``.
+        ``engine`` и ``light`` в режиме ajax ни на что не влияют.
+
+        Если у пользователя есть ``comment_cache`` (см. :class:`~tabun_api.cache.CommentCache`),
+        не изменившиеся с прошлого чтения страницы комменты берутся из него
+        (кроме ``engine='iterparse'`` без :class:`~tabun_api.PageDocument`).
+        Возвращаются неглубокие копии закэшированных объектов, так что
+        комменты, полученные прошлыми вызовами, не меняются.
+
         :param url: ссылка на страницу, с которой достать комменты
         :type url: строка
-        :param bytes raw_data: код страницы (чтобы не скачивать его по ссылке)
+        :param raw_data: код страницы (чтобы не скачивать его по ссылке)
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
+        :param str engine: ``tree`` или ``iterparse``
+        :param bool light: не доставать тексты комментов
+        :param int since_id: id последнего уже известного коммента
+        :param known_ids: id уже известных комментов
+        :param str via: ``page`` или ``ajax``
         :rtype: dict {id: :class:`~tabun_api.Comment`, ...}
         """
 
-        if not raw_data:
-            resp = self.urlopen(url)
-            url = resp.url
-            raw_data = self.saferead(resp)
-            del resp
+        if engine not in ('tree', 'iterparse'):
+            raise ValueError('Unknown engine: {!r}'.format(engine))
+        if via not in ('page', 'ajax'):
+            raise ValueError('Unknown via: {!r}'.format(via))
+
+        if via == 'ajax':
+            comms = self._get_comments_ajax(url, since_id, known_ids) if not raw_data else None
+            if comms is None:
+                comms = self.get_comments(url, raw_data, engine, light, since_id, known_ids)
+                for c in comms.values():
+                    c.context['via'] = 'page'
+            return comms
+        is_known = utils.known_id_checker(since_id, known_ids)
+
+        document = None
+        if isinstance(raw_data, PageDocument):
+            document = raw_data
+            url = document.url or url
+            raw_data = document.raw_data
+        elif engine == 'iterparse':
+            return self._get_comments_iterparse(url, raw_data, light=light, is_known=is_known)
+
+        div = None
+        parsed = {}  # {section: Comment или None} — комменты, распарсенные ещё во время скачивания
+        if not raw_data and (is_known is not None or self.comment_cache is not None):
+            # Известные и закэшированные комменты не парсятся, парсить
+            # по ходу скачивания нечего
+            url, raw_data = self.read_page(url, until=self.content_end)
+        elif not raw_data:
+            def parser_factory(final_url):
+                blog, post_id = parse_post_url(final_url)
+
+                def on_section(sect):
+                    if 'comment' in sect.get('class', '').split():
+                        parsed[sect] = parse_comment(sect, post_id, blog, layout=parser.layout, light=light)
+
+                parser = utils.StreamingFragmentParser(
+                    b'<div class="comments', b'<!-- /content -->', b'</section>', extend=True, with_end=False,
+                    preprocess=lambda x: utils.preprocess_page(x, True, light=light),
+                    on_element=on_section,
+                    tag='section',
+                )
+                return parser
+
+            url, raw_data, div = self._stream_page(url, parser_factory, until=self.content_end)
         blog, post_id = parse_post_url(url)
 
-        data = utils.find_substring(raw_data, b'<div class="comments', b'<!-- /content -->', extend=True, with_end=False)
-        if not data:
-            f = raw_data.find(b'<div class="comments')
-            if raw_data.rstrip().endswith(b'<a href="') and f >= 0 and b'<li class="comment-link">' in raw_data[-100:]:
-                # После удаления блога с комментами ломается лента, обходим
-                data = raw_data[f:]
-            else:
-                return {}
-        data = utils.replace_cloudflare_emails(data)
-        escaped_data = utils.escape_comment_contents(utils.escape_topic_contents(data, True))
-        div = utils.parse_html_fragment(escaped_data)
+        if document is not None:
+            div = document.comments_node
+            div = [div] if div is not None else None
+        elif div is None:
+            data = utils.find_substring(raw_data, b'<div class="comments', b'<!-- /content -->', extend=True, with_end=False)
+            if not data:
+                f = raw_data.find(b'<div class="comments')
+                if raw_data.rstrip().endswith(b'<a href="') and f >= 0 and b'<li class="comment-link">' in raw_data[-100:]:
+                    # После удаления блога с комментами ломается лента, обходим
+                    data = raw_data[f:]
+                else:
+                    return {}
+            if is_known is not None and b'comment-wrapper' not in data:
+                # Лента комментов: новые идут первыми
+                data = utils.cut_known_items(data, b'<section ', b'</section>', utils.comment_id_b, is_known)
+            div = utils.parse_html_fragment(utils.preprocess_page(data, True, light=light))
         if not div:
             return {}
         div = div[0]
@@ -1570,29 +2154,152 @@ class User(object):
                 raw_comms.append(sect)
 
         comms = {}
-        context = self.get_main_context(raw_data, url=url)
+        context = document.context if document is not None else self.get_main_context(raw_data, url=url)
+
+        comment_cache = self.comment_cache
+        if comment_cache is not None:
+            cache_key = (post_id if post_id is not None else url, bool(light))
+            cached = comment_cache.get_post(cache_key)
+            fingerprints = utils.comment_fingerprints(raw_data)
+            new_cached = {}
+            hits = 0
 
         for sect in raw_comms:
-            c = parse_comment(sect, post_id, blog, context=context)
-            if c is not None:
-                # Нормальный комментарий
-                comms[c.comment_id] = c
+            if is_known_comment(sect, is_known):
+                continue
+
+            if comment_cache is not None:
+                comment_id = sect.get('data-id', '')
+                fingerprint = fingerprints.get(int(comment_id)) if comment_id.isdigit() else None
+                entry = cached.get(int(comment_id)) if fingerprint is not None else None
+                if entry is not None and entry[0] == fingerprint:
+                    # Коммент не изменился с прошлого раза; копия — чтобы
+                    # не менять объекты, возвращённые прошлыми вызовами
+                    c = copy.copy(entry[1])
+                    c.context = merge_context(context, entry[2])
+                    comms[c.comment_id] = c
+                    new_cached[c.comment_id] = entry
+                    hits += 1
+                    continue
+
+            if sect in parsed:
+                c = parsed[sect]
+                if c is not None:
+                    c.context = merge_context(context, c.context)
             else:
+                c = parse_comment(sect, post_id, blog, context=context, light=light)
+            if c is None:
                 # Удалённый или скрытый комментарий
-                if sect.get("id", "").find("comment_id_") == 0:
-                    c = parse_deleted_comment(sect, post_id, blog, context=context)
-                    if c is not None:
-                        comms[c.comment_id] = c
-                    else:
-                        utils.logger.warning('Cannot parse deleted comment %s (url: %s)', sect.get('id'), url)
-                else:
-                    # TODO: нужно ли на новом Табуне?
-                    tmp = sect.xpath('.//ul[@class="comment-info"]/li[starts-with(@id, "vote_area_comment")]')
-                    if tmp:
-                        utils.logger.warning('Unknown comment format %s, it can be comment from deleted blog; skipped (url: %s)', tmp[0].get('id'), url)
-                    else:
-                        utils.logger.warning('Unknown comment format %s (url: %s)', sect.get('id'), url)
+                c = parse_unusual_comment(sect, post_id, blog, context=context, url=url)
+            if c is not None:
+                comms[c.comment_id] = c
+                if comment_cache is not None and fingerprint is not None and c.comment_id == int(comment_id):
+                    item_context = dict((k, v) for k, v in c.context.items() if k not in context or context[k] != v)
+                    new_cached[c.comment_id] = (fingerprint, copy.copy(c), item_context)
+
+        if comment_cache is not None:
+            if is_known is not None:
+                # Известные вызывающему комменты не парсились, но из кэша
+                # их выкидывать незачем: они пригодятся при полном чтении
+                for comment_id, entry in cached.items():
+                    if comment_id not in new_cached and is_known(comment_id):
+                        new_cached[comment_id] = entry
+            comment_cache.set_post(cache_key, new_cached, hits=hits, misses=len(comms) - hits)
+
+        return comms
+
+    def _get_comments_ajax(self, url, since_id=None, known_ids=None):
+        # get_comments(via='ajax'): комменты поста через ajaxresponsecomment
+        # или None, если так их не получить и нужно парсить страницу;
+        # tabun_api.aio отличается только асинхронным get_comments_from
+        post_id = self._ajax_comments_post_id(url)
+        if post_id is None:
+            return None
+        try:
+            comms = self.get_comments_from(post_id, since_id or 0)
+        except TabunError as exc:
+            comms = exc
+        return self._ajax_comments_result(url, comms, since_id, known_ids)
+
+    def _ajax_comments_post_id(self, url):
+        # id поста, комменты которого можно запросить через ajax, или None
+        post_id = parse_post_url(url)[1]
+        return post_id if self.username else None
 
+    def _ajax_comments_result(self, url, comms, since_id=None, known_ids=None):
+        # Приводит ответ get_comments_from (или его исключение TabunError)
+        # к виду get_comments(via='ajax')
+        blog, post_id = parse_post_url(url)
+        if isinstance(comms, TabunError):
+            utils.logger.warning('Cannot get comments of post %d via ajax, parsing the page instead: %s', post_id, comms)
+            return None
+
+        is_known = utils.known_id_checker(since_id, known_ids)
+        result = {}
+        for comment_id, c in comms.items():
+            if is_known is not None and is_known(comment_id):
+                continue
+            if c.blog is None:
+                c.blog = blog
+            c.context['via'] = 'ajax'
+            result[comment_id] = c
+        return result
+
+    def _get_comments_iterparse(self, url, raw_data=None, light=False, is_known=None):
+        # get_comments(engine='iterparse'): страница скармливается
+        # utils.StreamingFragmentParser, который отдаёт каждый законченный
+        # section и div; комменты парсятся сразу, а обработанные элементы
+        # удаляются из дерева, так что целиком оно никогда не хранится
+        comms = {}
+        parsers = []
+
+        def parser_factory(final_url):
+            blog, post_id = parse_post_url(final_url)
+
+            def on_element(node):
+                if node.tag == 'section':
+                    if not is_comment_section(node):
+                        return
+                    if not is_known_comment(node, is_known):
+                        c = parse_comment(node, post_id, blog, layout=parser.layout, light=light)
+                        if c is None:
+                            c = parse_unusual_comment(node, post_id, blog, url=final_url)
+                        if c is not None:
+                            comms[c.comment_id] = c
+                elif 'comment-wrapper' not in node.get('class', '').split():
+                    return
+
+                # Коммент со всеми ответами разобран, он больше не нужен
+                node.clear()
+                parent = node.getparent()
+                while node.getprevious() is not None:
+                    del parent[0]
+
+            parser = utils.StreamingFragmentParser(
+                b'<div class="comments', b'<!-- /content -->', b'</section>', extend=True, with_end=False,
+                preprocess=lambda x: utils.preprocess_page(x, True, light=light),
+                on_element=on_element,
+                tag=('section', 'div'),
+            )
+            parsers.append(parser)
+            return parser
+
+        if not raw_data:
+            url, raw_data, _ = self._stream_page(url, parser_factory, until=self.content_end)
+
+        if not parsers:
+            parser = parser_factory(url)
+            for i in range(0, len(raw_data), self.stream_chunk_size):
+                parser.feed(raw_data[i:i + self.stream_chunk_size])
+            if parser.close() is None:
+                f = raw_data.find(b'<div class="comments')
+                if raw_data.rstrip().endswith(b'<a href="') and f >= 0 and b'<li class="comment-link">' in raw_data[-100:]:
+                    # После удаления блога с комментами ломается лента, обходим
+                    return self._get_comments_iterparse(url, raw_data + b'<!-- /content -->', light=light, is_known=is_known)
+
+        context = self.get_main_context(raw_data, url=url)
+        for c in comms.values():
+            c.context = merge_context(context, c.context)
         return comms
 
     def get_blogs_list(self, page=1, order_by="blog_rating", order_way="desc", url=None):
@@ -1614,7 +2321,7 @@ class User(object):
             url += "?order=" + text(order_by)
             url += "&order_way=" + text(order_way)
 
-        raw_data = self.urlread(url)
+        raw_data = self.urlread(url, until=self.content_end)
         data = utils.find_substring(raw_data, b'<table class="table table-blogs', b'</table>')
         node = utils.parse_html_fragment(data)
         if not node:
@@ -1628,41 +2335,40 @@ class User(object):
         blogs = []
 
         for tr in node.findall("tr"):
-            blog_name_node = tr.xpath('td[@class="cell-name"]/span[starts-with(@class, "blog-link-with-avatar")]')
-            if blog_name_node:
+            name_layout, blog_name_node = xpaths.select(xpaths.blogs_list, 'name_cell', tr, context['layout'])
+            if name_layout == 'new':
                 # Новый Табун (2026-03)
-                avatar_node = blog_name_node[0].xpath('./a[@class="avatar"]/img')
+                avatar_node = xpaths.blogs_list.new.avatar(blog_name_node[0])
                 if avatar_node:
                     avatar = avatar_node[0].get('src')
                 else:
                     avatar = None
 
-                a = blog_name_node[0].xpath('.//a[starts-with(@class, "blog-title-wrapper")]')
+                a = xpaths.blogs_list.new.link(blog_name_node[0])
                 link = a[0].get('href')
 
                 blog = link[:link.rfind('/')]
                 blog = blog[blog.rfind('/') + 1:]
 
                 name = a[0].find('span').text or ''
-                closed = bool(a[0].xpath('span[contains(@class, "blog-type-closed")]'))
+                closed = bool(xpaths.blogs_list.new.closed(a[0]))
 
-                creator_node = blog_name_node[0].xpath('.//span[@class="nickname"]')
+                creator_node = xpaths.blogs_list.new.creator(blog_name_node[0])
                 if creator_node:
                     creator = creator_node[0].text
                 else:
                     creator = None
 
-                cell_topics = tr.xpath('td[@class="cell-topics"]')[0]
+                cell_topics = xpaths.blogs_list.new.topics(tr)[0]
                 posts_count = int((cell_topics.text or '-1').strip())
 
             else:
                 # Старый Табун
                 avatar = None
 
-                p = tr.xpath('td[@class="cell-name"]/p')
-                if len(p) == 0:
+                if name_layout is None:
                     continue
-                p = p[0]
+                p = blog_name_node[0]
                 a = p.find("a")
 
                 link = a.get('href')
@@ -1673,13 +2379,13 @@ class User(object):
                 blog = blog[blog.rfind('/') + 1:]
 
                 name = text(a.text)
-                closed = bool(p.xpath('i[@class="icon-synio-topic-private"]'))
+                closed = bool(xpaths.blogs_list.old.closed(p))
 
-                creator = tr.xpath('td[@class="cell-name"]/span[@class="user-avatar"]/a')[-1].text
+                creator = xpaths.blogs_list.old.creator(tr)[-1].text
 
                 posts_count = -1
 
-            cell_readers = tr.xpath('td[@class="cell-readers"]')[0]
+            cell_readers = xpaths.blogs_list.readers(tr)[0]
             readers_vague = (cell_readers.text or '').strip()
             if readers_vague.isdigit():
                 readers = int(readers_vague)
@@ -1706,12 +2412,15 @@ class User(object):
 
         return blogs
 
+    @coalesced
     def get_blog(self, blog, raw_data=None):
         """Возвращает информацию о блоге. Функция не доделана."""
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         blog = text(blog)
         url = "/blog/" + text(blog) + "/"
         if not raw_data:
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
 
         for blog_top_end in (
             b'<div class="nav-menu-wrapper">',
@@ -1851,26 +2560,53 @@ class User(object):
             context=self.get_main_context(raw_data, url=url),
         )
 
-    def get_post_and_comments(self, post_id, blog=None, raw_data=None):
+    def get_post_and_comments(self, post_id, blog=None, raw_data=None, comments_via='page'):
         """Возвращает пост и словарь комментариев.
-        По сути просто вызывает метод :func:`~tabun_api.User.get_post` и :func:`~tabun_api.User.get_comments`.
+        По сути просто вызывает метод :func:`~tabun_api.User.get_post` и :func:`~tabun_api.User.get_comments`
+        на одном :class:`~tabun_api.PageDocument`, так что страница парсится один раз.
+
+        При ``comments_via='ajax'`` комменты запрашиваются через ajaxresponsecomment
+        (см. параметр ``via`` у :func:`~tabun_api.User.get_comments`), а со страницы
+        парсится только пост. Если передан ``raw_data``, комменты, как и там,
+        парсятся со страницы. Путь, которым получены комменты, записывается
+        в контекст поста: ``comments_via`` — ``ajax`` или ``page``.
 
         :param int post_id: ID скачиваемого поста
         :param blog: url-имя блога (опционально, для оптимизации)
-        :param bytes raw_data: код страницы (чтобы не скачивать его)
+        :param raw_data: код страницы (чтобы не скачивать его)
+        :type raw_data: bytes или :class:`~tabun_api.PageDocument`
+        :param str comments_via: ``page`` или ``ajax``
         :return: ``(Post, {id: Comment, ...})``
         :rtype: tuple
         """
 
+        if comments_via not in ('page', 'ajax'):
+            raise ValueError('Unknown comments_via: {!r}'.format(comments_via))
+
         post_id = int(post_id)
+        url = "/blog/" + ((text(blog) + "/") if blog else "") + text(post_id) + ".html"
+        # Как и в get_comments, с переданным кодом страницы ajax не используется
+        use_ajax = comments_via == 'ajax' and not raw_data
         if not raw_data:
-            resp = self.urlopen("/blog/" + ((text(blog) + "/") if blog else "") + text(post_id) + ".html")
-            url = resp.url
-            raw_data = self.saferead(resp)
-            del resp
+            url, raw_data = self.read_page(url, until=self.content_end)
+
+        if use_ajax:
+            # Ссылка после перенаправления содержит имя блога, нужное комментариям
+            comments = self._get_comments_ajax(url)
+            if comments is not None:
+                # Со страницы нужен только пост, комменты на ней не парсятся
+                post = self.get_post(post_id, blog, raw_data=raw_data)
+                if post is not None:
+                    post.context['comments_via'] = 'ajax'
+                return post, comments
+
+        if not isinstance(raw_data, PageDocument):
+            raw_data = PageDocument(self, raw_data, url)
 
         post = self.get_post(post_id, blog, raw_data=raw_data)
-        comments = self.get_comments(url=url, raw_data=raw_data)
+        comments = self.get_comments(url=url, raw_data=raw_data, via=comments_via)
+        if comments_via == 'ajax' and post is not None:
+            post.context['comments_via'] = 'page'
 
         return post, comments
 
@@ -1895,17 +2631,17 @@ class User(object):
 
         url = self.http_host + "/" + (typ if typ in ("blog", "talk") else "blog") + "/ajaxresponsecomment/"
 
-        try:
-            data = self.ajax(url, {'idCommentLast': comment_id, 'idTarget': target_id, 'typeTarget': 'topic'})
-        except TabunResultError as exc:
-            if exc.data and exc.data.get('sMsg') in (
-                "Истекло время для редактирование комментариев",
-                "Не хватает прав для редактирования коментариев",
-                "Запрещено редактировать, коментарии с ответами"
-            ):
-                data = exc.data
-            else:
-                raise
+        data = self.ajax(url, {'idCommentLast': comment_id, 'idTarget': target_id, 'typeTarget': 'topic'}, throw_if_error=False)
+        return self._parse_ajax_comments(data, target_id, typ, url)
+
+    def _parse_ajax_comments(self, data, target_id, typ='blog', url=None):
+        # Разбор ответа ajaxresponsecomment; вынесено из get_comments_from для tabun_api.aio
+        if data['bStateError'] and data.get('sMsg') not in (
+            "Истекло время для редактирование комментариев",
+            "Не хватает прав для редактирования коментариев",
+            "Запрещено редактировать, коментарии с ответами"
+        ):
+            raise TabunResultError(data['sMsg'], data=data)
 
         context = {
             'http_host': self.http_host,
@@ -1917,11 +2653,30 @@ class User(object):
 
         # (При отсутствии комментариев в comments почему-то возвращается список
         # вместо словаря, поэтому вручную конвертируем его в словарь)
-        raw_comments_dict = dict(data['comments'])
-        for comm in raw_comments_dict.values():
-            node = utils.parse_html_fragment(utils.escape_comment_contents(comm['html'].encode('utf-8')))
-            sect = node[0]
-            post_id = target_id if typ == 'blog' else None
+        raw_comments = list(dict(data['comments']).values())
+
+        # Все комменты склеиваются в один документ, каждый в своей обёртке,
+        # который экранируется и парсится за один раз, а потом снова делится
+        # на комменты по обёрткам
+        html = ''.join(
+            '<div data-ajax-comment="{}">{}</div>'.format(i, comm['html'])
+            for i, comm in enumerate(raw_comments)
+        )
+        sections = {}
+        for node in utils.parse_html_fragment(utils.escape_comment_contents(html.encode('utf-8'))):
+            if isinstance(node, text_types):
+                continue
+            for wrapper in node.iter('div'):
+                index = wrapper.get('data-ajax-comment')
+                if index is not None and len(wrapper) > 0:
+                    sections[int(index)] = wrapper[0]
+
+        post_id = target_id if typ == 'blog' else None
+        for i, comm in enumerate(raw_comments):
+            sect = sections.get(i)
+            if sect is None:
+                # Кривой html коммента поломал обёртки, парсим его отдельно
+                sect = utils.parse_html_fragment(utils.escape_comment_contents(comm['html'].encode('utf-8')))[0]
             parent_id = comm['pid']
 
             pcomm = parse_comment(sect, post_id, None, parent_id, context=context)
@@ -1997,23 +2752,26 @@ class User(object):
         node = node[0]
 
         items = []
+        layout = utils.detect_layout(data['sText'].encode('utf-8'))
+
+        items_layout, stream_items = xpaths.select(xpaths.stream_topics, 'items', node, layout)
 
         # Новый Табун (2026-03)
-        for item in node.xpath('.//div[@class="small-list-topic-entry"]'):
-            blog_a = item.xpath('.//a[contains(@class, "blog-title-wrapper")]')
-            topic_a = item.xpath('.//a[contains(@class, "topic-entry-title")]')[0]
-            comments_node = item.xpath('.//a[contains(@class, "topic-comments-counter")]')[0]
-            user_with_avatar = item.xpath('.//*[starts-with(@class, "user-with-avatar")]')[0]
+        for item in (stream_items if items_layout == 'new' else ()):
+            blog_a = xpaths.stream_topics.new.blog(item)
+            topic_a = xpaths.stream_topics.new.title(item)[0]
+            comments_node = xpaths.stream_topics.new.comments(item)[0]
+            user_with_avatar = xpaths.stream_topics.new.user_with_avatar(item)[0]
 
-            post_time_node = item.xpath('.//time[@class="topic-entry-date"]')[0]
+            post_time_node = xpaths.stream_topics.new.time(item)[0]
             utctime = utils.parse_datetime(post_time_node.get("datetime"))
             post_time = time.strptime(post_time_node.get("datetime")[:-6], "%Y-%m-%dT%H:%M:%S")
 
-            author = user_with_avatar.xpath('.//*[starts-with(@class, "nickname")]/text()')[0].strip()
+            author = xpaths.stream_topics.new.nickname(user_with_avatar)[0].strip()
             title = topic_a.text_content().strip()
             blog, post_id = parse_post_url(topic_a.get('href', ''))
             blog_name = blog_a[0].text_content() if blog_a else ''
-            private = bool(blog_a[0].xpath('.//span[contains(@class, "blog-type-closed")]')) if blog_a else False
+            private = bool(xpaths.stream_topics.new.blog_closed(blog_a[0])) if blog_a else False
             comments_count = int(comments_node.text_content())
             unread_comments_count = int((comments_node.get('data-new-comments-count') or '0').lstrip('+'))
 
@@ -2026,7 +2784,7 @@ class User(object):
             ))
 
         # Старый Табун
-        for item in node.xpath('./ul[@class="latest-list"]/li'):
+        for item in (stream_items if items_layout == 'old' else ()):
             p = item.find("p")
             a = p.find("a")
             blog_a = item.findall("a")[0]
@@ -2069,13 +2827,15 @@ class User(object):
         :rtype: список из :class:`~tabun_api.UserInfo`
         """
 
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         if not url:
             url = "/people/" + ("index/page" + text(page) + "/" if page > 1 else "")
             url += "?order=" + text(order_by)
             url += "&order_way=" + text(order_way)
 
         if not raw_data:
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
         data = utils.find_substring(raw_data, b'<table class="table table-users', b'</table>')
         if not data:
             return []
@@ -2162,6 +2922,7 @@ class User(object):
 
         return peoples
 
+    @coalesced
     def get_profile(self, username=None, url=None, raw_data=None):
         """Получает информацию об указанном пользователе.
 
@@ -2177,11 +2938,13 @@ class User(object):
         :rtype: :class:`~tabun_api.UserInfo`
         """
 
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         if not url:
             url = '/profile/' + urequest.quote(text(username).encode('utf-8')) + '/'
 
         if not raw_data:
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
 
         raw_data = utils.escape_profile_content(raw_data)
 
@@ -2197,24 +2960,24 @@ class User(object):
         context = self.get_main_context(raw_data, url=url)
 
         # Блок в самом верху всех страниц профиля
-        profile = node.xpath('div[@class="profile"]')[0]
+        profile = xpaths.profile.profile(node)[0]
 
-        userpic = node.xpath('.//img[@itemprop="photo"][1]')[0].get('src')
-        username = profile.xpath('.//h2[@itemprop="nickname"]/text()')[0]
-        realname = profile.xpath('.//p[@class="user-name"]/text()')
+        userpic = xpaths.profile.photo(node)[0].get('src')
+        username = xpaths.profile.username(profile)[0]
+        realname = xpaths.profile.realname(profile)
 
-        strength_elem = profile.xpath('.//div[@class="strength"]/div[1]/text()')
+        strength_elem = xpaths.profile.strength(profile)
         if strength_elem:
             skill = utils.parse_fancy_float(strength_elem[0])
         else:
             # На новом Табуне (2024-06) сила скрыта
             skill = 0.0
 
-        vote_area = profile.xpath('.//*[@class="vote-profile"]//*[starts-with(@id, "vote_area_user_")]')[0]
+        vote_area = xpaths.profile.vote_area(profile)[0]
         user_id = int(vote_area.get("id").rsplit("_")[-1])
 
-        rating = utils.parse_fancy_float(profile.xpath('.//*[@id="vote_total_user_{}"]/text()'.format(user_id))[0])
-        rating_vote_count_str = profile.xpath('.//*[@class="vote-profile"]//*[@class="vote-label"]')[0].text_content().strip()
+        rating = utils.parse_fancy_float(xpaths.profile.vote_total(profile, id='vote_total_user_{}'.format(user_id))[0])
+        rating_vote_count_str = xpaths.profile.vote_label(profile)[0].text_content().strip()
 
         # Вытаскиваем число из строки «Рейтинг (голосов: 777)»
         rating_vote_count_str = rating_vote_count_str.rsplit(":", 1)[-1].rstrip(")")
@@ -2233,21 +2996,21 @@ class User(object):
         description = None
         raw_description = None
 
-        profile_403 = node.xpath('div[@class="profile-403"]')
+        profile_403 = xpaths.profile.profile_403(node)
         if profile_403:
             profile_403 = profile_403[0]
-            profile_403_message = profile_403.xpath('.//h2/text()')[0].strip()
+            profile_403_message = xpaths.profile.profile_403_message(profile_403)[0].strip()
         else:
             profile_403 = None
             profile_403_message = None
 
-        about = node.xpath('.//div[contains(@class, "profile-info-about")]')
+        about = xpaths.profile.about(node)
         if about:
             if about[0].get('class').endswith(' text'):
                 # Новый Табун (2025-09)
                 description = about
             else:
-                description = about[0].xpath('div[@class="text"]')
+                description = xpaths.profile.about_text(about[0])
             if description and description[0].get('data-escaped') == '1':
                 raw_description = description[0].text
         else:
@@ -2270,14 +3033,8 @@ class User(object):
         private_profile_data = True
 
         # Блок с чуть более подробной информацией на /profile/xxx/ (личное и активность)
-        profile_left = node.xpath('div[@class="wrapper"]/div[@class="profile-left"]')
-        if profile_left:
-            # Старый Табун
-            profile_left = profile_left[0]
-            profile_items = profile_left.xpath('ul[@class="profile-dotted-list"]/li')
-        else:
-            # На новом Табуне информация не завёрнута в profile-left
-            profile_items = node.xpath('.//ul[@class="profile-dotted-list"]/li')
+        # (на старом Табуне она завёрнута в profile-left, на новом нет)
+        _, profile_items = xpaths.select(xpaths.profile, 'items', node, context['layout'])
 
         for ul in profile_items:
             name = ul.find('span').text.strip()
@@ -2334,7 +3091,7 @@ class User(object):
 
         # Блок с контактами
         contacts = []
-        for ul in node.xpath('.//ul[@class="profile-contact-list"]'):
+        for ul in xpaths.profile.contact_lists(node):
             for li in ul.findall('li'):
                 icon = li.find('i')
                 a = li.find('a')
@@ -2354,7 +3111,7 @@ class User(object):
         sidebar_html = utils.find_substring(raw_data, b'<aside id="sidebar"', b'</aside>')
         if sidebar_html:
             sidebar = utils.parse_html_fragment(sidebar_html)[0]
-            foto = sidebar.xpath('//img[@id="foto-img"]')
+            foto = xpaths.profile.foto(sidebar)
         else:
             utils.logger.warning('get_profile: sidebar not found')
             sidebar = None
@@ -2379,7 +3136,7 @@ class User(object):
         current_page = None
 
         # Получаем основные счётчики (публикации, избранные, друзья)
-        for li in sidebar.xpath('section/ul[@class="nav nav-profile"]/li') if sidebar is not None else []:
+        for li in xpaths.profile.nav_items(sidebar) if sidebar is not None else []:
             link = li.find('a').get('href', '')
             li_data = li.find('a').text.strip()
             value = utils.find_substring(li_data, ' (', ')', with_start=False, with_end=False)
@@ -2453,7 +3210,7 @@ class User(object):
                         counts['notes'] = tmp_notes
 
         # Заметка
-        note_elem = sidebar.xpath('//p[@id="usernote-note-text"]') if sidebar is not None else None
+        note_elem = xpaths.profile.note(sidebar) if sidebar is not None else None
         if note_elem:
             context['note'] = note_elem[0].text.strip() or None
             context['can_edit_note'] = True
@@ -2482,6 +3239,8 @@ class User(object):
         :param bytes raw_data: код страницы (чтобы не скачивать его по ссылке)
         """
 
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         if not self.username:
             raise TabunError('Not logged in')
 
@@ -2489,7 +3248,7 @@ class User(object):
             url = '/profile/' + urequest.quote(text(self.username).encode('utf-8')) + '/created/notes/page' + str(int(page)) + '/'
 
         if not raw_data:
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
 
         table = utils.find_substring(raw_data, b'<table class="table table-profile-notes"', b'</table>')
         if not table:
@@ -2716,6 +3475,8 @@ class User(object):
         :rtype: :class:`~tabun_api.types.EditablePost`
         """
 
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         if not raw_data:
             raw_data = self.urlread("/topic/edit/" + text(int(post_id)) + "/")
 
@@ -2770,6 +3531,8 @@ class User(object):
         :rtype: :class:`~tabun_api.types.EditableBlog`
         """
 
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         if not raw_data:
             raw_data = self.urlread("/blog/edit/" + text(int(blog_id)) + "/")
 
@@ -2948,10 +3711,12 @@ class User(object):
 
     def get_talk_list(self, page=1, raw_data=None):
         """Возвращает список объектов :class:`~tabun_api.TalkItem` с личными сообщениями."""
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         url = "/talk/inbox/page{}/".format(int(page))
         if not raw_data:
             self.check_login()
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
 
         raw_data = utils.replace_cloudflare_emails(raw_data)
         table = utils.find_substring(raw_data, b'<table ', b'</table>')
@@ -2974,10 +3739,12 @@ class User(object):
 
     def get_favourited_talk_list(self, page=1, raw_data=None):
         """Возвращает список объектов :class:`~tabun_api.TalkItem` с избранными личными сообщениями."""
+        if isinstance(raw_data, PageDocument):
+            raw_data = raw_data.raw_data
         url = "/talk/favourites/page{}/".format(int(page))
         if not raw_data:
             self.check_login()
-            raw_data = self.urlread(url)
+            raw_data = self.urlread(url, until=self.content_end)
 
         raw_data = utils.replace_cloudflare_emails(raw_data)
         table = utils.find_substring(raw_data, b'<table ', b'</table>')
@@ -3003,14 +3770,16 @@ class User(object):
         url = "/talk/read/" + text(int(talk_id)) + "/"
         if not raw_data:
             self.check_login()
-            raw_data = self.urlread(url)
-
-        data = utils.find_substring(raw_data, b"<article ", b"</article>", extend=True)
-        if not data:
+            raw_data = self.urlread(url, until=self.content_end)
+        if not isinstance(raw_data, PageDocument):
+            # Письмо и комменты к нему достаются из одного дерева
+            raw_data = PageDocument(self, raw_data, url, may_be_short=False)
+        document = raw_data
+
+        items = document.articles
+        if not items:
             return
-
-        data = utils.replace_cloudflare_emails(data)
-        item = utils.parse_html_fragment(utils.escape_topic_contents(data, False))[0]
+        item = items[0]
 
         header = item.find("header")
         title = header.find("h1").text
@@ -3039,9 +3808,9 @@ class User(object):
         utctime = utils.parse_datetime(date_node.get("datetime"))
         date = time.strptime(date_node.get("datetime")[:-6], "%Y-%m-%dT%H:%M:%S")  # legacy
 
-        comments = self.get_comments(url, raw_data=raw_data)
+        comments = self.get_comments(url, raw_data=document)
 
-        context = self.get_main_context(raw_data, url=url)
+        context = document.context
         context['favourited'] = bool(footer.xpath('ul/li[@class="topic-info-favourite"]/i[@class="favourite active"]'))
         context['last_is_incoming'] = None
         context['unread_comments_count'] = 0
@@ -3074,14 +3843,39 @@ class User(object):
         Возвращает кортеж из двух элементов: номер самого старого события
         в списке и собственно список последних событий.
         """
+        context = None
+        if isinstance(raw_data, PageDocument):
+            context = raw_data.context
+            raw_data = raw_data.raw_data
+        node = None
+        parsed = {}  # {li: ActivityItem} — события, распарсенные ещё во время скачивания
+        layout = None
         if not raw_data:
-            raw_data = self.urlread(url)
+            def parser_factory(final_url):
+                def on_li(li):
+                    if li.get('class', '').startswith('stream-item'):
+                        parsed[li] = parse_activity(li, layout=parser.layout)
+
+                parser = utils.StreamingFragmentParser(
+                    b'<div id="content"', b'<!-- /content', b'</li>', with_end=False,
+                    preprocess=utils.replace_cloudflare_emails,
+                    on_element=on_li,
+                    tag='li',
+                )
+                return parser
 
-        raw_data = utils.find_substring(raw_data, b'<div id="content"', b'<!-- /content', with_end=False)
-        if not raw_data:
-            return -1, []
-        raw_data = utils.replace_cloudflare_emails(raw_data)
-        node = utils.parse_html_fragment(raw_data)
+            url, raw_data, node = self._stream_page(url, parser_factory, until=self.content_end)
+
+        if context is None:
+            context = self.get_main_context(raw_data, url=url)
+
+        if node is None:
+            raw_data = utils.find_substring(raw_data, b'<div id="content"', b'<!-- /content', with_end=False)
+            if not raw_data:
+                return -1, []
+            raw_data = utils.replace_cloudflare_emails(raw_data)
+            layout = utils.detect_layout(raw_data)
+            node = utils.parse_html_fragment(raw_data)
         if not node:
             return -1, []
         node = node[0]
@@ -3103,8 +3897,9 @@ class User(object):
         for li in node.find('ul').findall('li'):
             if not li.get('class', '').startswith('stream-item'):
                 continue
-            item = parse_activity(li)
+            item = parsed[li] if li in parsed else parse_activity(li, layout=layout)
             if item:
+                item.context = dict(context)
                 items.append(item)
 
         if item:
@@ -3129,10 +3924,11 @@ class User(object):
 
         last_id = int(result.get('iStreamLastId', 0))
         item = None
+        layout = utils.detect_layout(result['result'].encode('utf-8'))
         for li in utils.parse_html_fragment(result['result']):
             if li.tag != 'li' or not li.get('class', '').startswith('stream-item'):
                 continue
-            item = parse_activity(li)
+            item = parse_activity(li, layout=layout)
             if item:
                 items.append(item)
 
@@ -3141,7 +3937,7 @@ class User(object):
         return last_id, items
 
 
-def parse_activity(item):
+def parse_activity(item, layout=None):
     classes = item.get('class').split()
 
     post_id = None
@@ -3153,41 +3949,41 @@ def parse_activity(item):
 
     if 'stream-item-type-add_topic' in classes:
         typ = ActivityItem.POST_ADD
-        href = item.xpath('a[2]')[0].get('href')
+        href = xpaths.activity.link(item)[0].get('href')
         blog, post_id = parse_post_url(href)
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-add_comment' in classes:
         typ = ActivityItem.COMMENT_ADD
-        href = item.xpath('a[2]')[0].get('href')
+        href = xpaths.activity.link(item)[0].get('href')
         blog, post_id = parse_post_url(href)
         comment_id = int(href[href.rfind("#comment") + 8:])
-        data = item.xpath('div/text()')
+        data = xpaths.activity.text(item)
         data = data[0] if data else None
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-add_blog' in classes:
         typ = ActivityItem.BLOG_ADD
-        href = item.xpath('a[2]')[0].get('href')[:-1]
+        href = xpaths.activity.link(item)[0].get('href')[:-1]
         blog = href[href.rfind('/') + 1:]
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-vote_topic' in classes:
         typ = ActivityItem.POST_VOTE
-        href = item.xpath('a[2]')[0].get('href')
+        href = xpaths.activity.link(item)[0].get('href')
         blog, post_id = parse_post_url(href)
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-vote_comment' in classes:
         typ = ActivityItem.COMMENT_VOTE
-        href = item.xpath('a[2]')[0].get('href')
+        href = xpaths.activity.link(item)[0].get('href')
         blog, post_id = parse_post_url(href)
         comment_id = int(href[href.rfind("#comment") + 8:])
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-vote_blog' in classes:
         typ = ActivityItem.BLOG_VOTE
-        href = item.xpath('a[2]')[0].get('href')[:-1]
+        href = xpaths.activity.link(item)[0].get('href')[:-1]
         if (href.endswith('/created/topics') or href.endswith('/created/topics/')) and '/profile/' in href:
             # Есть такой баг: можно оценивать личные блоги
             blog = None
@@ -3195,41 +3991,41 @@ def parse_activity(item):
             data = data[:data.find('/')]
         else:
             blog = href[href.rfind('/') + 1:]
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-vote_user' in classes:
         typ = ActivityItem.USER_VOTE
-        data = item.xpath('span/a[2]/text()')[0]
+        data = xpaths.activity.user_link_text(item)[0]
 
     elif 'stream-item-type-add_friend' in classes:
         typ = ActivityItem.FRIEND_ADD
-        data = item.xpath('span/a[2]/text()')[0]
+        data = xpaths.activity.user_link_text(item)[0]
 
     elif 'stream-item-type-join_blog' in classes:
         typ = ActivityItem.JOIN_BLOG
-        href = item.xpath('a[2]')[0].get('href')[:-1]
+        href = xpaths.activity.link(item)[0].get('href')[:-1]
         blog = href[href.rfind('/') + 1:]
-        title = item.xpath('a[2]')[0].text or ''
+        title = xpaths.activity.link(item)[0].text or ''
 
     elif 'stream-item-type-add_wall' in classes:
         typ = ActivityItem.WALL_ADD
-        data = item.xpath('span/a[2]/text()')[0]
+        data = xpaths.activity.user_link_text(item)[0]
         # TODO: comment content
 
     else:
         return
 
-    username = item.xpath('p[@class="info"]/a/strong/text()[1]')[0]
+    username = xpaths.activity.username(item)[0]
 
-    date_node = item.xpath('p[@class="info"]/time')
-    if date_node:
+    date_layout, date_node = xpaths.select(xpaths.activity, 'time', item, layout)
+    if date_layout == 'new':
         # Новый Табун
         date = date_node[0].get('datetime')
         utctime = utils.parse_datetime(date)
         date = time.strptime(date[:-6], "%Y-%m-%dT%H:%M:%S")
     else:
         # Старый Табун
-        date = item.xpath('p[@class="info"]/span[@class="date"]')[0].get('title')
+        date = date_node[0].get('title')
         if not date:
             return
         utctime = None
@@ -3237,8 +4033,10 @@ def parse_activity(item):
     return ActivityItem(typ, date, post_id, comment_id, blog, username, title, data, utctime=utctime)
 
 
-def parse_post(item, context=None):
+def parse_post(item, context=None, layout=None, light=False):
     # Парсинг поста. Не надо юзать эту функцию.
+    # layout — вёрстка страницы (utils.detect_layout), по умолчанию из контекста;
+    # при light=True тело, опрос и прикреплённые файлы не достаются
     header = item.find("header")
     if header is None:
         return None
@@ -3247,37 +4045,38 @@ def parse_post(item, context=None):
         return None
 
     # Достаём id поста из блока с рейтингом
-    vote_elem = header.xpath('.//*[@class="topic-info-vote"]//*[starts-with(@id, "vote_area_topic_")][1]')
+    vote_elem = xpaths.post.vote_area(header)
     if vote_elem:
         post_id = int(vote_elem[0].get('id').rsplit('_', 1)[-1])
     else:
         post_id = -1
 
     context = dict(context) if context else {}
+    if layout is None:
+        layout = context.get('layout')
 
-    draft = bool(header.xpath('.//*[@class="topic-draft"]')) or bool(title_elem.xpath('i[@class="icon-synio-topic-draft"]'))
+    draft = bool(xpaths.post.draft(header)) or bool(xpaths.post.draft_icon(title_elem))
 
-    author_elem = header.xpath('.//*[starts-with(@class, "user-with-avatar")]//*[starts-with(@class, "nickname")][1]')
-    if author_elem:
-        # Новый Табун (2025-11)
-        author = author_elem[0].text
-    else:
-        # Старый Табун
-        author_elem = header.xpath('.//a[@rel="author"][1]')
-        if not author_elem:
-            utils.logger.warning("Failed to parse author in post %d, please report to andreymal", post_id)
-            return None
-        author = author_elem[0].text
+    # Автор в новом Табуне (2025-11) или в старом
+    author_elem = xpaths.select(xpaths.post, 'author', header, layout)[1]
+    if not author_elem:
+        utils.logger.warning("Failed to parse author in post %d, please report to andreymal", post_id)
+        return None
+    author = author_elem[0].text
 
     # Достаём информацию о блоге из ссылки на блог
     blog_url = None
     blog_name = None
     private = False
 
-    blog_elem = header.xpath('.//a[contains(@class, "blog-title-wrapper")]')
-    user_secondary = header.xpath('.//span[contains(@class, "user-with-avatar")]/span[contains(@class, "secondary-line")]')
-    user_secondary_text = user_secondary[0].text_content() if user_secondary else ''
-    if blog_elem:
+    blog_layout, blog_elem = xpaths.select(xpaths.post, 'blog', header, layout)
+    user_secondary_text = ''
+    if blog_layout != 'new' and layout != 'old':
+        # На странице старой вёрстки user-with-avatar нет, незачем и искать
+        user_secondary = xpaths.post.new.user_secondary(header)
+        user_secondary_text = user_secondary[0].text_content() if user_secondary else ''
+
+    if blog_layout == 'new':
         # Новый Табун (2026-03)
         blog_link = blog_elem[0].get('href')
         if not blog_link:
@@ -3288,17 +4087,13 @@ def parse_post(item, context=None):
             blog_url = blog_link.rstrip('/')
             blog_url = blog_url[blog_url.rfind('/', 1) + 1:]
         blog_name = blog_elem[0].text_content()
-        private = bool(blog_elem[0].xpath('.//span[contains(@class, "blog-type-closed")]'))
+        private = bool(xpaths.post.new.blog_closed(blog_elem[0]))
 
     elif "в личном блоге" in user_secondary_text and "в блоге" not in user_secondary_text:
         blog_name = "Блог им. " + author
 
-    else:
+    elif blog_layout == 'old':
         # Старый Табун
-        blog_elem = header.xpath('.//a[contains(@class, "topic-blog")]')
-        if not blog_elem:
-            utils.logger.warning("Failed to parse blog in post %d, please report to andreymal", post_id)
-            return None
         private = 'private-blog' in blog_elem[0].get('class', '')
 
         blog_link = blog_elem[0].get('href')
@@ -3316,14 +4111,16 @@ def parse_post(item, context=None):
             # но сами посты из личного блога не становятся закрытыми от этого
             private = False
 
+    else:
+        utils.logger.warning("Failed to parse blog in post %d, please report to andreymal", post_id)
+        return None
+
     title = title_elem.text_content()
 
     footer = item.find("footer")
 
-    post_time = footer.xpath('*[@class="topic-info"]//time[@class="topic-info-date"]')
-    if not post_time:
-        # Старый Табун (до 2024-06)
-        post_time = footer.xpath('ul[@class="topic-info"]/li[@class="topic-info-date"]/time')
+    # У старого Табуна (до 2024-06) дата лежит в другом месте
+    post_time = xpaths.select(xpaths.post, 'time', footer, layout)[1]
     utctime = None
     if post_time:
         utctime = utils.parse_datetime(post_time[0].get("datetime"))
@@ -3333,13 +4130,25 @@ def parse_post(item, context=None):
         utctime = datetime.utcnow()
         post_time = time.localtime()
 
-    body = item.xpath('div[@class="topic-content text"]')
+    body = xpaths.post.body(item)
     if len(body) == 0:
         utils.logger.warning("Failed to parse body in post %d, please report to andreymal", post_id)
         return None
     body = body[0]
 
-    if body.get('data-escaped') == '1':
+    if light:
+        # Тело не нужно (и, скорее всего, уже выкинуто в utils.preprocess_page),
+        # достаём только информацию о кате
+        raw_body = None
+        if body.get('data-escaped') == '1':
+            is_short = body.get('data-short') == '1'
+            cut_text = body.get('data-short-text') or None
+        else:
+            nextbtn = xpaths.post.body_cut(body)
+            is_short = len(nextbtn) > 0
+            cut_text = (nextbtn[-1].text.strip() or None) if is_short else None
+        body = None
+    elif body.get('data-escaped') == '1':
         # всё почищено в utils
         raw_body = body.text
         # На новом Табуне это больше не нужно, так как кнопка ката вынесена за пределы текста поста
@@ -3350,7 +4159,7 @@ def parse_post(item, context=None):
 
         # чистим от topic-actions, а также сносим мусорные отступы
         # TODO: перепроверить, актуально ли для нового Табуна
-        post_header = body.xpath('header[@class="topic-header"]')
+        post_header = xpaths.post.body_header(body)
         if post_header:
             post_header = post_header[0]
             body.remove(post_header)
@@ -3363,7 +4172,7 @@ def parse_post(item, context=None):
                 body.text = body.text.lstrip()
         body.tail = ""
 
-        nextbtn = body.xpath('a[@title="Читать дальше"][1]')
+        nextbtn = xpaths.post.body_cut(body)
         is_short = len(nextbtn) > 0
         if is_short:
             cut_text = nextbtn[-1].text.strip() or None
@@ -3376,7 +4185,7 @@ def parse_post(item, context=None):
         elif len(body) == 0 and body.text:
             body.text = body.text.rstrip()
 
-    topic_cut_link = item.xpath('.//a[@class="topic-cut-link"]')
+    topic_cut_link = xpaths.post.cut_link(item)
     if topic_cut_link:
         is_short = True
         cut_text = (topic_cut_link[0].text or '').strip()
@@ -3388,19 +4197,19 @@ def parse_post(item, context=None):
         for ntag in ntags.findall("a"):
             if ntag.text:
                 tags.append(text(ntag.text))
-        for fav_ntag_li in ntags.xpath('*[starts-with(@class, "topic-tags-user")]'):
+        for fav_ntag_li in xpaths.post.favourite_tags(ntags):
             fav_ntag = fav_ntag_li.find('a')
             if fav_ntag is not None and fav_ntag.text:
                 fav_tags.append({'url': fav_ntag.get('href'), 'tag': fav_ntag.text})
 
-    tags_btn = ntags.xpath('span[starts-with(@class, "topic-tags-edit")]')
+    tags_btn = xpaths.post.tags_edit(ntags)
     can_save_favourite_tags = (
         bool(tags_btn)
         and 'display:none' not in tags_btn[0].get('style', '')
         and 'display: none' not in tags_btn[0].get('style', '')
     )
 
-    rateelem = header.xpath('.//*[@class="topic-info-vote"]//*[@class="vote-item vote-count"][1]')
+    rateelem = xpaths.post.vote_count(header)
     if rateelem:
         rateelem = rateelem[0]
 
@@ -3415,19 +4224,19 @@ def parse_post(item, context=None):
         vote_count = -1
         vote_total = 0
 
-    poll = item.xpath('div[@class="poll"]')
+    poll = xpaths.post.poll(item) if not light else None
     if poll:
         poll = parse_poll(poll[0])
 
-    fav = footer.xpath('*[@class="topic-info"]//*[starts-with(@class, "topic-info-favourite")]')[0]
+    fav = xpaths.post.favourite(footer)[0]
     favourited = fav.get('class').endswith(' active')
     if not favourited:
-        favourited = bool(fav.xpath('*[@class="favourite link-dotted active"]'))
+        favourited = bool(xpaths.post.old.favourited(fav))
     try:
         # Новый Табун (2025-09)
         favourite = int(fav.text.strip() or 0) if fav.text else 0
     except ValueError:
-        favourite = fav.xpath('span[@class="favourite-count"]/text()')
+        favourite = xpaths.post.old.favourite_count(fav)
         try:
             favourite = int(favourite[0]) if favourite and favourite[0] else 0
         except ValueError:
@@ -3463,7 +4272,7 @@ def parse_post(item, context=None):
     download = None
 
     # Старые топики-файлы
-    topic_file = item.xpath('.//*[@class="topic-file-file"]/a')
+    topic_file = item.xpath('.//*[@class="topic-file-file"]/a') if not light else None
     if topic_file:
         filelink = topic_file[0].get('href')
         filename_node = topic_file[0].xpath('.//*[@class="topic-file-title"]')
@@ -3488,7 +4297,7 @@ def parse_post(item, context=None):
         )
 
     # Старые топики-ссылки
-    if not download:
+    if not download and not light:
         post_link = item.xpath('.//*[@class="topic-link-link"]/a')
         if post_link:
             link_count = 0
@@ -3497,7 +4306,7 @@ def parse_post(item, context=None):
 
     # Старые топики-галереи
     photoset_count = None
-    topic_photoset = item.xpath('.//*[@class="topic-photoset-photoset"]')
+    topic_photoset = item.xpath('.//*[@class="topic-photoset-photoset"]') if not light else None
     if topic_photoset:
         topic_photoset_count_str = topic_photoset[0].xpath('.//*[@class="topic-photoset-count"]')[0].text_content().split()[-1]
         if topic_photoset_count_str.isdigit():
@@ -3643,6 +4452,55 @@ def parse_rss_post(item, context=None):
     return Post(post_time, blog, post_id, author, title, False, 0, 0, node, tags, short=len(nextbtn) > 0, private=private, context=context)
 
 
+def merge_context(context, item_context):
+    # Дополняет контекст распарсенного объекта основным контекстом страницы.
+    # Не надо юзать эту функцию.
+    result = dict(context) if context else {}
+    result.update(item_context)
+    return result
+
+
+def is_comment_section(node):
+    # Проверяет, что section — коммент, который нашёл бы parse_wrapper
+    # (или который лежит прямо в блоке комментов, как в ленте).
+    # Не надо юзать эту функцию.
+    if 'comment' not in node.get('class', '').split():
+        return False
+    parent = node.getparent()
+    if parent is not None and 'comment-wrapper' in parent.get('class', '').split() and parent.find('section') is not node:
+        return False
+    while parent is not None and parent.tag == 'div' and 'comment-wrapper' in parent.get('class', '').split():
+        parent = parent.getparent()
+    # Должны дойти до самого блока комментов (первого элемента куска страницы)
+    return parent is not None and parent.getprevious() is None and parent.getparent() is not None and parent.getparent().tag == 'body'
+
+
+def parse_unusual_comment(node, post_id, blog=None, context=None, url=None):
+    # Парсинг коммента, с которым не справилась parse_comment: удалённого,
+    # скрытого или непонятного. Не надо юзать эту функцию.
+    if node.get("id", "").find("comment_id_") == 0:
+        c = parse_deleted_comment(node, post_id, blog, context=context)
+        if c is None:
+            utils.logger.warning('Cannot parse deleted comment %s (url: %s)', node.get('id'), url)
+        return c
+
+    # TODO: нужно ли на новом Табуне?
+    tmp = xpaths.comment.old.unknown_vote_area(node)
+    if tmp:
+        utils.logger.warning('Unknown comment format %s, it can be comment from deleted blog; skipped (url: %s)', tmp[0].get('id'), url)
+    else:
+        utils.logger.warning('Unknown comment format %s (url: %s)', node.get('id'), url)
+    return None
+
+
+def is_known_comment(node, is_known):
+    # Проверяет id коммента функцией из utils.known_id_checker
+    # (для since_id/known_ids в get_comments), не парся сам коммент.
+    # Не надо юзать эту функцию.
+    comment_id = node.get('data-id', '')
+    return is_known is not None and comment_id.isdigit() and is_known(int(comment_id))
+
+
 def parse_wrapper(node):
     # Парсинг коммента. Не надо юзать эту функцию.
     comms = []
@@ -3661,16 +4519,20 @@ def parse_wrapper(node):
     return comms
 
 
-def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
+def parse_comment(node, post_id, blog=None, parent_id=None, context=None, layout=None, light=False):
     # И это тоже парсинг коммента. Не надо юзать эту функцию.
+    # layout — вёрстка страницы (utils.detect_layout), по умолчанию из контекста;
+    # при light=True текст коммента не достаётся
 
     comment_id = int(node.get('data-id'))
 
     context = dict(context) if context else {}
+    if layout is None:
+        layout = context.get('layout')
     classes = frozenset(node.get('class', '').split())
 
     # Вытаскиваем элемент с информацией
-    info = node.xpath('.//*[@class="comment-info"][1]')
+    info = xpaths.comment.info(node)
     if not info:
         utils.logger.warning(
             'Comment %s in post %s has no comment-info! Please report to andreymal.',
@@ -3680,30 +4542,26 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
         return None
     info = info[0]
 
-    user_with_avatar = info.xpath('.//*[starts-with(@class, "user-with-avatar")]')
-    if user_with_avatar:
+    nick_layout, nick_node = xpaths.select(xpaths.comment, 'author', info, layout)
+    if nick_layout == 'new':
         # Новый Табун (2025-10)
-        user_with_avatar = user_with_avatar[0]
-        nick = user_with_avatar.xpath('.//*[starts-with(@class, "nickname")]/text()')[0].strip()
-    else:
+        nick = xpaths.comment.new.nickname(nick_node[0])[0].strip()
+    elif nick_layout == 'old':
         # Старый Табун
-        nick_node = info.xpath('.//a[starts-with(@class, "comment-author")][1]')
-
-        if not nick_node:
-            # Если комментарий удалён или скрыт, его comment-info пустой
-            if 'comment-deleted' not in classes and 'comment-hidden' not in classes:
-                utils.logger.warning(
-                    'Comment %s in post %s is not deleted but has empty comment-info! Please report to andreymal.',
-                    comment_id,
-                    post_id,
-                )
-            return None
-
         nick = nick_node[0].text_content().strip()
+    else:
+        # Если комментарий удалён или скрыт, его comment-info пустой
+        if 'comment-deleted' not in classes and 'comment-hidden' not in classes:
+            utils.logger.warning(
+                'Comment %s in post %s is not deleted but has empty comment-info! Please report to andreymal.',
+                comment_id,
+                post_id,
+            )
+        return None
 
     # Определяем, коммент из поста или из ленты (в ленте не все данные есть)
-    vote_area = info.xpath('.//*[starts-with(@id, "vote_area_comment")][1]')
-    is_full_comment = bool(vote_area and vote_area[0].xpath('.//div[contains(@class, "vote-up")]'))
+    vote_area = xpaths.comment.vote_area(info)
+    is_full_comment = bool(vote_area and xpaths.comment.vote_up(vote_area[0]))
 
     # Вытаскиваем всякую мелочёвку
     unread = "comment-new" in classes
@@ -3713,14 +4571,14 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
     deleted = "comment-deleted" in classes
     hidden = "comment-hidden" in classes
 
-    tm = info.xpath('.//time[1]')[0].get('datetime')
+    tm = xpaths.comment.time(info)[0].get('datetime')
     utctime = utils.parse_datetime(tm)
     tm = time.strptime(tm[:-6], "%Y-%m-%dT%H:%M:%S")  # legacy
 
     # Вытаскиваем текст сообщения (с учётом utils.escape_comment_contents)
-    body = node.xpath('div[@class="comment-content"][1]/div[1]')[0]
+    body = xpaths.comment.body(node)[0]
     raw_body = None
-    if body is not None:
+    if body is not None and not light:
         if body.get('data-escaped') == '1':
             raw_body = body.text
         else:
@@ -3733,11 +4591,11 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
                 body.text = body.text.rstrip()
 
     # Если коммент из списка комментов, мы можем вытащить заголовок поста
-    post_li = info.xpath('.//a[@class="blog-name"][1]')
+    post_li = xpaths.comment.blog_link(info)
     if post_li:
         post_li = post_li[0].getparent()
-        post_title = post_li.xpath('a[@class="comment-path-topic"]')[0].text
-        post_link = post_li.xpath('a[@class="comment-path-comments"]')[0].get('href')
+        post_title = xpaths.comment.post_title(post_li)[0].text
+        post_link = xpaths.comment.post_link(post_li)[0].get('href')
         blog, post_id = parse_post_url(post_link)  # Перезаписываем входные параметры — наше более достоверно
         del post_link
     else:
@@ -3746,7 +4604,7 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
 
     # Достаём информацию о родительском комментарии
     if parent_id is None:
-        parent_link = info.xpath('.//a[@class="goto goto-comment-parent"][1]')
+        parent_link = xpaths.comment.parent_link(info)
         if parent_link:
             parent_link = parent_link[0]
             parent_href = parent_link.get('href', '')
@@ -3761,7 +4619,7 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
                 parent_id = None
 
     # Проверяем возможность редактирования
-    edit_btn = info.xpath('.//*[contains(@class, "comment-edit-bw")][1]')
+    edit_btn = xpaths.comment.edit_button(info)
     if edit_btn:
         edit_btn = edit_btn[0]
         edit_classes = edit_btn.get('class', '').split()
@@ -3789,7 +4647,7 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
 
     # Достаём информаию о рейтинге
     if vote_area:
-        vote_node = vote_area[0].xpath('.//span[@class="vote-count"]/text()[1]')
+        vote_node = xpaths.comment.vote_count(vote_area[0])
         vote_total = int(vote_node[0].replace("+", ""))
         if is_full_comment:  # проверка, что пост не из ленты (в ней классы полупустые)
             votecls = vote_area[0].get('class', '').split()
@@ -3802,26 +4660,26 @@ def parse_comment(node, post_id, blog=None, parent_id=None, context=None):
         context['can_vote'] = False
 
     # Достаём информацию об избранном
-    favourite_node = info.xpath('.//*[starts-with(@class, "comment-favourite favorite")]')
-    if favourite_node:
+    favourite_layout, favourite_node = xpaths.select(xpaths.comment, 'favourite', info, layout)
+    if favourite_layout == 'new':
         # Новый табун (2025-09)
         context['favourited'] = favourite_node[0].get('class').endswith(' active')
         favourite = int(favourite_node[0].text.strip() or 0) if favourite_node[0].text else 0
-    else:
+    elif favourite_layout == 'old':
         # Старый Табун
-        favourite_node = info.xpath('.//*[@class="comment-favourite"][1]')
-        if favourite_node:
-            favourited_node = favourite_node[0].find('div')
-            context['favourited'] = favourited_node is not None and 'active' in favourited_node.get('class', '')
-            favourite_str = favourite_node[0].find('span').text
-            try:
-                favourite = int(favourite_str) if favourite_str else 0
-            except ValueError:
-                favourite = None
-        else:
+        favourited_node = favourite_node[0].find('div')
+        context['favourited'] = favourited_node is not None and 'active' in favourited_node.get('class', '')
+        favourite_str = favourite_node[0].find('span').text
+        try:
+            favourite = int(favourite_str) if favourite_str else 0
+        except ValueError:
             favourite = None
+    else:
+        favourite = None
 
     if body is not None:
+        if light:
+            body = None
         return Comment(tm, blog, post_id, comment_id, nick, body if raw_body is None else None, vote_total, parent_id,
                        post_title, unread, deleted, favourite, None, utctime, raw_body, hidden=hidden, context=context)
 
@@ -3836,7 +4694,7 @@ def parse_deleted_comment(node, post_id, blog=None, parent_id=None, context=None
     context = dict(context) if context else {}
     context['can_edit'] = False
     context['can_vote'] = False
-    context['favourited'] = bool(node.xpath('.//*[@class="comment-favourite favorite active"]'))
+    context['favourited'] = bool(xpaths.comment.deleted_favourited(node))
     context['vote_value'] = None
 
     classes = frozenset(node.get('class', '').split())
@@ -3927,6 +4785,16 @@ def parse_talk_item(node, context=None):
     )
 
 
+def parse_blog_url(link):
+    """Выдирает название блога из ссылки на него. Или возвращает None, если выдрать не удалось."""
+    if not link:
+        return None
+    m = blog_url_regex.search(link.split('?', 1)[0].split('#', 1)[0])
+    if not m:
+        return None
+    return m.group(1)
+
+
 def parse_post_url(link):
     """Выдирает блог и номер поста из ссылки. Или возвращает (None, None), если выдрать не удалось."""
     if not link:
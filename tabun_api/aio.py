@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Асинхронный (asyncio) интерфейс к tabun_api. Требует Python 3.5 или новее,
+поэтому не импортируется из ``tabun_api`` автоматически::
+
+    from tabun_api.aio import AsyncUser
+"""
+
+import asyncio
+import functools
+
+from . import utils, ratelimit, TabunError
+from .document import PageDocument
+from .compat import text
+
+
+__all__ = ['AsyncUser']
+
+
+# get_running_loop появился в Python 3.7; внутри корутины get_event_loop
+# в старых версиях возвращает тот же цикл
+if hasattr(asyncio, 'get_running_loop'):
+    _get_running_loop = asyncio.get_running_loop
+else:
+    _get_running_loop = asyncio.get_event_loop
+
+
+class AsyncUser(object):
+    """Асинхронная обёртка над :class:`~tabun_api.User`, позволяющая
+    обслуживать сотни одновременных запросов в одном потоке с циклом событий.
+
+    Сетевой ввод-вывод выполняется в ``executor`` (по умолчанию в стандартном
+    пуле потоков цикла событий), так что число потоков ограничено размером
+    пула, а не числом одновременно ожидающих корутин. Сколько из них реально
+    ждут ответа сервера одновременно, определяет ``max_in_flight`` объекта
+    ``User`` (по умолчанию 1).
+
+    Паузы между запросами (``user.query_interval`` или другой ограничитель
+    ``user.limiter``) соблюдаются асинхронно: корутины получают свою очередь
+    через ``asyncio.sleep`` и не занимают потоки пула ожиданием. Параметр ``nowait=True`` работает как в ``User``.
+
+    Весь парсинг выполняется теми же методами ``User`` (через их параметр
+    ``raw_data``), что и в синхронном режиме. При ``parse_in_executor=True``
+    парсинг тоже уходит в ``executor``, чтобы не блокировать цикл событий
+    на больших страницах.
+
+    Синхронный объект ``User`` доступен в атрибуте ``user``; через него можно
+    менять ``query_interval``, ``timeout`` и прочие настройки.
+    """
+
+    def __init__(self, user, executor=None, parse_in_executor=False):
+        self.user = user
+        self.executor = executor
+        self.parse_in_executor = bool(parse_in_executor)
+
+    @classmethod
+    async def create(cls, *args, executor=None, parse_in_executor=False, **kwargs):
+        """Создаёт :class:`~tabun_api.User` (возможно, с запросами к серверу
+        для авторизации) в ``executor`` и оборачивает его в ``AsyncUser``.
+        Аргументы те же, что у конструктора ``User``.
+        """
+
+        from . import User
+
+        loop = _get_running_loop()
+        user = await loop.run_in_executor(executor, functools.partial(User, *args, **kwargs))
+        return cls(user, executor=executor, parse_in_executor=parse_in_executor)
+
+    def __repr__(self):
+        return '<tabun_api.aio.AsyncUser http_host={!r} username={!r}>'.format(
+            self.user.http_host,
+            self.user.username,
+        )
+
+    @property
+    def http_host(self):
+        return self.user.http_host
+
+    @property
+    def username(self):
+        return self.user.username
+
+    async def wait_query_interval(self, kind='page', nowait=False):
+        """Дожидается очереди на отправку запроса вида ``kind`` у ограничителя
+        ``user.limiter`` (см. :mod:`tabun_api.ratelimit`). В отличие от
+        синхронного ``User``, ожидающие не блокируют друг друга: каждая корутина
+        сразу резервирует себе время отправки и спит до него.
+        """
+
+        sleeptime = self.user.limiter.reserve(kind, nowait)
+        if sleeptime > 0:
+            await asyncio.sleep(sleeptime)
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        """Выполняет блокирующую функцию в ``executor``."""
+        loop = _get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _parse(self, func, *args, **kwargs):
+        if self.parse_in_executor:
+            return await self.run_in_executor(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def read_page(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None, until=None):
+        """Асинхронный аналог :func:`~tabun_api.User.read_page`."""
+
+        kind = ratelimit.guess_request_kind('GET' if data is None else 'POST', url)
+        await self.wait_query_interval(kind, nowait)
+        # Пауза уже соблюдена, а nowait-запрос не займёт лишнего места в очереди ограничителя
+        return await self.run_in_executor(self.user.read_page, url, data, headers, redir, True, with_cookies, timeout, avoid_cf, until)
+
+    async def urlread(self, url, data=None, headers=None, redir=True, nowait=False, with_cookies=True, timeout=None, avoid_cf=None, until=None):
+        """Асинхронный аналог :func:`~tabun_api.User.urlread`."""
+        return (await self.read_page(url, data, headers, redir, nowait, with_cookies, timeout, avoid_cf, until))[1]
+
+    async def send_form_and_read(self, url, fields=(), files=(), headers=None, redir=True):
+        """Асинхронный аналог :func:`~tabun_api.User.send_form_and_read`."""
+        content_type, data = utils.encode_multipart_formdata(fields, files)
+        headers = dict(headers or ())
+        headers['content-type'] = content_type
+        return await self.urlread(url, data, headers, redir)
+
+    async def ajax(self, url, fields=None, files=(), headers=None, throw_if_error=True):
+        """Асинхронный аналог :func:`~tabun_api.User.ajax`."""
+        self.user.check_login()
+        headers = dict(headers or ())
+        headers['x-requested-with'] = 'XMLHttpRequest'
+        fields = dict(fields or ())
+        fields['security_ls_key'] = self.user.security_ls_key
+        data = await self.send_form_and_read(url, fields, files, headers=headers)
+        return self.user._decode_ajax_response(data, throw_if_error)
+
+    async def get_posts(self, url='/index/newall/', raw_data=None, light=False, since_id=None, known_ids=None):
+        """Асинхронный аналог :func:`~tabun_api.User.get_posts`."""
+        if not raw_data:
+            url, raw_data = await self.read_page(url, until=self.user.content_end)
+        return await self._parse(
+            self.user.get_posts, url, raw_data=raw_data, light=light, since_id=since_id, known_ids=known_ids,
+        )
+
+    async def get_post(self, post_id, blog=None, raw_data=None):
+        """Асинхронный аналог :func:`~tabun_api.User.get_post`."""
+        if not raw_data:
+            url = '/blog/' + ((text(blog) + '/') if blog else '') + text(int(post_id)) + '.html'
+            raw_data = await self.urlread(url, until=self.user.content_end)
+        return await self._parse(self.user.get_post, post_id, blog, raw_data=raw_data)
+
+    async def get_comments(self, url='/comments/', raw_data=None, engine='tree', light=False, since_id=None, known_ids=None, via='page'):
+        """Асинхронный аналог :func:`~tabun_api.User.get_comments`."""
+        if via == 'ajax' and not raw_data:
+            comms = await self._get_comments_ajax(url, since_id, known_ids)
+            if comms is not None:
+                return comms
+        if not raw_data:
+            url, raw_data = await self.read_page(url, until=self.user.content_end)
+        return await self._parse(
+            self.user.get_comments, url, raw_data=raw_data, engine=engine, light=light,
+            since_id=since_id, known_ids=known_ids, via=via,
+        )
+
+    async def _get_comments_ajax(self, url, since_id=None, known_ids=None):
+        # Асинхронный аналог User._get_comments_ajax: отличается только запрос
+        post_id = self.user._ajax_comments_post_id(url)
+        if post_id is None:
+            return None
+        try:
+            comms = await self.get_comments_from(post_id, since_id or 0)
+        except TabunError as exc:
+            comms = exc
+        return self.user._ajax_comments_result(url, comms, since_id, known_ids)
+
+    async def get_post_and_comments(self, post_id, blog=None, raw_data=None, comments_via='page'):
+        """Асинхронный аналог :func:`~tabun_api.User.get_post_and_comments`."""
+        post_id = int(post_id)
+        url = '/blog/' + ((text(blog) + '/') if blog else '') + text(post_id) + '.html'
+        use_ajax = comments_via == 'ajax' and not raw_data
+        if not raw_data:
+            url, raw_data = await self.read_page(url, until=self.user.content_end)
+        if use_ajax:
+            comments = await self._get_comments_ajax(url)
+            if comments is not None:
+                post = await self._parse(self.user.get_post, post_id, blog, raw_data=raw_data)
+                if post is not None:
+                    post.context['comments_via'] = 'ajax'
+                return post, comments
+        return await self._parse(self._parse_post_and_comments, post_id, blog, url, raw_data, comments_via)
+
+    def _parse_post_and_comments(self, post_id, blog, url, raw_data, comments_via='page'):
+        # Ссылка после перенаправления содержит имя блога, нужное комментариям
+        if not isinstance(raw_data, PageDocument):
+            raw_data = PageDocument(self.user, raw_data, url)
+        return self.user.get_post_and_comments(post_id, blog, raw_data=raw_data, comments_via=comments_via)
+
+    async def get_comments_from(self, target_id, comment_id=0, typ='blog'):
+        """Асинхронный аналог :func:`~tabun_api.User.get_comments_from`."""
+        target_id = int(target_id)
+        comment_id = int(comment_id) if comment_id else 0
+
+        url = self.user.http_host + '/' + (typ if typ in ('blog', 'talk') else 'blog') + '/ajaxresponsecomment/'
+        data = await self.ajax(url, {'idCommentLast': comment_id, 'idTarget': target_id, 'typeTarget': 'topic'}, throw_if_error=False)
+        return await self._parse(self.user._parse_ajax_comments, data, target_id, typ, url)
+
+    async def get_activity(self, url='/stream/all/', raw_data=None):
+        """Асинхронный аналог :func:`~tabun_api.User.get_activity`."""
+        if not raw_data:
+            url, raw_data = await self.read_page(url, until=self.user.content_end)
+        return await self._parse(self.user.get_activity, url, raw_data=raw_data)
+
+    async def vote(self, post_id, value=0):
+        """Асинхронный аналог :func:`~tabun_api.User.vote`."""
+        data = await self.ajax('/ajax/vote/topic/', {'idTopic': int(post_id), 'value': int(value)})
+        return int(data['iRating'])
+
+    async def vote_comment(self, comment_id, value):
+        """Асинхронный аналог :func:`~tabun_api.User.vote_comment`."""
+        data = await self.ajax('/ajax/vote/comment/', {'idComment': int(comment_id), 'value': int(value)})
+        return int(data['iRating'])
+
+    async def vote_user(self, user_id, value):
+        """Асинхронный аналог :func:`~tabun_api.User.vote_user`."""
+        data = await self.ajax('/ajax/vote/user/', {'idUser': int(user_id), 'value': int(value)})
+        return float(data['iRating'])
+
+    async def vote_blog(self, blog_id, value):
+        """Асинхронный аналог :func:`~tabun_api.User.vote_blog`."""
+        data = await self.ajax('/ajax/vote/blog/', {'idBlog': int(blog_id), 'value': int(value)})
+        return float(data['iRating'])
+
+    async def favourite_topic(self, post_id, type=True):  # pylint: disable=redefined-builtin
+        """Асинхронный аналог :func:`~tabun_api.User.favourite_topic`."""
+        data = await self.ajax('/ajax/favourite/topic/', {'idTopic': int(post_id), 'type': '1' if type else '0'})
+        return data['iCount']
+
+    async def favourite_comment(self, comment_id, type=True):  # pylint: disable=redefined-builtin
+        """Асинхронный аналог :func:`~tabun_api.User.favourite_comment`."""
+        data = await self.ajax('/ajax/favourite/comment/', {'idComment': int(comment_id), 'type': '1' if type else '0'})
+        return data.get('iCount', 0)
+
+    async def favourite_talk(self, talk_id, type=True):  # pylint: disable=redefined-builtin
+        """Асинхронный аналог :func:`~tabun_api.User.favourite_talk`."""
+        data = await self.ajax('/ajax/favourite/talk/', {'idTalk': int(talk_id), 'type': '1' if type else '0'})
+        return 1 if data['bState'] else 0
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import utils
+from .errors import TabunError
+from .compat import text, binary
+
+
+__all__ = ['CacheEntry', 'ResponseCache', 'CommentCache']
+
+
+class CacheEntry(object):
+    """Закэшированная страница: итоговая ссылка ``final_url`` (после
+    перенаправлений), содержимое ``data``, время сохранения и устаревания
+    (``stored_at``, ``expires_at``) и валидаторы ``etag`` и ``last_modified``
+    из заголовков ответа сервера (если были).
+    """
+
+    __slots__ = ('final_url', 'data', 'stored_at', 'expires_at', 'etag', 'last_modified')
+
+    def __init__(self, final_url, data, stored_at, expires_at, etag=None, last_modified=None):
+        self.final_url = final_url
+        self.data = data
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def __repr__(self):
+        return '<tabun_api.cache.CacheEntry {!r} ({} bytes)>'.format(self.final_url, len(self.data))
+
+    def is_fresh(self, now=None):
+        return (time.time() if now is None else now) < self.expires_at
+
+    def get_validators(self):
+        """Возвращает словарь с заголовками для условного запроса
+        (``If-None-Match`` и/или ``If-Modified-Since``).
+        """
+
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def dump(self):
+        meta = {
+            'final_url': self.final_url,
+            'stored_at': self.stored_at,
+            'expires_at': self.expires_at,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+        }
+        return json.dumps(meta).encode('utf-8') + b'\n' + self.data
+
+    @classmethod
+    def load(cls, raw):
+        meta, data = raw.split(b'\n', 1)
+        meta = json.loads(meta.decode('utf-8'))
+        return cls(
+            meta['final_url'],
+            data,
+            meta['stored_at'],
+            meta['expires_at'],
+            etag=meta.get('etag'),
+            last_modified=meta.get('last_modified'),
+        )
+
+
+class ResponseCache(object):
+    """Кэш страниц для :func:`~tabun_api.User.read_page` (а значит, и для
+    ``urlread`` и всех методов ``get_*``, скачивающих страницы через него).
+    Подключается через аргумент ``response_cache`` конструктора
+    :class:`~tabun_api.User`. Кэшируются только GET-запросы без
+    дополнительных заголовков; ключ включает ссылку и данные сессии
+    пользователя, так что один кэш можно использовать в нескольких объектах
+    ``User``.
+
+    Время жизни страницы задаётся списком ``ttl_rules`` из кортежей
+    ``(регулярка, секунды)``: используется первое правило, регулярка которого
+    нашлась в ссылке (``re.search``), иначе ``default_ttl``. Страницы с нулевым
+    временем жизни не кэшируются. Заголовки ``Cache-Control`` сервера не
+    учитываются: Табун запрещает кэширование почти всего, что отдаёт
+    авторизованным пользователям.
+
+    Устаревшая страница, для которой сервер прислал ``ETag`` или
+    ``Last-Modified``, перезапрашивается условным запросом
+    (``If-None-Match``/``If-Modified-Since``); если сервер ответил
+    304 Not Modified, используется закэшированная копия.
+
+    В памяти хранится не больше ``max_entries`` страниц общим размером
+    не больше ``max_bytes``; при переполнении выбрасываются страницы,
+    которые дольше всех не использовались. Если указан каталог ``path``,
+    страницы также сохраняются на диск (без ограничения размера; можно
+    чистить методом ``clear``) и переживают перезапуск программы.
+
+    В словаре ``stats`` накапливается статистика: ``hits`` — сколько раз
+    страница взята из кэша без запросов, ``revalidated`` — сколько раз сервер
+    подтвердил актуальность устаревшей страницы, ``misses`` — сколько раз
+    пришлось скачать страницу целиком, ``evictions`` — сколько страниц
+    выброшено из памяти.
+    """
+
+    def __init__(self, default_ttl=60, ttl_rules=None, max_entries=256, max_bytes=32 * 1024 * 1024, path=None):
+        self.default_ttl = default_ttl
+        self.ttl_rules = [
+            (re.compile(pattern) if isinstance(pattern, (text, binary)) else pattern, ttl)
+            for pattern, ttl in (ttl_rules or ())
+        ]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0}
+        self.size = 0
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_ttl(self, url):
+        """Возвращает время жизни страницы по указанной ссылке в секундах."""
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def make_key(identity, url, redir=True):
+        """Собирает ключ кэша из данных сессии (см.
+        :func:`~tabun_api.User.get_session_identity`) и ссылки.
+        """
+        return '\n'.join((repr(identity), url, '1' if redir else '0'))
+
+    def get(self, key):
+        """Возвращает :class:`~tabun_api.cache.CacheEntry` (в том числе
+        устаревший) или None.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Помечаем как недавно использованный
+                del self._entries[key]
+                self._entries[key] = entry
+                return entry
+
+        entry = self._load(key)
+        if entry is not None:
+            self._store(key, entry, persist=False)
+        return entry
+
+    def set(self, key, entry):
+        """Сохраняет страницу в кэш."""
+        self._store(key, entry, persist=True)
+
+    def delete(self, key):
+        """Удаляет страницу из кэша."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.data)
+        filename = self._filename(key)
+        if filename and os.path.isfile(filename):
+            os.remove(filename)
+
+    def clear(self):
+        """Очищает кэш (в том числе на диске)."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if self.path:
+            for name in os.listdir(self.path):
+                if name.endswith('.cache'):
+                    os.remove(os.path.join(self.path, name))
+
+    def fetch(self, key, url, fetch_func):
+        """Возвращает кортеж ``(final_url, data)`` из кэша или скачивает
+        страницу функцией ``fetch_func(headers)``, которая должна вернуть
+        кортеж ``(final_url, data, response_headers, status)``. В ``headers``
+        передаются заголовки условного запроса (или пустой словарь).
+        """
+
+        ttl = self.get_ttl(url)
+        if not ttl or ttl <= 0:
+            return fetch_func({})[:2]
+
+        now = time.time()
+        entry = self.get(key)
+        if entry is not None and entry.is_fresh(now):
+            self._count('hits')
+            return entry.final_url, entry.data
+
+        validators = entry.get_validators() if entry is not None else {}
+        try:
+            final_url, data, response_headers, status = fetch_func(validators)
+        except TabunError as exc:
+            # urllib считает 304 ошибкой
+            if exc.code != 304 or not validators:
+                raise
+            status = 304
+
+        now = time.time()
+        if status == 304 and validators:
+            self._count('revalidated')
+            entry = CacheEntry(entry.final_url, entry.data, now, now + ttl, entry.etag, entry.last_modified)
+            self.set(key, entry)
+            return entry.final_url, entry.data
+
+        self._count('misses')
+        if status == 200:
+            self.set(key, CacheEntry(
+                final_url, data, now, now + ttl,
+                etag=response_headers.get('ETag') if response_headers else None,
+                last_modified=response_headers.get('Last-Modified') if response_headers else None,
+            ))
+        return final_url, data
+
+    def _store(self, key, entry, persist):
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.data)
+            self._entries[key] = entry
+            self.size += len(entry.data)
+
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, old = self._entries.popitem(last=False)
+                self.size -= len(old.data)
+                evicted += 1
+            self.stats['evictions'] += evicted
+
+        if persist:
+            self._save(key, entry)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _filename(self, key):
+        if not self.path:
+            return None
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def _load(self, key):
+        filename = self._filename(key)
+        if not filename or not os.path.isfile(filename):
+            return None
+        try:
+            with open(filename, 'rb') as fp:
+                return CacheEntry.load(fp.read())
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, key, entry):
+        filename = self._filename(key)
+        if not filename:
+            return
+        tmp_filename = filename + '.tmp.{}'.format(threading.current_thread().ident)
+        try:
+            with open(tmp_filename, 'wb') as fp:
+                fp.write(entry.dump())
+            if os.path.exists(filename) and not hasattr(os, 'replace'):
+                os.remove(filename)
+            getattr(os, 'replace', os.rename)(tmp_filename, filename)
+        except (IOError, OSError) as exc:
+            # Запрос-то удался, так что ошибку диска только логируем;
+            # в памяти страница всё равно закэширована
+            utils.logger.warning('ResponseCache: cannot save %s: %s', filename, exc)
+            try:
+                os.remove(tmp_filename)
+            except (IOError, OSError):
+                pass
+
+
+class CommentCache(object):
+    """Кэш распарсенных комментов для :func:`~tabun_api.User.get_comments`.
+    Подключается через аргумент ``comment_cache`` конструктора
+    :class:`~tabun_api.User`.
+
+    Для каждого коммента на странице считается отпечаток — хэш кода его
+    ``<section>`` (см. :func:`~tabun_api.utils.comment_fingerprints`). Если
+    при следующем чтении той же страницы отпечаток не изменился, вместо
+    вызова ``parse_comment`` возвращается копия объекта
+    :class:`~tabun_api.Comment`, полученного в прошлый раз (с обновлённым
+    контекстом страницы); изменившиеся и новые комменты парсятся заново.
+    Так при регулярном перечитывании большого поста парсится лишь несколько
+    комментов, а не все.
+
+    Комменты хранятся отдельно для каждого поста (или другой страницы
+    с комментами) и при каждом чтении страницы заменяются целиком, так что
+    комменты, пропавшие со страницы, в кэше не задерживаются. Исключение —
+    чтение с ``since_id`` или ``known_ids``: известные вызывающему комменты
+    при этом не парсятся и остаются в кэше как были. В памяти хранится
+    не больше ``max_posts`` постов и ``max_comments`` комментов в сумме;
+    при переполнении выбрасываются посты, которые дольше всех не читались.
+
+    В словаре ``stats`` накапливается статистика: ``hits`` — сколько
+    комментов взято из кэша, ``misses`` — сколько пришлось парсить,
+    ``evictions`` — сколько постов выброшено из кэша.
+    """
+
+    def __init__(self, max_posts=64, max_comments=50000):
+        self.max_posts = max_posts
+        self.max_comments = max_comments
+
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.size = 0
+        self._lock = threading.RLock()
+        self._posts = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return self.size
+
+    def get_post(self, key):
+        """Возвращает словарь ``{id коммента: (отпечаток, Comment, контекст коммента)}``
+        для поста ``key`` (пустой, если поста в кэше нет).
+        """
+
+        with self._lock:
+            entries = self._posts.pop(key, None)
+            if entries is None:
+                return {}
+            # Помечаем как недавно использованный
+            self._posts[key] = entries
+            return entries
+
+    def set_post(self, key, entries, hits=0, misses=0):
+        """Заменяет комменты поста ``key`` (в том же виде, что возвращает
+        ``get_post``) и учитывает в статистике ``hits`` и ``misses``.
+        """
+
+        with self._lock:
+            old = self._posts.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            if entries:
+                self._posts[key] = entries
+                self.size += len(entries)
+
+            while self._posts and (len(self._posts) > self.max_posts or self.size > self.max_comments):
+                _, old = self._posts.popitem(last=False)
+                self.size -= len(old)
+                self.stats['evictions'] += 1
+
+            self.stats['hits'] += hits
+            self.stats['misses'] += misses
+
+    def delete_post(self, key):
+        """Удаляет комменты поста ``key`` из кэша."""
+        self.set_post(key, None)
+
+    def clear(self):
+        """Очищает кэш."""
+        with self._lock:
+            self._posts.clear()
+            self.size = 0
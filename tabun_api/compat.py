@@ -9,10 +9,14 @@ PY2 = sys.version_info.major == 2
 
 if PY2:
     import urllib2 as urequest
+    import httplib as http_client
+    import Queue as queue
     from httplib import HTTPException
     from Cookie import BaseCookie
 else:
     import urllib.request as urequest
+    import http.client as http_client
+    import queue
     from http.cookies import BaseCookie
     from http.client import HTTPException
 
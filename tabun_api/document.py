@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from . import utils, xpaths
+from .compat import binary
+
+
+__all__ = ['PageDocument']
+
+
+class PageDocument(object):
+    """Страница Табуна, которая подготавливается и парсится один раз.
+
+    Объект можно передать в параметр ``raw_data`` любого метода
+    :class:`~tabun_api.User` вместо кода страницы. Методы, которым нужен
+    пост, комменты, контекст или пагинация, берут их из общего дерева,
+    поэтому, например, :func:`~tabun_api.User.get_post` и
+    :func:`~tabun_api.User.get_comments` на одном документе не повторяют
+    работу друг за другом. Всё вычисляется лениво при первом обращении.
+
+    :param user: пользователь, от имени которого скачана страница
+      (нужен для контекста)
+    :type user: :class:`~tabun_api.User`
+    :param bytes raw_data: код страницы
+    :param url: итоговая ссылка на страницу
+    :type url: строка или None
+    :param may_be_short: могут ли посты на странице быть обрезаны катом
+      (по умолчанию — если ссылка не заканчивается на ``.html``)
+    """
+
+    def __init__(self, user, raw_data, url=None, may_be_short=None):
+        if not isinstance(raw_data, binary):
+            raise ValueError('raw_data should be bytes')
+        if url and url.startswith('/'):
+            url = user.http_host + url
+        if may_be_short is None:
+            may_be_short = not (url or '').split('?', 1)[0].endswith('.html')
+
+        #: Пользователь, от имени которого скачана страница.
+        self.user = user
+        #: Исходный код страницы (bytes).
+        self.raw_data = raw_data
+        #: Ссылка на страницу.
+        self.url = url
+        self.may_be_short = may_be_short
+
+        self._data = None
+        self._root = None
+        self._context = None
+        self._pagination = None
+        self._articles = None
+        self._comments_node = False
+
+    def __repr__(self):
+        return '<tabun_api.document.PageDocument {!r} ({} bytes)>'.format(self.url, len(self.raw_data))
+
+    @property
+    def data(self):
+        """Код страницы после :func:`~tabun_api.utils.preprocess_page`."""
+        if self._data is None:
+            self._data = utils.preprocess_page(self.raw_data, self.may_be_short)
+        return self._data
+
+    @property
+    def root(self):
+        """Корневой lxml-элемент всей страницы."""
+        if self._root is None:
+            self._root = utils.parse_html(self.data)
+        return self._root
+
+    @property
+    def context(self):
+        """Контекст страницы (см. :func:`~tabun_api.User.get_main_context`).
+        Каждый раз возвращается новая копия словаря, её можно менять.
+        """
+        if self._context is None:
+            self._context = self.user.get_main_context(self.raw_data, url=self.url)
+        return dict(self._context)
+
+    @property
+    def pagination(self):
+        """Пагинация страницы (см. :func:`~tabun_api.User.get_pagination`)."""
+        if self._pagination is None:
+            self._pagination = self.user.get_pagination(self.raw_data)
+        return self._pagination
+
+    @property
+    def articles(self):
+        """Список элементов ``article`` (посты или письмо) в порядке на странице."""
+        if self._articles is None:
+            self._articles = list(self.root.iter('article'))
+        return list(self._articles)
+
+    @property
+    def comments_node(self):
+        """Элемент ``<div class="comments...">`` со всеми комментами или None."""
+        if self._comments_node is False:
+            node = xpaths.page.comments(self.root)
+            self._comments_node = node[0] if node else None
+        return self._comments_node
@@ -29,6 +29,8 @@ class TabunError(Exception):
     HTTP_ERROR = -40
     IO_ERROR = -30
     TIMEOUT = -20
+    CIRCUIT_OPEN = -60
+    NO_SESSIONS = -70
     STATIC_404 = -404
 
     def __init__(self, message=None, code=0, data=None, exc=None, msg=None):
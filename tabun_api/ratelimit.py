@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import threading
+
+
+__all__ = ['Limiter', 'IntervalLimiter', 'TokenBucketLimiter', 'guess_request_kind']
+
+
+#: Виды запросов, для которых ограничители могут вести отдельный учёт.
+request_kinds = ('page', 'ajax', 'upload')
+
+
+def guess_request_kind(method, url):
+    """Определяет вид запроса для ограничителя: ``page`` для GET-запросов,
+    ``upload`` для загрузки файлов и ``ajax`` для остальных POST-запросов.
+    """
+
+    if method.upper() in ('GET', 'HEAD'):
+        return 'page'
+    if '/upload/' in url:
+        return 'upload'
+    return 'ajax'
+
+
+class Limiter(object):
+    """Базовый класс ограничителя частоты запросов, через который
+    :func:`~tabun_api.User.send_request` соблюдает паузы между запросами.
+    Подключается через аргумент ``limiter`` конструктора :class:`~tabun_api.User`;
+    один ограничитель можно использовать в нескольких объектах ``User``
+    одновременно, тогда они делят между собой общий лимит.
+
+    Наследники должны реализовать методы ``reserve`` и ``get_wait_time``
+    и сделать их потокобезопасными.
+
+    В поле ``queue_depth`` хранится число запросов, которые сейчас ждут
+    своей очереди в методе ``acquire``.
+    """
+
+    def __init__(self):
+        self.queue_depth = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, kind='page', nowait=False):
+        """Занимает место в очереди для запроса вида ``kind`` и возвращает
+        число секунд, которое нужно подождать перед его отправкой. Сам метод
+        не спит, так что его можно использовать и в асинхронном коде.
+
+        При ``nowait=True`` запрос отправляется без ожидания, но ограничитель
+        может его учесть (см. описание конкретных ограничителей).
+        """
+        raise NotImplementedError
+
+    def get_wait_time(self, kind='page'):
+        """Возвращает число секунд, которое пришлось бы подождать запросу
+        вида ``kind``, если отправить его прямо сейчас. Место в очереди при
+        этом не занимается.
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """Забывает о всех отправленных запросах."""
+
+    def acquire(self, kind='page', nowait=False):
+        """Занимает место в очереди и спит, пока не придёт время отправлять
+        запрос. Возвращает время сна в секундах.
+        """
+
+        sleeptime = self.reserve(kind, nowait)
+        if sleeptime > 0:
+            with self._lock:
+                self.queue_depth += 1
+            try:
+                time.sleep(sleeptime)
+            finally:
+                with self._lock:
+                    self.queue_depth -= 1
+        return sleeptime
+
+
+class IntervalLimiter(Limiter):
+    """Ограничитель по умолчанию: между любыми двумя запросами проходит
+    не меньше ``interval`` секунд, без разделения по видам запросов.
+    Соответствует поведению ``User.query_interval``.
+
+    Запрос с ``nowait=True`` отправляется сразу, но следующий обычный запрос
+    будет отсчитывать паузу от него.
+    """
+
+    def __init__(self, interval=0):
+        super(IntervalLimiter, self).__init__()
+        self.interval = interval
+        self.last_query_time = 0
+
+    def reserve(self, kind='page', nowait=False):
+        with self._lock:
+            now = time.time()
+            if nowait or self.interval <= 0:
+                # Уже занятые другими запросами места в очереди не сдвигаем
+                self.last_query_time = max(self.last_query_time, now)
+                return 0
+
+            sleeptime = self.last_query_time - now + self.interval
+            # Время запроса записываем до отправки, а не после, для компенсации сетевых задержек
+            # А для компенсации локальных задержек время считаем сами вместо time.time()
+            if sleeptime <= 0:
+                self.last_query_time = now
+                return 0
+            self.last_query_time += self.interval
+            return sleeptime
+
+    def get_wait_time(self, kind='page'):
+        if self.interval <= 0:
+            return 0
+        return max(0, self.last_query_time - time.time() + self.interval)
+
+    def reset(self):
+        with self._lock:
+            self.last_query_time = 0
+
+
+class TokenBucketLimiter(Limiter):
+    """Ограничитель по алгоритму token bucket: для каждого вида запросов
+    (``page``, ``ajax``, ``upload``) есть своё «ведро» на ``burst`` жетонов,
+    которое наполняется со скоростью ``rate`` жетонов в секунду. Каждый
+    запрос забирает один жетон; если ведро пусто, запрос ждёт нового жетона.
+    Таким образом, после простоя можно сразу отправить ``burst`` запросов,
+    а в среднем отправляется не больше ``rate`` запросов в секунду.
+
+    Параметры отдельных видов запросов можно переопределить через словарь
+    ``kinds`` вида ``{'upload': (rate, burst)}``; виды, не указанные в нём,
+    получают ``rate`` и ``burst`` по умолчанию, но учитываются всё равно
+    в отдельных вёдрах.
+
+    Запросы с ``nowait=True`` не ждут и не расходуют жетоны.
+    """
+
+    def __init__(self, rate=1.0, burst=1, kinds=None):
+        super(TokenBucketLimiter, self).__init__()
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+
+        self.rate = float(rate)
+        self.burst = burst
+        self.kinds = dict(kinds or {})
+        self._buckets = {}  # {kind: [tokens, updated_at]}
+
+    def get_bucket_params(self, kind):
+        """Возвращает кортеж ``(rate, burst)`` для указанного вида запросов."""
+        rate, burst = self.kinds.get(kind, (self.rate, self.burst))
+        return float(rate), burst
+
+    def _refill(self, kind, now):
+        rate, burst = self.get_bucket_params(kind)
+        bucket = self._buckets.get(kind)
+        if bucket is None:
+            bucket = [float(burst), now]
+            self._buckets[kind] = bucket
+        else:
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket, rate
+
+    def reserve(self, kind='page', nowait=False):
+        if nowait:
+            return 0
+        with self._lock:
+            bucket, rate = self._refill(kind, time.time())
+            # Жетоны могут уйти в минус: это очередь из уже занявших место запросов
+            bucket[0] -= 1
+            if bucket[0] >= 0:
+                return 0
+            return -bucket[0] / rate
+
+    def get_wait_time(self, kind='page'):
+        with self._lock:
+            bucket, rate = self._refill(kind, time.time())
+            if bucket[0] >= 1:
+                return 0
+            return (1 - bucket[0]) / rate
+
+    def get_tokens(self, kind='page'):
+        """Возвращает текущее число жетонов в ведре (отрицательное,
+        если запросы стоят в очереди).
+        """
+        with self._lock:
+            return self._refill(kind, time.time())[0][0]
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
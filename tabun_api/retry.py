@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import random
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+from .errors import TabunError
+from .compat import urequest
+
+
+__all__ = ['RetryPolicy', 'CircuitBreaker', 'parse_retry_after']
+
+
+def parse_retry_after(value, now=None):
+    """Парсит значение заголовка ``Retry-After`` (число секунд или дата)
+    и возвращает число секунд ожидания или None, если распарсить не удалось.
+    """
+
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - (time.time() if now is None else now))
+
+
+class CircuitBreaker(object):
+    """Автомат защиты: после ``failure_threshold`` неудачных запросов подряд
+    «размыкается», и следующие ``recovery_timeout`` секунд все запросы сразу
+    завершаются исключением ``TabunError`` с кодом ``TabunError.CIRCUIT_OPEN``,
+    не нагружая и без того лежащий сервер. По истечении этого времени
+    пропускается один пробный запрос: если он успешен, автомат замыкается
+    обратно, иначе снова размыкается.
+
+    Один объект можно использовать в нескольких объектах ``User``.
+    Текущее состояние хранится в поле ``state``: ``closed``, ``open``
+    или ``half-open``.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Вызывается перед запросом; кидает исключение, если запросы сейчас запрещены."""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.time() - self.opened_at >= self.recovery_timeout:
+                # Пропускаем один пробный запрос
+                self.state = 'half-open'
+                return
+        raise TabunError('Circuit breaker is open', TabunError.CIRCUIT_OPEN)
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def release(self):
+        """Отпускает пробный запрос, ничего не сказавший о сервере (например,
+        ошибка 404 или прерванный ``KeyboardInterrupt``): следующий запрос
+        снова будет пробным. В остальных состояниях ничего не делает.
+        """
+
+        with self._lock:
+            if self.state == 'half-open':
+                self.state = 'open'
+
+
+class RetryPolicy(object):
+    """Политика повтора запросов при временных ошибках, подключаемая через
+    аргумент ``retry_policy`` конструктора :class:`~tabun_api.User`.
+
+    Повторяются только идемпотентные запросы (GET и HEAD без тела), так что
+    отправка комментариев, постов, голосов и прочих форм никогда не
+    повторяется автоматически. Повторяются ошибки с HTTP-кодами из
+    ``retry_codes`` (по умолчанию 502, 503, 504) и сетевые ошибки
+    (``TabunError.URL_ERROR``, ``HTTP_ERROR``, ``TIMEOUT``).
+
+    Пауза перед ``n``-м повтором (начиная с нуля) равна
+    ``min(max_backoff, backoff * 2 ** n)``, уменьшенной на случайную долю
+    до ``jitter``, чтобы много клиентов не повторяли запросы одновременно.
+    Если сервер прислал заголовок ``Retry-After``, используется он, но если
+    там больше ``max_retry_after`` секунд, запрос не повторяется. Паузы
+    выдерживаются через ``user.sleep_func`` (и ограничитель частоты запросов,
+    как обычно).
+
+    Если указан ``circuit_breaker`` (объект
+    :class:`~tabun_api.retry.CircuitBreaker` или ``True`` для создания нового),
+    то все запросы (включая неидемпотентные) проходят через него.
+
+    Ответ 503 с заголовком ``CF-RAY`` при включенном ``avoid_cf`` не
+    повторяется: это задачка CloudFlare, и её решает ``User.urlopen``.
+
+    В словаре ``stats`` накапливается статистика: ``retries`` — сколько
+    было повторов, ``gave_up`` — сколько запросов завершились ошибкой
+    после всех повторов.
+    """
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=30.0,
+        jitter=0.5,
+        retry_codes=(502, 503, 504),
+        max_retry_after=120.0,
+        circuit_breaker=None,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_codes = frozenset(retry_codes)
+        self.max_retry_after = max_retry_after
+        if circuit_breaker is True:
+            circuit_breaker = CircuitBreaker()
+        self.circuit_breaker = circuit_breaker or None
+        self.stats = {'retries': 0, 'gave_up': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_idempotent(request):
+        """Можно ли безопасно повторить запрос (объект ``Request``)."""
+        return request.get_method() in ('GET', 'HEAD') and request.data is None
+
+    def is_failure(self, exc):
+        """Является ли ошибка временной (признаком проблем на сервере или в сети)."""
+        return exc.code in self.retry_codes or exc.code in (
+            TabunError.URL_ERROR,
+            TabunError.HTTP_ERROR,
+            TabunError.TIMEOUT,
+        )
+
+    def get_delay(self, attempt, exc):
+        """Возвращает паузу перед повтором номер ``attempt`` (начиная с нуля)
+        после ошибки ``exc`` или None, если повторять не нужно.
+        """
+
+        if attempt >= self.max_retries or not self.is_failure(exc):
+            return None
+
+        if isinstance(exc.exc, urequest.HTTPError) and exc.exc.headers is not None:
+            retry_after = parse_retry_after(exc.exc.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_retry_after else None
+
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, request, func, sleep_func=None, can_retry=None):
+        """Вызывает ``func()`` (отправляющую запрос ``request``) с повторами
+        согласно политике. ``can_retry(exc)``, если указана, может объявить
+        ошибку не временной: тогда она не повторяется и не засчитывается
+        автомату защиты как неудача. Исключения, не являющиеся
+        ``TabunError``, засчитываются автомату как неудача.
+        """
+
+        if sleep_func is None:
+            sleep_func = time.sleep
+        idempotent = self.is_idempotent(request)
+
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request()
+            try:
+                result = func()
+            except TabunError as exc:
+                failure = self.is_failure(exc) and (can_retry is None or can_retry(exc))
+                if self.circuit_breaker is not None:
+                    if failure:
+                        self.circuit_breaker.record_failure()
+                    else:
+                        # Ошибки вроде 404 ничего не говорят о здоровье
+                        # сервера: автомат не замыкаем, а только отпускаем
+                        # пробный запрос
+                        self.circuit_breaker.release()
+
+                delay = None
+                if idempotent and failure:
+                    delay = self.get_delay(attempt, exc)
+                if delay is None:
+                    if failure and attempt > 0:
+                        self._count('gave_up')
+                    raise
+
+                self._count('retries')
+                attempt += 1
+                # Не держим соединение с ответом, который уже не нужен
+                if isinstance(exc.exc, urequest.HTTPError):
+                    try:
+                        exc.exc.close()
+                    except Exception:  # pylint: disable=broad-except
+                        pass
+                if delay > 0:
+                    sleep_func(delay)
+                continue
+            except Exception:
+                # Иначе пробный запрос так и не завершится, и автомат
+                # навсегда останется полуразомкнутым
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure()
+                raise
+            except BaseException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.release()
+                raise
+
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+            return result
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import zlib
+import select
+import socket
+import threading
+
+from . import utils
+from .compat import PY2, urequest, http_client
+
+
+__all__ = ['ConnectionPool', 'KeepAliveHandler', 'SingleFlight', 'DecompressHandler']
+
+
+class ConnectionPool(object):
+    """Пул постоянных (keep-alive) HTTP-соединений. Используется обработчиком
+    :class:`~tabun_api.transport.KeepAliveHandler`, который подключается
+    через аргумент ``connection_pool`` конструктора :class:`~tabun_api.User`.
+
+    Соединения группируются по схеме и хосту (то есть по ``http_host``);
+    для каждого хоста хранится не более ``maxsize`` простаивающих соединений,
+    лишние закрываются сразу после использования. Соединения, простаивающие
+    дольше ``idle_timeout`` секунд, выбрасываются из пула.
+
+    Перед повторным использованием соединение проверяется: если сервер успел
+    его закрыть (или прислал что-то без запроса), оно выбрасывается и вместо
+    него открывается новое.
+
+    Пул потокобезопасен, и один его объект можно использовать в нескольких
+    объектах ``User``.
+
+    В словаре ``stats`` накапливается статистика: ``created`` — сколько
+    соединений открыто, ``reused`` — сколько раз соединение было использовано
+    повторно, ``stale`` — сколько соединений оказались закрытыми сервером,
+    ``evicted`` — сколько соединений выброшено по таймауту или из-за
+    переполнения пула.
+    """
+
+    def __init__(self, maxsize=4, idle_timeout=30.0):
+        self.maxsize = int(maxsize)
+        self.idle_timeout = float(idle_timeout)
+        self.stats = {'created': 0, 'reused': 0, 'stale': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._idle = {}  # {key: [(conn, released_at), ...]}
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(x) for x in self._idle.values())
+
+    def get(self, key):
+        """Достаёт из пула готовое к использованию соединение
+        или возвращает None, если такого нет.
+        """
+
+        now = time.time()
+        while True:
+            with self._lock:
+                conns = self._idle.get(key)
+                if not conns:
+                    return None
+                # Берём последнее освобождённое соединение: у него меньше шансов
+                # быть закрытым сервером по таймауту
+                conn, released_at = conns.pop()
+                if not conns:
+                    del self._idle[key]
+
+            if self.idle_timeout >= 0 and now - released_at > self.idle_timeout:
+                self._count('evicted')
+                conn.close()
+                continue
+
+            if is_connection_dropped(conn):
+                self._count('stale')
+                conn.close()
+                continue
+
+            self._count('reused')
+            return conn
+
+    def connect(self, key, factory):
+        """Достаёт соединение из пула, а если готового нет — создаёт новое
+        вызовом ``factory()``. Возвращает кортеж из соединения и флага,
+        взято ли оно из пула.
+        """
+
+        conn = self.get(key)
+        if conn is not None:
+            return conn, True
+        conn = factory()
+        self._count('created')
+        return conn, False
+
+    def discard(self, conn, stale=False):
+        """Закрывает соединение, которое нельзя вернуть в пул. ``stale=True``
+        означает, что его закрыл сервер, пока оно лежало в пуле.
+        """
+
+        if stale:
+            self._count('stale')
+        conn.close()
+
+    def put(self, key, conn):
+        """Возвращает соединение в пул (или закрывает его, если пул переполнен)."""
+        if conn.sock is None:
+            return
+
+        now = time.time()
+        expired = []
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            # Попутно выкидываем давно простаивающие соединения
+            while conns and self.idle_timeout >= 0 and now - conns[0][1] > self.idle_timeout:
+                expired.append(conns.pop(0)[0])
+            if len(conns) >= self.maxsize:
+                expired.append(conn)
+            else:
+                conns.append((conn, now))
+            if not conns:
+                del self._idle[key]
+
+        for x in expired:
+            self._count('evicted')
+            x.close()
+
+    def clear(self):
+        """Закрывает все простаивающие соединения."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+def is_connection_dropped(conn):
+    """Проверяет, не закрыл ли сервер простаивающее соединение.
+    Живое keep-alive соединение между запросами молчит, поэтому если из
+    сокета можно что-то прочитать (хотя бы EOF), то использовать его уже нельзя.
+    """
+
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        return bool(select.select([sock], [], [], 0.0)[0])
+    except (ValueError, select.error, socket.error):
+        return True
+
+
+class _PooledResponse(http_client.HTTPResponse):
+    # HTTPResponse, возвращающий своё соединение в пул после полного прочтения тела
+
+    _pool_release = None
+
+    def read(self, amt=None):
+        data = http_client.HTTPResponse.read(self, amt)
+        if self.fp is None:
+            self._release(True)
+        return data
+
+    if not PY2:
+        def readinto(self, b):
+            n = http_client.HTTPResponse.readinto(self, b)
+            if self.fp is None:
+                self._release(True)
+            return n
+
+    def close(self):
+        # Если тело прочитано не до конца, в сокете остался мусор
+        # и переиспользовать соединение нельзя
+        complete = self.fp is None
+        try:
+            http_client.HTTPResponse.close(self)
+        finally:
+            self._release(complete)
+
+    def _release(self, reusable):
+        release = self._pool_release
+        if release is None:
+            return
+        self._pool_release = None
+        release(reusable and not self.will_close)
+
+
+class KeepAliveHandler(urequest.HTTPHandler, urequest.HTTPSHandler):
+    """Обработчик для ``urllib``, отправляющий HTTP- и HTTPS-запросы через
+    постоянные соединения из пула :class:`~tabun_api.transport.ConnectionPool`
+    вместо открытия нового соединения (и нового TLS-рукопожатия) на каждый запрос.
+
+    Соединение возвращается в пул, когда тело ответа прочитано полностью
+    (например, методами ``User.urlread`` или ``User.saferead``). Если ответ
+    закрыт раньше, соединение закрывается.
+
+    Если переиспользованное соединение оказалось закрыто сервером, запрос без
+    тела (GET) автоматически повторяется через новое соединение.
+    """
+
+    def __init__(self, pool, context=None):
+        urequest.HTTPHandler.__init__(self)
+        urequest.HTTPSHandler.__init__(self, context=context)
+        self.pool = pool
+        self.context = context
+
+    def http_open(self, req):
+        return self.do_pooled_open(http_client.HTTPConnection, req)
+
+    def https_open(self, req):
+        if self.context is not None:
+            return self.do_pooled_open(http_client.HTTPSConnection, req, context=self.context)
+        return self.do_pooled_open(http_client.HTTPSConnection, req)
+
+    def do_pooled_open(self, http_class, req, **http_conn_args):
+        host = req.get_host() if PY2 else req.host
+        if not host:
+            raise urequest.URLError('no host given')
+
+        # Разные SSL-контексты нельзя смешивать в одной группе соединений
+        key = (http_class.__name__, host, id(http_conn_args.get('context')))
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+        headers = {name.title(): val for name, val in headers.items()}
+        headers['Connection'] = 'keep-alive'
+
+        def factory():
+            conn = http_class(host, timeout=req.timeout, **http_conn_args)
+            conn.response_class = _PooledResponse
+            return conn
+
+        while True:
+            conn, reused = self.pool.connect(key, factory)
+            if reused:
+                conn.timeout = req.timeout
+                conn.sock.settimeout(req.timeout)
+
+            try:
+                conn.request(req.get_method(), req.get_selector() if PY2 else req.selector, req.data, headers)
+                resp = conn.getresponse()
+            except socket.timeout:
+                conn.close()
+                raise
+            except (http_client.HTTPException, socket.error) as exc:
+                if reused and req.data is None:
+                    # Сервер закрыл соединение, пока оно лежало в пуле — пробуем новое
+                    self.pool.discard(conn, stale=True)
+                    continue
+                conn.close()
+                if isinstance(exc, http_client.HTTPException):
+                    raise
+                raise urequest.URLError(exc)
+            except:
+                conn.close()
+                raise
+            break
+
+        resp._pool_release = lambda reusable: self._release(key, conn, reusable)
+
+        if PY2:
+            result = urequest.addinfourl(resp, resp.msg, req.get_full_url())
+            result.code = resp.status
+            result.msg = resp.reason
+            return result
+
+        resp.url = req.get_full_url()
+        resp.msg = resp.reason
+        return resp
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            self.pool.put(key, conn)
+        else:
+            self.pool.discard(conn)
+
+
+class _Flight(object):
+    # Выполняющийся в данный момент вызов и его результат
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc = None
+
+
+class SingleFlight(object):
+    """Объединяет одинаковые одновременные запросы: если несколько потоков
+    запрашивают одно и то же (с одинаковым ключом), то реально выполняется
+    только первый запрос, а остальные дожидаются его и получают тот же
+    результат или то же исключение. Подключается через аргумент
+    ``single_flight`` конструктора :class:`~tabun_api.User`; один объект
+    можно использовать в нескольких объектах ``User`` (ключи включают
+    данные сессии, так что результаты разных пользователей не смешаются).
+
+    Результаты не кэшируются: после завершения запроса следующий вызов
+    с тем же ключом снова выполнит запрос.
+
+    В словаре ``stats`` накапливается статистика: ``misses`` — сколько
+    запросов выполнено, ``hits`` — сколько вызовов получили чужой результат
+    вместо своего запроса, ``saved_bytes`` — сколько байт не пришлось
+    скачивать благодаря этому.
+    """
+
+    def __init__(self):
+        self.stats = {'hits': 0, 'misses': 0, 'saved_bytes': 0}
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key, func, size_func=None, copy_func=None):
+        """Вызывает ``func()`` или дожидается результата такого же вызова,
+        уже выполняющегося в другом потоке. ``size_func(result)``, если указана,
+        используется для подсчёта сэкономленных байт. ``copy_func(result)``,
+        если указана, вызывается для результата каждого дождавшегося потока,
+        чтобы потоки не делили изменяемые объекты.
+        """
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.exc is not None:
+                raise flight.exc
+            if size_func is not None:
+                size = size_func(flight.result)
+                with self._lock:
+                    self.stats['saved_bytes'] += size
+            if copy_func is not None:
+                return copy_func(flight.result)
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as exc:
+            flight.exc = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+
+class _ZlibDecoder(object):
+    # gzip или deflate; для deflate некоторые серверы присылают данные без
+    # заголовка zlib, поэтому формат определяем по первому куску
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self._first = True
+        self._started = False
+        if encoding == 'gzip':
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._obj = zlib.decompressobj()
+
+    @property
+    def pending(self):
+        # Есть ли ещё не разжатые данные (из-за ограничения max_length)
+        return bool(self._obj.unconsumed_tail)
+
+    def decompress(self, data, max_length=0):
+        if data:
+            self._started = True
+        if self.pending:
+            data = self._obj.unconsumed_tail + data
+        if not self._first or self.encoding == 'gzip' or not data:
+            return self._obj.decompress(data, max_length)
+        self._first = False
+        try:
+            return self._obj.decompress(data, max_length)
+        except zlib.error:
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._obj.decompress(data, max_length)
+
+    def flush(self):
+        data = self._obj.flush()
+        # В Python 2 атрибута eof нет, там обрезанный поток не распознаём
+        if self._started and not getattr(self._obj, 'eof', True):
+            raise zlib.error('Compressed data ended before the end-of-stream marker was reached')
+        return data
+
+
+class _BrotliDecoder(object):
+    # Ограничивать размер разжатого куска модули brotli не умеют
+    # (по крайней мере, не все их версии), так что max_length игнорируется
+    pending = False
+
+    def __init__(self):
+        import brotli
+        self._obj = brotli.Decompressor()
+        # Модуль Brotli называет метод process, а brotlipy — decompress
+        self._process = getattr(self._obj, 'process', None) or self._obj.decompress
+
+    def decompress(self, data, max_length=0):
+        return self._process(data) if data else b''
+
+    def flush(self):
+        flush = getattr(self._obj, 'finish', None) or getattr(self._obj, 'flush', None)
+        if flush is None:
+            return b''
+        return flush() or b''
+
+
+class _DecodingReader(object):
+    # Файлоподобный объект, разжимающий ответ сервера по мере чтения.
+    # Ошибки разжатия превращаются в IOError, чтобы User._netwrap
+    # превратил их в TabunError
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, fp, decoder, stats_callback):
+        self.fp = fp
+        self.decoder = decoder
+        self.stats_callback = stats_callback
+        self._buf = b''
+        self._eof = False
+
+    def _fill(self):
+        raw = b''
+        try:
+            if self.decoder.pending:
+                # Дожимаем остаток предыдущего куска, не читая новых данных
+                data = self.decoder.decompress(b'', self.chunk_size)
+            else:
+                raw = self.fp.read(self.chunk_size)
+                if not raw:
+                    self._eof = True
+                    data = self.decoder.flush()
+                else:
+                    data = self.decoder.decompress(raw, self.chunk_size)
+        except (IOError, OSError):
+            raise
+        except Exception as exc:
+            self._eof = True
+            raise IOError('Cannot decompress response: {}'.format(exc))
+        self.stats_callback(len(raw), len(data))
+        self._buf += data
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            chunks = [self._buf]
+            self._buf = b''
+            while not self._eof:
+                self._fill()
+                chunks.append(self._buf)
+                self._buf = b''
+            return b''.join(chunks)
+
+        while len(self._buf) < amt and not self._eof:
+            self._fill()
+        data, self._buf = self._buf[:amt], self._buf[amt:]
+        return data
+
+    def readline(self, limit=-1):
+        while b'\n' not in self._buf and not self._eof and (limit < 0 or len(self._buf) < limit):
+            self._fill()
+        pos = self._buf.find(b'\n') + 1
+        if pos <= 0:
+            pos = len(self._buf)
+        if limit >= 0:
+            pos = min(pos, limit)
+        data, self._buf = self._buf[:pos], self._buf[pos:]
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def fileno(self):
+        return self.fp.fileno()
+
+    def close(self):
+        self.fp.close()
+
+
+class DecompressHandler(urequest.BaseHandler):
+    """Обработчик для ``urllib``, запрашивающий у сервера сжатые ответы
+    (заголовок ``Accept-Encoding``) и прозрачно разжимающий их по мере чтения.
+    Поддерживаются gzip и deflate, а также brotli, если установлен модуль
+    ``brotli`` (или ``brotlipy``). Подключается в :class:`~tabun_api.User`
+    по умолчанию (см. аргумент ``compression`` конструктора) и доступен
+    через поле ``user.decompress_handler``.
+
+    Если ``Accept-Encoding`` уже указан в запросе (например, через
+    ``override_headers``), он не перезаписывается.
+
+    В словаре ``stats`` накапливается статистика по сжатым ответам:
+    ``responses`` — их число, ``compressed_bytes`` — сколько байт
+    получено по сети, ``decompressed_bytes`` — сколько получилось после
+    разжатия.
+    """
+
+    # Раньше HTTPErrorProcessor, чтобы ответы с ошибками тоже разжимались
+    handler_order = 900
+
+    def __init__(self, encodings=None):
+        if encodings is None:
+            encodings = ['gzip', 'deflate']
+            if utils.is_module_available('brotli'):
+                encodings.append('br')
+        self.encodings = tuple(encodings)
+        self.stats = {'responses': 0, 'compressed_bytes': 0, 'decompressed_bytes': 0}
+        self._lock = threading.Lock()
+
+    def http_request(self, req):
+        if self.encodings and not req.has_header('Accept-encoding'):
+            req.add_unredirected_header('Accept-Encoding', ', '.join(self.encodings))
+        return req
+
+    https_request = http_request
+
+    def http_response(self, req, response):
+        headers = response.info()
+        encoding = (headers.get('Content-Encoding') or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip'):
+            decoder = _ZlibDecoder('gzip')
+        elif encoding == 'deflate':
+            decoder = _ZlibDecoder('deflate')
+        elif encoding == 'br' and 'br' in self.encodings:
+            decoder = _BrotliDecoder()
+        else:
+            return response
+
+        # Заголовки теперь описывают разжатое содержимое
+        del headers['Content-Encoding']
+        del headers['Content-Length']
+
+        with self._lock:
+            self.stats['responses'] += 1
+
+        reader = _DecodingReader(response, decoder, self._count)
+        result = urequest.addinfourl(reader, headers, response.geturl(), response.code)
+        result.msg = response.msg
+        return result
+
+    https_response = http_response
+
+    def _count(self, compressed, decompressed):
+        with self._lock:
+            self.stats['compressed_bytes'] += compressed
+            self.stats['decompressed_bytes'] += decompressed
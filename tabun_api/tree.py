@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import bisect
+
+
+__all__ = ['CommentTree']
+
+
+class CommentTree(object):
+    """Дерево комментариев, которое можно пополнять по ходу обсуждения.
+
+    Комменты добавляются методами ``add`` и ``update`` (например, словарями
+    из :func:`~tabun_api.User.get_comments` и
+    :func:`~tabun_api.User.get_comments_from`), и каждый новый коммент
+    просто цепляется к своему родителю, а не перестраивает всё дерево.
+    Поиск коммента по id тоже не зависит от размера дерева. Ответы
+    и корневые комменты упорядочены по id.
+
+    Коммент, родителя которого в дереве ещё нет, считается сиротой: он лежит
+    среди корневых (как в :func:`~tabun_api.utils.generate_comments_tree`),
+    а его id есть в ``orphans``. Когда родитель появится, сирота вместе
+    со всеми ответами на него переедет к нему.
+
+    При ``strict_order=True`` дерево ведёт себя как старая
+    :func:`~tabun_api.utils.generate_comments_tree`: коммент цепляется только
+    к уже добавленному родителю с меньшим id, а иначе (в том числе если
+    коммент ссылается сам на себя) навсегда остаётся сиротой и не переезжает,
+    даже когда родитель появится.
+
+    Обход дерева (``walk``, ``subtree``, ``as_lists``) не рекурсивный,
+    так что глубина ветки ограничена только памятью.
+
+    :param comments: начальные комменты (как в ``update``)
+    :param bool strict_order: сироты по правилам ``generate_comments_tree``
+    """
+
+    def __init__(self, comments=None, strict_order=False):
+        self.strict_order = bool(strict_order)
+        self._comments = {}  # {id: Comment}
+        self._children = {None: []}  # {id родителя или None для корня: [id ответов по возрастанию]}
+        self._parents = {}  # {id: id родителя в дереве или None}
+        self._waiting = {}  # {id отсутствующего родителя: [id сирот]}
+        self._strict_orphans = []  # id сирот, которые никуда не переедут (strict_order)
+        if comments:
+            self.update(comments)
+
+    def __repr__(self):
+        return '<tabun_api.tree.CommentTree ({} comments)>'.format(len(self._comments))
+
+    def __len__(self):
+        return len(self._comments)
+
+    def __contains__(self, comment_id):
+        return comment_id in self._comments
+
+    def __getitem__(self, comment_id):
+        return self._comments[comment_id]
+
+    def __iter__(self):
+        return self.subtree()
+
+    def get(self, comment_id, default=None):
+        """Возвращает коммент по id или ``default``, если его нет."""
+        return self._comments.get(comment_id, default)
+
+    def add(self, comment):
+        """Добавляет коммент в дерево. Если коммент с таким id уже есть,
+        он заменяется новым объектом (например, после редактирования),
+        а его место в дереве не меняется.
+
+        :param comment: коммент
+        :type comment: :class:`~tabun_api.Comment`
+        :return: True, если коммент новый
+        :rtype: bool
+        """
+
+        comment_id = comment.comment_id
+        if comment_id in self._comments:
+            self._comments[comment_id] = comment
+            return False
+        self._comments[comment_id] = comment
+
+        parent_id = comment.parent_id
+        if self.strict_order:
+            if parent_id and (parent_id >= comment_id or parent_id not in self._comments):
+                self._strict_orphans.append(comment_id)
+                parent_id = None
+            self._attach(comment_id, parent_id or None)
+            return True
+
+        if parent_id == comment_id:
+            parent_id = None
+        if parent_id and parent_id not in self._comments:
+            # Сирота: пока лежит в корне
+            self._waiting.setdefault(parent_id, []).append(comment_id)
+            parent_id = None
+        self._attach(comment_id, parent_id or None)
+
+        # Забираем сирот, ожидавших этот коммент (кроме его же предков:
+        # иначе получится цикл, и они так и останутся сиротами)
+        waiting = self._waiting.pop(comment_id, None)
+        if waiting:
+            ancestors = set(self._ancestor_ids(comment_id))
+            cyclic = [x for x in waiting if x in ancestors]
+            if cyclic:
+                self._waiting[comment_id] = cyclic
+            for orphan_id in waiting:
+                if orphan_id not in ancestors:
+                    self._detach(orphan_id)
+                    self._attach(orphan_id, comment_id)
+        return True
+
+    def update(self, comments):
+        """Добавляет несколько комментов, например, ответ
+        :func:`~tabun_api.User.get_comments_from`.
+
+        :param comments: словарь ``{id: Comment}`` или коллекция комментов
+        :return: список id новых комментов
+        :rtype: list
+        """
+
+        if isinstance(comments, dict):
+            comments = comments.values()
+        return [c.comment_id for c in sorted(comments, key=lambda x: x.comment_id) if self.add(c)]
+
+    @property
+    def orphans(self):
+        """Список id комментов, родителя которых в дереве нет."""
+        return sorted([x for ids in self._waiting.values() for x in ids] + self._strict_orphans)
+
+    @property
+    def roots(self):
+        """Список корневых комментов (включая сирот)."""
+        return self.children(None)
+
+    def children(self, comment_id):
+        """Возвращает список ответов на коммент (или корневых комментов,
+        если ``comment_id`` — None).
+        """
+
+        if comment_id is not None and comment_id not in self._comments:
+            raise KeyError(comment_id)
+        return [self._comments[x] for x in self._children.get(comment_id, ())]
+
+    def parent(self, comment_id):
+        """Возвращает родительский коммент или None для корневого."""
+        parent_id = self._parents[comment_id]
+        return self._comments[parent_id] if parent_id is not None else None
+
+    def depth(self, comment_id):
+        """Возвращает глубину коммента (0 для корневого)."""
+        return len(self._ancestor_ids(comment_id))
+
+    def path(self, comment_id):
+        """Возвращает список комментов от корневого до указанного включительно."""
+        ids = self._ancestor_ids(comment_id)
+        ids.reverse()
+        ids.append(comment_id)
+        return [self._comments[x] for x in ids]
+
+    def walk(self, comment_id=None):
+        """Обходит дерево (или ветку, начинающуюся с ``comment_id``) в глубину
+        в том порядке, в каком комменты показываются на странице. Является
+        генератором и выдаёт кортежи ``(коммент, глубина)``; глубина
+        считается от корня всего дерева.
+        """
+
+        if comment_id is None:
+            stack = [(x, 0) for x in reversed(self._children[None])]
+        else:
+            stack = [(comment_id, self.depth(comment_id))]
+
+        while stack:
+            current_id, depth = stack.pop()
+            yield self._comments[current_id], depth
+            children = self._children.get(current_id)
+            if children:
+                stack.extend((x, depth + 1) for x in reversed(children))
+
+    def subtree(self, comment_id=None):
+        """Как ``walk``, но выдаёт только комменты."""
+        for comment, _ in self.walk(comment_id):
+            yield comment
+
+    def as_lists(self):
+        """Возвращает дерево в формате :func:`~tabun_api.utils.generate_comments_tree`:
+        ``[(коммент, [(коммент, [...]), ...]), ...]``.
+        """
+
+        result = []
+        stack = [(self._children[None], result)]
+        while stack:
+            ids, items = stack.pop()
+            for x in ids:
+                item = (self._comments[x], [])
+                items.append(item)
+                children = self._children.get(x)
+                if children:
+                    stack.append((children, item[1]))
+        return result
+
+    def _ancestor_ids(self, comment_id):
+        # Список id предков от родителя к корню
+        result = []
+        parent_id = self._parents[comment_id]
+        while parent_id is not None:
+            result.append(parent_id)
+            parent_id = self._parents[parent_id]
+        return result
+
+    def _attach(self, comment_id, parent_id):
+        self._parents[comment_id] = parent_id
+        children = self._children.setdefault(parent_id, [])
+        if not children or children[-1] < comment_id:
+            # Обычно у нового коммента самый большой id
+            children.append(comment_id)
+        else:
+            bisect.insort(children, comment_id)
+
+    def _detach(self, comment_id):
+        children = self._children[self._parents[comment_id]]
+        del children[bisect.bisect_left(children, comment_id)]
@@ -18,6 +18,50 @@ __all__ = [
 ]
 
 
+class _LazyBody(object):
+    # Одно из двух представлений текста — lxml-элемент (index=0) или
+    # html-исходник (index=1). Оба хранятся в списке в атрибуте attr объекта,
+    # и недостающее вычисляется utils.normalize_body только при первом
+    # обращении: тем, кто тело не читает, не приходится платить
+    # за сериализацию или парсинг
+    def __init__(self, attr, index, cls='text'):
+        self.attr = attr
+        self.index = index
+        self.cls = cls
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        pair = obj.__dict__[self.attr]
+        if pair[self.index] is None and pair[1 - self.index] is not None:
+            pair[:] = utils.normalize_body(pair[0], pair[1], cls=self.cls)
+        return pair[self.index]
+
+    def __set__(self, obj, value):
+        pair = obj.__dict__.setdefault(self.attr, [None, None])
+        pair[self.index] = value
+
+
+def _body_pair(body, raw_body):
+    return [body, text(raw_body) if raw_body is not None else None]
+
+
+def _copy_object(obj):
+    # __copy__ для объектов с ленивыми текстами: копия не делит с оригиналом
+    # ни пары текстов _LazyBody, ни контекст, так что их изменение не задевает
+    # оригинал (например, лежащий в CommentCache или отданный SingleFlight
+    # другому потоку)
+    cls = type(obj)
+    result = cls.__new__(cls)
+    result.__dict__.update(obj.__dict__)
+    for value in vars(cls).values():
+        if isinstance(value, _LazyBody) and value.attr in result.__dict__:
+            result.__dict__[value.attr] = list(result.__dict__[value.attr])
+    if isinstance(result.__dict__.get('context'), dict):
+        result.context = dict(result.context)
+    return result
+
+
 class Post(object):
     """Пост.
 
@@ -35,8 +79,15 @@ class Post(object):
     * ``favourited`` (True/False) — добавлен ли пост в избранное
     * ``favourite_tags`` (list) — теги избранного поста
     * ``can_save_favourite_tags`` (True/False) — можно ли редактировать теги избранного поста (обычно совпадает с ``favourited``)
+
+    ``body`` (lxml-элемент) и ``raw_body`` (html-исходник) вычисляются друг
+    из друга только при первом обращении к ним.
     """
 
+    body = _LazyBody('_body', 0, cls='topic-content text')
+    raw_body = _LazyBody('_body', 1, cls='topic-content text')
+    __copy__ = _copy_object
+
     def __init__(self, time, blog, post_id, author, title, draft,
                  vote_count, vote_total, body, tags, comments_count=None, comments_new_count=None,
                  short=False, private=False, blog_name=None, poll=None, favourite=0, favourited=None,
@@ -64,7 +115,7 @@ class Post(object):
         self.context = context or {}
         self.photoset_count = int(photoset_count) if photoset_count is not None else None
 
-        self.body, self.raw_body = utils.normalize_body(body, raw_body, cls='topic-content text')
+        self._body = _body_pair(body, raw_body)
 
         if self.short != (self.cut_text is not None):
             utils.logger.warning('Post %d: self.short != (self.cut_text is not None)! If you don\'t use tabun_api.Post constructor directly, please report to andreymal.', post_id)
@@ -213,8 +264,13 @@ class Comment(object):
     * ``can_vote`` (True/False) — можно ли голосовать за комментарий
     * ``vote_value`` (-1/1/None) — голос текущего пользователя
     * ``favourited`` (True/False) — добавлен ли комментарий в избранное
+
+    Как и у поста, ``body`` и ``raw_body`` вычисляются при первом обращении.
     """
 
+    body = _LazyBody('_body', 0)
+    raw_body = _LazyBody('_body', 1)
+
     def __init__(self, time, blog, post_id, comment_id, author, body, vote_total, parent_id=None,
                  post_title=None, unread=False, deleted=False, favourite=None, favourited=None,
                  utctime=None, raw_body=None, hidden=False, context=None, vote=None):
@@ -247,7 +303,7 @@ class Comment(object):
             warnings.warn('Comment(favourited=...) is deprecated; use context["favourited"] instead of it', FutureWarning, stacklevel=2)
             self.context['favourited'] = bool(favourited)
 
-        self.body, self.raw_body = utils.normalize_body(body, raw_body)
+        self._body = _body_pair(body, raw_body)
 
     def __repr__(self):
         o = (
@@ -258,6 +314,8 @@ class Comment(object):
         )
         return o.encode('utf-8') if PY2 else o
 
+    __copy__ = _copy_object
+
     def hashsum(self, fields=None, debug=False):
         """Считает md5-хэш от конкатенации полей коммента (в utf-8), разделённых нулевым байтом.
 
@@ -336,7 +394,11 @@ class Comment(object):
 
 
 class Blog(object):
-    """Блог."""
+    """Блог. ``description`` и ``raw_description`` вычисляются при первом обращении."""
+
+    description = _LazyBody('_description', 0, cls='blog-content text')
+    raw_description = _LazyBody('_description', 1, cls='blog-content text')
+    __copy__ = _copy_object
 
     OPEN = 0
     CLOSED = 1
@@ -362,7 +424,7 @@ class Blog(object):
         self.avatar = text(avatar) if avatar else None
         self.context = context or {}
 
-        self.description, self.raw_description = utils.normalize_body(description, raw_description, cls='blog-content text')
+        self._description = _body_pair(description, raw_description)
 
         if closed is not None:
             warnings.warn('Blog(closed=...) is deprecated; use status instead of it', FutureWarning, stacklevel=2)
@@ -457,6 +519,8 @@ class UserInfo(object):
       (из-за багов лайвстрита корректно работает только на /profile/foo/)
     """
 
+    __copy__ = _copy_object
+
     def __init__(self, user_id, username, realname, skill, rating, userpic=None, foto=None,
                  gender=None, birthday=None, registered=None, last_activity=None,
                  description=None, blogs=None, rating_vote_count=None, contacts=None,
@@ -537,8 +601,13 @@ class TalkItem(object):
       входящим (True) или исходящим (False) (только для списка писем)
     * ``unread_comments_count``: число непрочитанных комментариев в письме
       (только для списка писем)
+
+    ``body`` и ``raw_body`` вычисляются при первом обращении.
     """
 
+    body = _LazyBody('_body', 0)
+    raw_body = _LazyBody('_body', 1)
+
     def __init__(
         self, talk_id, recipients, unread, title, date,
         body=None, author=None, comments=None, utctime=None,
@@ -556,7 +625,7 @@ class TalkItem(object):
         self.comments_count = int(comments_count)
         self.context = context
 
-        self.body, self.raw_body = utils.normalize_body(body, raw_body)
+        self._body = _body_pair(body, raw_body)
 
     def __repr__(self):
         o = "<talk " + text(self.talk_id) + ">"
@@ -584,6 +653,9 @@ class ActivityItem(object):
     * ``ActivityItem.USER_VOTE`` — голосование за пользователя (оценивающий в поле ``username``, оцениваемый — в ``data``)
     * ``ActivityItem.FRIEND_ADD`` — добавление друга (добавляющий в поле ``username``, добавляемый — в ``data``)
     * ``ActivityItem.JOIN_BLOG`` — вступление в блог (события выхода из блога на Табуне нет, ага)
+
+    В ``context`` события, полученного со страницы, лежит основной контекст
+    этой страницы (см. :func:`~tabun_api.User.get_main_context`).
     """
 
     WALL_ADD = 0
@@ -597,7 +669,7 @@ class ActivityItem(object):
     FRIEND_ADD = 4
     JOIN_BLOG = 24
 
-    def __init__(self, type, date, post_id=None, comment_id=None, blog=None, username=None, title=None, data=None, id=None, utctime=None):
+    def __init__(self, type, date, post_id=None, comment_id=None, blog=None, username=None, title=None, data=None, id=None, utctime=None, context=None):
         self.type = int(type)
         if self.type not in (
             self.WALL_ADD, self.POST_ADD, self.COMMENT_ADD, self.BLOG_ADD,
@@ -616,6 +688,7 @@ class ActivityItem(object):
         self.title = text(title) if title is not None else None
         self.data = text(data) if data is not None else None
         self.id = int(id) if id is not None else None
+        self.context = context or {}
 
     def __str__(self):
         return "<activity " + text(self.type) + " " + (self.username or 'N/A') + ">"
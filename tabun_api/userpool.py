@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import threading
+
+from . import utils
+from .errors import TabunError
+
+
+__all__ = ['UserPool', 'PooledSession']
+
+
+class PooledSession(object):
+    """Состояние одного объекта ``User`` в :class:`~tabun_api.userpool.UserPool`:
+    ``in_flight`` — число выполняющихся через него запросов, ``requests`` —
+    сколько всего было запросов, ``failures`` — число ошибок подряд,
+    ``healthy`` — можно ли его использовать, ``last_error`` — последнее
+    исключение.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.username = user.username
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.healthy = True
+        self.disabled_until = None
+        self.last_error = None
+
+    def __repr__(self):
+        return '<tabun_api.userpool.PooledSession username={!r} healthy={!r} in_flight={!r}>'.format(
+            self.username, self.healthy, self.in_flight,
+        )
+
+    def get_load(self):
+        """Возвращает кортеж для сравнения загруженности сессий: сначала
+        число выполняющихся запросов, затем сколько ждать очереди у ограничителя.
+        """
+        return (self.in_flight, self.user.limiter.get_wait_time('page'), self.requests)
+
+
+class UserPool(object):
+    """Пул из нескольких авторизованных объектов :class:`~tabun_api.User`,
+    распределяющий между ними запросы на чтение. Так как у каждого ``User``
+    своя пауза ``query_interval`` (или свой ``limiter``), суммарная скорость
+    чтения растёт примерно пропорционально числу аккаунтов.
+
+    Методы ``get_posts``, ``get_post``, ``get_comments``, ``get_post_and_comments``,
+    ``get_profile``, ``get_blog``, ``get_activity`` и ``get_page_document`` вызываются у наименее
+    загруженной исправной сессии. Все остальные атрибуты (в том числе методы,
+    что-то меняющие на сайте, вроде ``comment`` или ``vote``) берутся
+    у аккаунта ``writer`` (по умолчанию первого добавленного), так что пул
+    можно использовать вместо обычного ``User``.
+
+    Сессия считается неисправной, если по полученной странице видно, что
+    её разлогинило (имя пользователя в шапке пропало), или после
+    ``max_failures`` сетевых ошибок подряд; в последнем случае через
+    ``cooldown`` секунд её снова попробуют использовать. Разлогиненную
+    сессию можно вернуть в строй методом ``check_health`` после повторного
+    входа. Если исправных сессий не осталось, методы чтения кидают
+    ``TabunError`` с кодом ``TabunError.NO_SESSIONS``.
+    """
+
+    #: Методы, запросы которых распределяются по сессиям.
+    read_methods = frozenset((
+        'get_posts',
+        'get_post',
+        'get_comments',
+        'get_post_and_comments',
+        'get_profile',
+        'get_blog',
+        'get_activity',
+        'get_page_document',
+    ))
+
+    #: Коды ошибок (кроме HTTP 5xx), которые считаются проблемами сессии.
+    failure_codes = frozenset((
+        TabunError.URL_ERROR,
+        TabunError.HTTP_ERROR,
+        TabunError.TIMEOUT,
+        TabunError.CIRCUIT_OPEN,
+    ))
+
+    def __init__(self, users=(), writer=None, max_failures=3, cooldown=60.0):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.sessions = []
+        self._writer = None
+        self._lock = threading.Lock()
+        for user in users:
+            self.add(user)
+        if writer is not None:
+            self.writer = writer
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __repr__(self):
+        return '<tabun_api.userpool.UserPool sessions={!r}>'.format(self.sessions)
+
+    @property
+    def writer(self):
+        """``User``, через которого выполняются все запросы, кроме чтения."""
+        if self._writer is None:
+            raise TabunError('UserPool is empty', TabunError.NO_SESSIONS)
+        return self._writer
+
+    @writer.setter
+    def writer(self, user):
+        if self._find(user) is None:
+            self.add(user)
+        self._writer = user
+
+    def add(self, user):
+        """Добавляет ``User`` в пул."""
+        with self._lock:
+            if any(x.user is user for x in self.sessions):
+                return
+            self.sessions.append(PooledSession(user))
+            if self._writer is None:
+                self._writer = user
+
+    def remove(self, user):
+        """Убирает ``User`` из пула."""
+        with self._lock:
+            self.sessions = [x for x in self.sessions if x.user is not user]
+            if self._writer is user:
+                self._writer = self.sessions[0].user if self.sessions else None
+
+    def get_healthy_sessions(self):
+        """Возвращает список исправных сессий."""
+        now = time.time()
+        with self._lock:
+            return [x for x in self.sessions if self._is_available(x, now)]
+
+    def check_health(self, user=None):
+        """Проверяет (запросом главной страницы), авторизованы ли сессии,
+        и обновляет их состояние. Без аргументов проверяет все сессии.
+        Возвращает число исправных сессий.
+        """
+
+        sessions = [self._find(user)] if user is not None else list(self.sessions)
+        for session in sessions:
+            if session is None:
+                continue
+            try:
+                raw_data = session.user.urlread('/')
+            except TabunError as exc:
+                self._record_failure(session, exc)
+                continue
+            username = session.user.update_userinfo(raw_data)
+            with self._lock:
+                if session.username is not None and username is None:
+                    self._mark_logged_out(session)
+                else:
+                    session.username = username
+                    session.healthy = True
+                    session.failures = 0
+                    session.disabled_until = None
+        return len(self.get_healthy_sessions())
+
+    def call(self, method, *args, **kwargs):
+        """Вызывает метод ``method`` у наименее загруженной исправной сессии."""
+        session = self._acquire()
+        try:
+            result = getattr(session.user, method)(*args, **kwargs)
+        except TabunError as exc:
+            self._release(session)
+            if exc.code != TabunError.NO_SESSIONS:
+                self._record_failure(session, exc)
+            raise
+        except:
+            self._release(session)
+            raise
+
+        self._release(session)
+        self._check_result(session, result)
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name in self.read_methods:
+            def method(*args, **kwargs):
+                return self.call(name, *args, **kwargs)
+            method.__name__ = str(name)
+            return method
+        return getattr(self.writer, name)
+
+    def _find(self, user):
+        for session in self.sessions:
+            if session.user is user:
+                return session
+        return None
+
+    def _is_available(self, session, now):
+        if not session.healthy:
+            return False
+        return session.disabled_until is None or session.disabled_until <= now
+
+    def _acquire(self):
+        now = time.time()
+        with self._lock:
+            sessions = [x for x in self.sessions if self._is_available(x, now)]
+            if not sessions:
+                raise TabunError('No healthy sessions in UserPool', TabunError.NO_SESSIONS)
+            session = min(sessions, key=lambda x: x.get_load())
+            session.in_flight += 1
+            session.requests += 1
+            return session
+
+    def _release(self, session):
+        with self._lock:
+            session.in_flight -= 1
+
+    def _record_failure(self, session, exc):
+        # Ошибки вроде 404 говорят о странице, а не о сессии
+        if exc.code < 500 and exc.code not in self.failure_codes:
+            return
+        with self._lock:
+            session.failures += 1
+            session.last_error = exc
+            if session.failures >= self.max_failures:
+                session.disabled_until = time.time() + self.cooldown
+                session.failures = 0
+                utils.logger.warning('UserPool: session %r disabled for %s seconds after errors', session.username, self.cooldown)
+
+    def _check_result(self, session, result):
+        # Смотрим на контекст любого из полученных объектов: если в шапке
+        # страницы пропало имя пользователя, сессию разлогинило
+        item = result
+        if isinstance(item, tuple):
+            # Например, (last_id, [ActivityItem, ...]) из get_activity
+            item = next((x for x in item if isinstance(x, (list, dict)) or hasattr(x, 'context')), None)
+        if isinstance(item, dict):
+            item = next(iter(item.values()), None)
+        elif isinstance(item, list):
+            item = item[0] if item else None
+        context = getattr(item, 'context', None)
+
+        with self._lock:
+            session.failures = 0
+            if context and 'username' in context and session.username is not None and context['username'] is None:
+                self._mark_logged_out(session)
+
+    def _mark_logged_out(self, session):
+        session.healthy = False
+        utils.logger.warning('UserPool: session %r is logged out', session.username)
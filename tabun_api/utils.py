@@ -5,7 +5,10 @@ from __future__ import unicode_literals
 
 import re
 import sys
+import bisect
+import binascii
 import time
+import codecs
 import random
 import logging
 import platform
@@ -35,6 +38,9 @@ youtube_regex = re.compile(r'youtube.com\/embed\/(.{10,15})((\?)|($))')
 #: Регулярка для парсинга ссылки на аватарку — из неё можно узнать много полезного!
 ava_regex = re.compile(r"\/((images)|(storage))\/([0-9]+)\/([0-9]+)\/([0-9]+)\/([0-9]+)\/([0-9]+)\/([0-9]+)\/avatar_([0-9]+)x([0-9]+)\.(...)(\?([0-9]+))?")
 
+# Регулярки для почт CloudFlare оставлены для совместимости: сама
+# replace_cloudflare_emails обходится поиском подстрок без откатов.
+
 #: Регулярка для расшифровки почты, которую шифрует CloudFlare.
 cf_email = re.compile(r'<[A-Za-z]+( href="/cdn-cgi/l/email-protection")? class="__cf_email__".*? data-cfemail="([0-9a-f]+)".+?</[A-Za-z]+>', re.DOTALL)
 
@@ -735,6 +741,225 @@ def find_substring(s, start, end, extend=False, with_start=True, with_end=True):
     return s[f1 + (0 if with_start else len(start)):f2 + (len(end) if with_end else 0)]
 
 
+#: id поста в коде страницы (в блоке с рейтингом)
+topic_id_b = re.compile(b'id="vote_area_topic_([0-9]+)"')
+
+#: id коммента в коде страницы
+comment_id_b = re.compile(b'data-id="([0-9]+)"')
+
+
+def known_id_checker(since_id=None, known_ids=None):
+    """Возвращает функцию, которая для id элемента (поста, коммента)
+    проверяет, известен ли он уже: не больше ли он ``since_id``
+    или нет ли его в коллекции ``known_ids``. Если ни то, ни другое
+    не указано, возвращает None.
+    """
+
+    if since_id is None and not known_ids:
+        return None
+    known_ids = frozenset(int(x) for x in known_ids or ())
+    if since_id is None:
+        return lambda x: x in known_ids
+    since_id = int(since_id)
+    return lambda x: x <= since_id or x in known_ids
+
+
+def cut_known_items(data, start, end, id_regex, is_known):
+    """Для кода списка, в котором новые элементы идут первыми (лента
+    постов, лента комментов): находит первый элемент (начинающийся с ``start``),
+    id которого — первая группа регулярки ``id_regex`` внутри элемента —
+    функция ``is_known`` считает известным, и вырезает его вместе со всеми
+    последующими элементами (до ``end`` после начала последнего). Всё, что
+    стоит после последнего элемента, остаётся на месте.
+
+    Работает с байтами и ничего не парсит, поэтому обходится дешевле
+    экранирования и парсинга тех элементов, которые всё равно не нужны.
+    """
+
+    f = data.find(start)
+    while f >= 0:
+        f2 = data.find(start, f + len(start))
+        m = id_regex.search(data, f, f2 if f2 >= 0 else len(data))
+        if m and is_known(int(m.group(1))):
+            last = data.rfind(start)
+            last_end = data.find(end, last)
+            return data[:f] + (data[last_end + len(end):] if last_end >= 0 else data[:0])
+        f = f2
+    return data
+
+
+def comment_fingerprints(data):
+    """Возвращает словарь ``{id коммента: отпечаток}``, где отпечаток — md5-хэш
+    кода ``<section ...>...</section>`` коммента в ``data`` (bytes). Комменты
+    ищутся по байтам без парсинга; секции без ``data-id`` пропускаются.
+    Используется в :class:`~tabun_api.cache.CommentCache`.
+    """
+
+    result = {}
+    f = data.find(b'<section ')
+    while f >= 0:
+        f2 = data.find(b'</section>', f)
+        if f2 < 0:
+            break
+        m = comment_id_b.search(data, f, data.find(b'>', f))
+        if m:
+            result[int(m.group(1))] = md5(data[f:f2]).digest()
+        f = data.find(b'<section ', f2)
+    return result
+
+
+class StreamingFragmentParser(object):
+    """Инкрементальный аналог связки :func:`find_substring` и
+    :func:`parse_html_fragment`: страница скармливается по кусочкам методом
+    ``feed`` прямо во время скачивания, и lxml строит дерево параллельно
+    с чтением из сети, а не после него.
+
+    Аргументы ``start``, ``end``, ``extend`` и ``with_end`` имеют тот же смысл,
+    что и у ``find_substring``. Найденный кусок страницы отдаётся lxml частями,
+    заканчивающимися на ``unit_end`` (например, ``</article>`` для постов);
+    перед этим к каждой части применяется функция ``preprocess`` (обычно
+    экранирование), поэтому она должна давать тот же результат на частях,
+    что и на всём куске целиком.
+
+    Если указана функция ``on_element``, она вызывается для каждого элемента
+    с тегом ``tag`` сразу, как только lxml его закончил строить (ещё до
+    окончания скачивания страницы). Так можно парсить, например, посты
+    по одному, пока скачиваются следующие.
+
+    Метод ``close`` возвращает то же, что и ``parse_html_fragment``, или None,
+    если нужный кусок страницы не нашёлся. Вся страница целиком доступна
+    через ``get_data``.
+
+    В атрибуте ``layout`` хранится вёрстка (см. :func:`detect_layout`),
+    определённая по уже полученной части куска, или None, пока она неизвестна.
+    """
+
+    def __init__(self, start, end, unit_end, extend=False, with_end=True, preprocess=None, encoding='utf-8', on_element=None, tag=None):
+        self.start = start
+        self.end = end
+        self.unit_end = unit_end
+        self.extend = extend
+        self.with_end = with_end
+        self.preprocess = preprocess
+        self.encoding = encoding
+        self.on_element = on_element
+        self.tag = tag
+        self.layout = None
+
+        self._chunks = []
+        self._pending = b''
+        self._search_from = 0  # откуда искать end в _pending (end не может пересекаться со start)
+        self._started = False
+        self._finished = False
+        self._end_seen = False
+        self._parser = None
+        self._decoder = None
+
+    def feed(self, chunk):
+        """Добавляет очередной кусок страницы (bytes)."""
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        if self._finished:
+            return
+        self._pending += chunk
+
+        if not self._started:
+            f = self._pending.find(self.start)
+            if f < 0:
+                # Начало start могло попасть в конец куска
+                self._pending = self._pending[max(0, len(self._pending) - len(self.start) + 1):]
+                return
+            self._pending = self._pending[f:]
+            self._search_from = len(self.start)
+            self._started = True
+            if self.on_element is not None:
+                self._parser = lxml.etree.HTMLPullParser(events=('end',), tag=self.tag)
+                self._parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+            else:
+                self._parser = lxml.html.HTMLParser()
+            self._decoder = codecs.getincrementaldecoder(self.encoding)('replace')
+            self._parser.feed('<html><body>')
+
+        if not self.extend:
+            f = self._pending.find(self.end, self._search_from)
+            if f >= 0:
+                # Кусок закончился, остаток страницы парсить не нужно
+                self._push(f + (len(self.end) if self.with_end else 0))
+                self._finished = True
+                return
+            limit = max(0, len(self._pending) - len(self.end) + 1)
+
+        else:
+            # При extend=True кусок заканчивается на последнем end на странице:
+            # всё до последнего уже полученного end в него точно входит,
+            # а что после — станет известно только с приходом следующего end
+            f = self._pending.rfind(self.end, self._search_from)
+            if f >= 0:
+                self._end_seen = True
+                self._push(f + (len(self.end) if self.with_end else 0))
+                return
+            limit = max(0, len(self._pending) - len(self.end) + 1)
+
+        # Не отдаём в lxml начало end, которое могло попасть в конец куска
+        cut = self._pending.rfind(self.unit_end, 0, limit)
+        if cut >= 0:
+            self._push(cut + len(self.unit_end))
+
+    def _push(self, pos):
+        data = self._pending[:pos]
+        self._pending = self._pending[pos:]
+        self._search_from = 0
+        if self.layout is None:
+            self.layout = detect_layout(data)
+        if self.preprocess is not None:
+            data = self.preprocess(data)
+        self._parser.feed(self._decoder.decode(data))
+        self._read_events()
+
+    def _read_events(self):
+        if self.on_element is not None:
+            for _, element in self._parser.read_events():
+                self.on_element(element)
+
+    def get_data(self):
+        """Возвращает всю полученную на данный момент страницу (bytes)."""
+        if len(self._chunks) > 1:
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+    def close(self):
+        """Завершает парсинг и возвращает список lxml-элементов и строк
+        или None, если кусок страницы не нашёлся.
+        """
+
+        if not self._started or self._parser is None:
+            return None
+
+        if not self._finished:
+            self._finished = True
+            f = (self._pending.rfind if self.extend else self._pending.find)(self.end, self._search_from)
+            if f >= 0:
+                self._push(f + (len(self.end) if self.with_end else 0))
+            elif not self._end_seen:
+                self._parser.close()
+                self._parser = None
+                return None
+
+        self._parser.feed(self._decoder.decode(b'', True) + '</body></html>')
+        doc = self._parser.close()
+        self._read_events()
+        self._parser = None
+
+        # Как в lxml.html.fragments_fromstring
+        body = doc.find('body')
+        elements = []
+        if body.text and body.text.strip():
+            elements.append(body.text)
+        elements.extend(body)
+        return elements
+
+
 def download(url, maxmem=20 * 1024 * 1024, timeout=5, waitout=15, headers=None):
     """Скачивает данные по ссылке. Имеет защиту от переполнения памяти
     и слишком долгого ожидания, чтобы всякие боты тут не висли.
@@ -844,27 +1069,22 @@ def generate_comments_tree(comms):
     Возвращает само такое дерево и список номеров комментариев-сирот
     (по идее должен быть пустой, но мало ли).
 
+    Ответ на коммент с большим id и коммент, ссылающийся сам на себя,
+    считаются сиротами.
+
+    Оставлена для совместимости: это обёртка над
+    :class:`~tabun_api.tree.CommentTree` с ``strict_order=True``. Само дерево
+    можно пополнять, не строя его заново.
+
     :param comms: словарь комментариев
     :type comms: {id: :func:`~tabun_api.Comment`}
     :rtype: (list, list)
     """
 
-    tree_dict = {}
-    tree = []
-    orphans = []
-    for comment in sorted(comms.values(), key=lambda x: x.comment_id):
-        item = (comment, [])
-        tree_dict[comment.comment_id] = item
-        if not comment.parent_id:
-            tree.append(item)
-            continue
-        parent = tree_dict.get(comment.parent_id)
-        if not parent:
-            tree.append(item)
-            orphans.append(comment.comment_id)
-        else:
-            parent[1].append(item)
-    return tree, orphans
+    from .tree import CommentTree
+
+    tree = CommentTree(comms, strict_order=True)
+    return tree.as_lists(), tree.orphans
 
 
 def parse_avatar_url(url):
@@ -891,15 +1111,17 @@ def parse_avatar_url(url):
 
 
 def decode_cf_email(data):
-    key = int(data[0:2], 16)
+    """Расшифровывает почту из атрибута ``data-cfemail`` (или ссылки
+    ``/cdn-cgi/l/email-protection#``): первый байт — ключ, остальные
+    поксорены с ним.
+    """
+
     use_bytes = not isinstance(data, text)
-    result = b''
-    for i in range(1, len(data) // 2):
-        b = int(data[i * 2:i * 2 + 2], 16) ^ key
-        if PY2:
-            result += chr(b)
-        else:
-            result += bytes([b])
+    raw = bytearray(binascii.unhexlify(data[:len(data) // 2 * 2]))
+    key = raw[0] if raw else 0
+    for i in range(1, len(raw)):
+        raw[i] ^= key
+    result = bytes(raw[1:])
     return result if use_bytes else result.decode('utf-8')
 
 
@@ -921,25 +1143,189 @@ def decode_cf_email_for_link(m):
     return result
 
 
+_cf_hex_run = re.compile(b'[0-9a-f]*')
+_cf_close_tag = re.compile(b'</[A-Za-z]+>')
+_cf_a_open = re.compile(b'<[Aa][ \t\n\r\f\v]')
+_cf_letters = frozenset(bytes(bytearray([x])) for x in bytearray(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'))
+_cf_spaces = frozenset(bytes(bytearray([x])) for x in bytearray(b' \t\n\r\f\v'))
+
+
+def _replace_cf_email_texts(data):
+    # То же, что cf_email_b.sub, но поиском от атрибута class
+    marker = b' class="__cf_email__"'
+    href = b' href="/cdn-cgi/l/email-protection"'
+    if b' data-cfemail="' not in data:
+        return data
+
+    buf = []
+    last_end = 0
+    pos = 0
+    while True:
+        c = data.find(marker, pos)
+        if c < 0:
+            break
+        pos = c + 1
+
+        # Перед class должен быть <tag или <tag href="..."
+        e = c - len(href) if data.endswith(href, last_end, c) else c
+        s = e
+        while s > last_end + 1 and data[s - 1:s] in _cf_letters:
+            s -= 1
+        if s == e or s - 1 < last_end or data[s - 1:s] != b'<':
+            continue
+
+        # Первый подходящий data-cfemail после class
+        q = c + len(marker)
+        while True:
+            d = data.find(b' data-cfemail="', q)
+            if d < 0:
+                # Дальше совпадений не будет вообще
+                break
+            h1 = d + 15
+            h2 = _cf_hex_run.match(data, h1).end()
+            if h2 > h1 and data[h2:h2 + 1] == b'"':
+                break
+            q = d + 1
+        if d < 0:
+            break
+
+        m = _cf_close_tag.search(data, h2 + 2)
+        if m is None:
+            break
+
+        buf.append(data[last_end:s - 1])
+        buf.append(decode_cf_email(data[h1:h2]))
+        last_end = pos = m.end()
+
+    if not buf:
+        return data
+    buf.append(data[last_end:])
+    return b''.join(buf)
+
+
+def _replace_cf_email_links(data):
+    # То же, что cf_email_a_b.sub(decode_cf_email_for_link, ...), но поиском
+    # от href; каждый тег просматривается один раз
+    marker = b'href="/cdn-cgi/l/email-protection#'
+    if marker not in data:
+        return data
+
+    buf = []
+    last_end = 0
+    pos = 0
+    while True:
+        m = data.find(marker, pos)
+        if m < 0:
+            break
+        g = data.find(b'>', m)
+        if g < 0:
+            break
+        lo = max(last_end, data.rfind(b'>', last_end, m) + 1)
+        pos = g + 1
+
+        # Как и регулярка, берём последнюю подходящую ссылку в теге
+        best = None
+        while 0 <= m < g:
+            h1 = m + len(marker)
+            h2 = _cf_hex_run.match(data, h1).end()
+            if h2 > h1 and data[h2:h2 + 1] == b'"' and (h2 + 1 == g or data[h2 + 1:h2 + 2] in _cf_spaces):
+                best = (m, h1, h2)
+            m = data.find(marker, m + 1)
+        if best is None:
+            continue
+        m, h1, h2 = best
+
+        a = _cf_a_open.search(data, lo, m)
+        if a is None:
+            continue
+
+        buf.extend((
+            data[last_end:a.start()],
+            b'<a ', data[a.end():m],
+            b'href="mailto:', decode_cf_email(data[h1:h2]),
+            b'"', data[h2 + 1:g],
+            b'>',
+        ))
+        last_end = g + 1
+
+    if not buf:
+        return data
+    buf.append(data[last_end:])
+    return b''.join(buf)
+
+
+def _remove_cf_email_scripts(data):
+    # То же, что cf_email_s_b.sub(b'', ...): <script, 1-2048 любых байт,
+    # getAttribute(.data-cfemail.), 1-2048 байт, </script>. Позиции
+    # вызовов и </script> собираются заранее, так что на каждый <script>
+    # тратится ограниченное время
+    calls = []
+    d = data.find(b'data-cfemail')
+    while d >= 0:
+        if d >= 14 and data[d - 14:d - 1] == b'getAttribute(' and data[d + 13:d + 14] == b')':
+            calls.append(d - 14)
+        d = data.find(b'data-cfemail', d + 1)
+    if not calls:
+        return data
+
+    ends = []
+    f = data.find(b'</script>')
+    while f >= 0:
+        ends.append(f)
+        f = data.find(b'</script>', f + 1)
+
+    buf = []
+    last_end = 0
+    pos = 0
+    while ends:
+        p = data.find(b'<script', pos)
+        if p < 0:
+            break
+        pos = p + 1
+
+        # Квантификаторы жадные, поэтому перебираем с конца
+        end = None
+        i1 = bisect.bisect_left(calls, p + 8)
+        i2 = bisect.bisect_right(calls, p + 7 + 2048)
+        for i in range(i2 - 1, i1 - 1, -1):
+            call_end = calls[i] + 28
+            j = bisect.bisect_right(ends, call_end + 2048) - 1
+            if j >= 0 and ends[j] > call_end:
+                end = ends[j] + 9
+                break
+        if end is None:
+            continue
+
+        buf.append(data[last_end:p])
+        last_end = pos = end
+
+    if not buf:
+        return data
+    buf.append(data[last_end:])
+    return b''.join(buf)
+
+
 def replace_cloudflare_emails(data):
-    """Декодирует почты, которые зашифровал CloudFlare, в html-странице."""
+    """Декодирует почты, которые зашифровал CloudFlare, в html-странице.
+
+    Страница просматривается поиском подстрок за линейное время; если
+    на ней нет следов CloudFlare, она возвращается как есть.
+    """
 
     is_text = isinstance(data, text)
+    if is_text:
+        data = data.encode('utf-8')
 
     # В текстах
-    r = cf_email if is_text else cf_email_b
-    result = r.sub(lambda x: decode_cf_email(x.groups()[1]), data)
+    result = _replace_cf_email_texts(data)
 
     # В ссылках
-    ra = cf_email_a if is_text else cf_email_a_b
-    result = ra.sub(decode_cf_email_for_link, result)
+    result = _replace_cf_email_links(result)
 
     # Убираем <script>
+    result = _remove_cf_email_scripts(result)
 
-    rs = cf_email_s if is_text else cf_email_s_b
-    result = rs.sub('' if is_text else b'', result)
-
-    return result
+    return result.decode('utf-8') if is_text else result
 
 
 def normalize_body(body=None, raw_body=None, cls='text'):
@@ -966,36 +1352,50 @@ def normalize_body(body=None, raw_body=None, cls='text'):
     return body, text(raw_body) if raw_body is not None else None
 
 
+_html_escape_table = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'))
+_html_escape_tables = {
+    (text, False): _html_escape_table,
+    (text, True): _html_escape_table + (("'", '&#39;'),),
+    (binary, False): tuple((a.encode('ascii'), b.encode('ascii')) for a, b in _html_escape_table),
+    (binary, True): tuple((a.encode('ascii'), b.encode('ascii')) for a, b in _html_escape_table + (("'", '&#39;'),)),
+}
+
+
 def html_escape(s, single_quote=False):
     """Заменяет на html-сущности следующие символы:
     ``&``, ``<``, ``>``, ``"``.
     При ``single_quote=True`` ещё и ``'`` на ``&#39;``.
     """
 
-    table = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')]
-    if single_quote:
-        table.append(("'", '&#39;'))
-    if isinstance(s, binary):
-        table = [(a.encode('ascii'), b.encode('ascii')) for a, b in table]
-
-    for a, b in table:
-        s = s.replace(a, b)
+    for a, b in _html_escape_tables[binary if isinstance(s, binary) else text, bool(single_quote)]:
+        if a in s:
+            s = s.replace(a, b)
     return s
 
 
-def escape_topic_contents(data, may_be_short=False):
-    """
-    Экранирует содержимое постов и личных сообщений для защиты от поехавшей
-    вёрстки и багов lxml.
-    """
-    if not isinstance(data, binary):
-        # '\xa0'.strip() => ''
-        # b'\xa0'.strip() => b'\xa0' — придерживаюсь этого варианта
-        raise ValueError('data should be bytes')
+def _apply_edits(data, edits):
+    # Собирает страницу из кусков исходника и замен (start, end, replacement),
+    # отсортированных и не пересекающихся; копируется всё ровно один раз
+    if not edits:
+        return data
+    view = data if PY2 else memoryview(data)
+    buf = []
+    last_end = 0
+    for start, end, replacement in edits:
+        buf.append(view[last_end:start])
+        buf.append(replacement)
+        last_end = end
+    buf.append(view[last_end:])
+    return b''.join(buf)
+
+
+def _find_topic_bodies(data, may_be_short=False, light=False):
+    # Возвращает список замен (start, end, replacement) для тел постов;
+    # при light=True тела выкидываются вместо экранирования
+    edits = []
     f1 = 0
     f2 = 0
     last_end = 0
-    buf = []
     while True:
         # определяем границы тела очередного поста/сообщения
         f1 = data.find(b'<div class="topic-content text">', last_end)
@@ -1041,48 +1441,58 @@ def escape_topic_contents(data, may_be_short=False):
         if body.startswith(b'<header'):
             body = body[body.find(b'</header>') + 9:].lstrip()
 
-        # экранируем тело
-        body = html_escape(body)
-
-        # собираем страницу обратно
-        buf.extend((
-            data[last_end:f1],
+        # экранируем тело и собираем его обратно
+        edits.append((f1, f2 + 6, b''.join((
             ('<div class="topic-content text" data-escaped="1" data-short="%s" data-short-text="%s">' % (
                 1 if short is not None else 0, short.decode('utf-8') if short is not None else ''
             )).encode('utf-8'),
-            body,
-            b'</div>'
-        ))
+            html_escape(body) if not light else b'',
+            b'</div>',
+        ))))
         last_end = f2 + 6
 
-    buf.append(data[last_end:])
-    return b''.join(buf)
+    return edits
 
 
-def escape_comment_contents(data):
-    """Экранирует содержимое комментов."""
-    if not isinstance(data, binary):
-        raise ValueError('data should be bytes')
+def _find_comment_bodies(data, skip=(), light=False):
+    # Возвращает список замен (start, end, replacement) для текстов комментов.
+    # Области skip (уже найденные тела постов) при поиске пропускаются так,
+    # будто они уже экранированы; если какой-то section их пересекает,
+    # возвращает None. При light=True тексты выкидываются
+    skip_starts = [x[0] for x in skip]
+
+    def find_section(sub, pos):
+        while True:
+            f = data.find(sub, pos)
+            if f < 0 or not skip:
+                return f
+            i = bisect.bisect_right(skip_starts, f) - 1
+            if i < 0 or f >= skip[i][1]:
+                return f
+            pos = skip[i][1]
+
+    edits = []
     f1 = 0
     f2 = 0
     last_end = 0
-    buf = []
 
     while True:
         # определяем границы очередного коммента
-        sect_start = data.find(b'<section', last_end)
+        sect_start = find_section(b'<section', last_end)
         if sect_start < 0:
             break
-        sect_end = data.find(b'</section>', sect_start)
+        sect_end = find_section(b'</section>', sect_start)
         if sect_end < 0:
             break
+        if skip:
+            i = bisect.bisect_right(skip_starts, sect_start)
+            if i < len(skip) and skip_starts[i] < sect_end:
+                return None
 
-        prev_last_end = last_end
         last_end = sect_end
 
         if data.find(b'class="comment ', sect_start, sect_end) < 0 and data.find(b'class="comment"', sect_start, sect_end) < 0 and data.find(b'class="comment\n', sect_start, sect_end) < 0:
             # не коммент
-            buf.append(data[prev_last_end:last_end])
             continue
 
         # Выделяем текст коммента
@@ -1096,7 +1506,6 @@ def escape_comment_contents(data):
             del f
         if f1 < 0:
             # Коммент без текста? (Возможно, удалённый или скрытый)
-            buf.append(data[prev_last_end:last_end])
             continue
 
         # После текста коммента всегда идёт блок с информацией о комменте
@@ -1114,23 +1523,89 @@ def escape_comment_contents(data):
             f2 = data.rfind(b'</div>', f1, f2)
         if f2 < 0:
             logger.warning('Cannot find </div></div> in escape_comment_contents! Please report to andreymal.')
-            buf.append(data[prev_last_end:last_end])
             continue
 
         # экранируем тело
+        if light:
+            edits.append((f1, f2, b'<div class="text" data-escaped="1">'))
+            continue
         body = data[data.find(b'>', f1, f2) + 1:f2].strip()
-        body = html_escape(body)
+        edits.append((f1, f2, b'<div class="text" data-escaped="1">' + html_escape(body)))
 
-        # собираем страницу обратно
-        buf.extend((
-            data[prev_last_end:f1],
-            b'<div class="text" data-escaped="1">',
-            body,
-            data[f2:last_end]
-        ))
+    return edits
 
-    buf.append(data[last_end:])
-    return b''.join(buf)
+
+def escape_topic_contents(data, may_be_short=False):
+    """
+    Экранирует содержимое постов и личных сообщений для защиты от поехавшей
+    вёрстки и багов lxml.
+    """
+    if not isinstance(data, binary):
+        # '\xa0'.strip() => ''
+        # b'\xa0'.strip() => b'\xa0' — придерживаюсь этого варианта
+        raise ValueError('data should be bytes')
+    return _apply_edits(data, _find_topic_bodies(data, may_be_short))
+
+
+def escape_comment_contents(data):
+    """Экранирует содержимое комментов."""
+    if not isinstance(data, binary):
+        raise ValueError('data should be bytes')
+    return _apply_edits(data, _find_comment_bodies(data))
+
+
+def preprocess_page(data, may_be_short=False, comments=True, light=False):
+    """Подготавливает страницу к парсингу: декодирует почты CloudFlare,
+    экранирует тела постов и (при ``comments=True``) комментов. Результат
+    тот же, что у цепочки ``replace_cloudflare_emails``,
+    ``escape_topic_contents`` и ``escape_comment_contents``, но страница
+    копируется один раз, а не после каждого шага.
+
+    При ``light=True`` тела постов и комментов не экранируются, а выкидываются
+    совсем (остаются пустые ``div`` с ``data-escaped="1"``): так lxml не тратит
+    время на их парсинг, если нужны только заголовки.
+    """
+
+    if not isinstance(data, binary):
+        raise ValueError('data should be bytes')
+    data = replace_cloudflare_emails(data)
+
+    edits = _find_topic_bodies(data, may_be_short, light)
+    if comments:
+        comment_edits = _find_comment_bodies(data, edits, light)
+        if comment_edits is None:
+            # Вёрстка поехала так, что section пересекает тело поста;
+            # делаем всё по отдельности, как раньше
+            data = _apply_edits(data, edits)
+            return _apply_edits(data, _find_comment_bodies(data, light=light))
+        if comment_edits:
+            edits = sorted(edits + comment_edits)
+    return _apply_edits(data, edits)
+
+
+#: Фрагменты разметки, по которым :func:`detect_layout` узнаёт вёрстку страницы.
+layout_markers = (
+    ('new', (b'user-with-avatar', b'blog-title-wrapper')),
+    ('old', (b'rel="author"', b'topic-blog', b'comment-author', b'class="profile-left"', b'<span class="date"')),
+)
+
+
+def detect_layout(data):
+    """Определяет вёрстку Табуна по куску страницы (байтовой строке):
+    ``'new'`` для новой (2025–2026), ``'old'`` для старой или None,
+    если на странице нет ни одного из маркеров ``layout_markers``
+    (например, она пустая).
+
+    Парсеры сначала пробуют селекторы определённой здесь вёрстки и только
+    при неудаче — другой, поэтому ошибка определения не ломает парсинг,
+    а лишь замедляет его (см. :func:`tabun_api.xpaths.select`).
+    """
+
+    for layout, markers in layout_markers:
+        for marker in markers:
+            if marker in data:
+                return layout
+    return None
 
 
 def escape_blog_content(data):
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from lxml import etree
+
+
+__all__ = ['XPathGroup', 'select', 'post', 'comment', 'activity', 'blogs_list', 'profile', 'stream_topics', 'page']
+
+
+class XPathGroup(object):
+    """Группа скомпилированных XPath-выражений, используемых парсерами.
+
+    Каждое выражение доступно как атрибут — объект ``lxml.etree.XPath``,
+    который вызывается с элементом вместо ``element.xpath('...')``
+    и не компилируется заново при каждом вызове. Вложенные группы ``new``
+    и ``old`` содержат выражения, специфичные для новой (2025–2026)
+    и старой вёрстки Табуна. Исходные строки выражений лежат в словаре
+    ``expressions``.
+
+    Когда Табун меняет вёрстку, селектор можно заменить методом ``set``
+    (или просто поправить его в этом модуле).
+    """
+
+    def __init__(self, name, **items):
+        self.name = name
+        self.expressions = {}
+        for key, value in items.items():
+            if isinstance(value, XPathGroup):
+                setattr(self, key, value)
+            else:
+                self.set(key, value)
+
+    def __repr__(self):
+        return '<tabun_api.xpaths.XPathGroup {}>'.format(self.name)
+
+    def set(self, key, expression):
+        """Компилирует и сохраняет выражение под именем ``key``."""
+        self.expressions[key] = expression
+        setattr(self, key, etree.XPath(expression))
+
+
+def select(group, key, node, layout=None):
+    """Вычисляет выражение ``key`` сначала из подгруппы вёрстки ``layout``
+    (``new`` или ``old``, по умолчанию ``new``), а если оно ничего не нашло —
+    из другой. Возвращает кортеж из названия сработавшей вёрстки (или None,
+    если не нашлось ничего) и результата.
+
+    Так на странице, вёрстка которой известна (см. :func:`tabun_api.utils.detect_layout`),
+    выражения другой вёрстки не вычисляются вовсе.
+    """
+
+    order = ('old', 'new') if layout == 'old' else ('new', 'old')
+    result = []
+    for name in order:
+        result = getattr(getattr(group, name), key)(node)
+        if result:
+            return name, result
+    return None, result
+
+
+#: Посты (``parse_post``).
+post = XPathGroup(
+    'post',
+    vote_area='.//*[@class="topic-info-vote"]//*[starts-with(@id, "vote_area_topic_")][1]',
+    vote_count='.//*[@class="topic-info-vote"]//*[@class="vote-item vote-count"][1]',
+    draft='.//*[@class="topic-draft"]',
+    draft_icon='i[@class="icon-synio-topic-draft"]',
+    body='div[@class="topic-content text"]',
+    body_header='header[@class="topic-header"]',
+    body_cut='a[@title="Читать дальше"][1]',
+    cut_link='.//a[@class="topic-cut-link"]',
+    favourite_tags='*[starts-with(@class, "topic-tags-user")]',
+    tags_edit='span[starts-with(@class, "topic-tags-edit")]',
+    poll='div[@class="poll"]',
+    favourite='*[@class="topic-info"]//*[starts-with(@class, "topic-info-favourite")]',
+    new=XPathGroup(
+        'post.new',
+        author='.//*[starts-with(@class, "user-with-avatar")]//*[starts-with(@class, "nickname")][1]',
+        blog='.//a[contains(@class, "blog-title-wrapper")]',
+        blog_closed='.//span[contains(@class, "blog-type-closed")]',
+        user_secondary='.//span[contains(@class, "user-with-avatar")]/span[contains(@class, "secondary-line")]',
+        time='*[@class="topic-info"]//time[@class="topic-info-date"]',
+    ),
+    old=XPathGroup(
+        'post.old',
+        author='.//a[@rel="author"][1]',
+        blog='.//a[contains(@class, "topic-blog")]',
+        time='ul[@class="topic-info"]/li[@class="topic-info-date"]/time',
+        favourited='*[@class="favourite link-dotted active"]',
+        favourite_count='span[@class="favourite-count"]/text()',
+    ),
+)
+
+#: Комменты (``parse_comment`` и ``parse_deleted_comment``).
+comment = XPathGroup(
+    'comment',
+    info='.//*[@class="comment-info"][1]',
+    vote_area='.//*[starts-with(@id, "vote_area_comment")][1]',
+    vote_up='.//div[contains(@class, "vote-up")]',
+    vote_count='.//span[@class="vote-count"]/text()[1]',
+    time='.//time[1]',
+    body='div[@class="comment-content"][1]/div[1]',
+    blog_link='.//a[@class="blog-name"][1]',
+    post_title='a[@class="comment-path-topic"]',
+    post_link='a[@class="comment-path-comments"]',
+    parent_link='.//a[@class="goto goto-comment-parent"][1]',
+    edit_button='.//*[contains(@class, "comment-edit-bw")][1]',
+    deleted_favourited='.//*[@class="comment-favourite favorite active"]',
+    new=XPathGroup(
+        'comment.new',
+        author='.//*[starts-with(@class, "user-with-avatar")]',
+        nickname='.//*[starts-with(@class, "nickname")]/text()',
+        favourite='.//*[starts-with(@class, "comment-favourite favorite")]',
+    ),
+    old=XPathGroup(
+        'comment.old',
+        author='.//a[starts-with(@class, "comment-author")][1]',
+        favourite='.//*[@class="comment-favourite"][1]',
+        unknown_vote_area='.//ul[@class="comment-info"]/li[starts-with(@id, "vote_area_comment")]',
+    ),
+)
+
+#: Элементы ленты активности (``parse_activity``).
+activity = XPathGroup(
+    'activity',
+    link='a[2]',
+    text='div/text()',
+    user_link_text='span/a[2]/text()',
+    username='p[@class="info"]/a/strong/text()[1]',
+    new=XPathGroup(
+        'activity.new',
+        time='p[@class="info"]/time',
+    ),
+    old=XPathGroup(
+        'activity.old',
+        time='p[@class="info"]/span[@class="date"]',
+    ),
+)
+
+#: Список блогов (``get_blogs_list``).
+blogs_list = XPathGroup(
+    'blogs_list',
+    readers='td[@class="cell-readers"]',
+    new=XPathGroup(
+        'blogs_list.new',
+        name_cell='td[@class="cell-name"]/span[starts-with(@class, "blog-link-with-avatar")]',
+        avatar='./a[@class="avatar"]/img',
+        link='.//a[starts-with(@class, "blog-title-wrapper")]',
+        closed='span[contains(@class, "blog-type-closed")]',
+        creator='.//span[@class="nickname"]',
+        topics='td[@class="cell-topics"]',
+    ),
+    old=XPathGroup(
+        'blogs_list.old',
+        name_cell='td[@class="cell-name"]/p',
+        closed='i[@class="icon-synio-topic-private"]',
+        creator='td[@class="cell-name"]/span[@class="user-avatar"]/a',
+    ),
+)
+
+#: Профиль пользователя (``get_profile``).
+profile = XPathGroup(
+    'profile',
+    profile='div[@class="profile"]',
+    photo='.//img[@itemprop="photo"][1]',
+    username='.//h2[@itemprop="nickname"]/text()',
+    realname='.//p[@class="user-name"]/text()',
+    strength='.//div[@class="strength"]/div[1]/text()',
+    vote_area='.//*[@class="vote-profile"]//*[starts-with(@id, "vote_area_user_")]',
+    # Вызывается с аргументом id="vote_total_user_<user_id>"
+    vote_total='.//*[@id=$id]/text()',
+    vote_label='.//*[@class="vote-profile"]//*[@class="vote-label"]',
+    profile_403='div[@class="profile-403"]',
+    profile_403_message='.//h2/text()',
+    about='.//div[contains(@class, "profile-info-about")]',
+    about_text='div[@class="text"]',
+    contact_lists='.//ul[@class="profile-contact-list"]',
+    foto='//img[@id="foto-img"]',
+    nav_items='section/ul[@class="nav nav-profile"]/li',
+    note='//p[@id="usernote-note-text"]',
+    new=XPathGroup(
+        'profile.new',
+        items='.//ul[@class="profile-dotted-list"]/li',
+    ),
+    old=XPathGroup(
+        'profile.old',
+        items='div[@class="wrapper"]/div[@class="profile-left"]/ul[@class="profile-dotted-list"]/li',
+    ),
+)
+
+#: Прямой эфир постов (``get_stream_topics``).
+stream_topics = XPathGroup(
+    'stream_topics',
+    new=XPathGroup(
+        'stream_topics.new',
+        items='.//div[@class="small-list-topic-entry"]',
+        blog='.//a[contains(@class, "blog-title-wrapper")]',
+        blog_closed='.//span[contains(@class, "blog-type-closed")]',
+        title='.//a[contains(@class, "topic-entry-title")]',
+        comments='.//a[contains(@class, "topic-comments-counter")]',
+        user_with_avatar='.//*[starts-with(@class, "user-with-avatar")]',
+        nickname='.//*[starts-with(@class, "nickname")]/text()',
+        time='.//time[@class="topic-entry-date"]',
+    ),
+    old=XPathGroup(
+        'stream_topics.old',
+        items='./ul[@class="latest-list"]/li',
+    ),
+)
+
+#: Страница целиком (``PageDocument``).
+page = XPathGroup(
+    'page',
+    comments='(//div[starts-with(@class, "comments")])[1]',
+)
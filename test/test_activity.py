@@ -12,7 +12,7 @@ import pytest
 import tabun_api as api
 from tabun_api.compat import text
 
-from testutil import load_file, set_mock, user
+from testutil import UserTest, load_file, set_mock, user
 
 
 def test_get_activity_tabun(user):
@@ -30,6 +30,14 @@ def test_get_activity_tabun(user):
                 assert getattr(item, key) == value
 
 
+def test_get_activity_streaming():
+    user = UserTest(streaming=True)
+    user.stream_chunk_size = 100
+    last_id, items = user.get_activity()
+    assert last_id == 15000
+    assert [(x.type, x.post_id, x.comment_id) for x in items] == [(x.type, x.post_id, x.comment_id) for x in UserTest().get_activity()[1]]
+
+
 def test_get_activity_livestreet(user, set_mock):
     set_mock({'/stream/all/': 'activity_ls.html'})
     items_data = json.loads(load_file('activity_items.json', template=False).decode('utf-8'))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import sys
+import time
+
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip('tabun_api.aio requires Python 3.5+', allow_module_level=True)
+
+import asyncio
+
+from tabun_api.aio import AsyncUser
+from tabun_api.compat import text
+
+from testutil import UserTest, set_mock, form_intercept, user
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('parse_in_executor', [False, True])
+def test_async_get_posts(user, parse_in_executor):
+    auser = AsyncUser(user, parse_in_executor=parse_in_executor)
+    posts = run(auser.get_posts('/blog/132085.html'))
+    expected = user.get_posts('/blog/132085.html')
+    assert [x.post_id for x in posts] == [x.post_id for x in expected]
+    assert [x.raw_body for x in posts] == [x.raw_body for x in expected]
+
+
+def test_async_get_post_and_comments(user):
+    auser = AsyncUser(user)
+    post, comments = run(auser.get_post_and_comments(138982, 'borderline'))
+    expected_post, expected_comments = user.get_post_and_comments(138982, 'borderline')
+    assert post.post_id == expected_post.post_id == 138982
+    assert post.blog == expected_post.blog == 'borderline'
+    assert post.comments_count == expected_post.comments_count
+    assert sorted(comments.keys()) == sorted(expected_comments.keys())
+    assert [x.blog for x in comments.values()] == [x.blog for x in expected_comments.values()]
+
+
+def test_async_get_comments_via_ajax(user, set_mock):
+    from test_comments import build_ajax_comments, build_comments_page
+
+    set_mock({'/blog/ajaxresponsecomment/': (None, {'data': build_ajax_comments(20)})})
+    auser = AsyncUser(user)
+    comments = run(auser.get_comments('/blog/news/132085.html', via='ajax'))
+    assert sorted(comments) == list(range(1, 21))
+    assert comments[6].parent_id == 3
+    assert comments[6].context['via'] == 'ajax'
+
+    post, comments = run(auser.get_post_and_comments(132085, comments_via='ajax'))
+    assert post.context['comments_via'] == 'ajax'
+    assert sorted(comments) == list(range(1, 21))
+
+    post, comments = run(auser.get_post_and_comments(132085, raw_data=build_comments_page(10), comments_via='ajax'))
+    assert post.context['comments_via'] == 'page'
+    assert sorted(comments) == list(range(1, 11))
+
+
+def test_async_get_comments_via_ajax_fallback(user, set_mock):
+    from test_comments import build_comments_page
+
+    set_mock({
+        '/blog/132085.html': (None, {'data': build_comments_page(10)}),
+        '/blog/ajaxresponsecomment/': (None, {'data': b'{"sMsgTitle": "", "sMsg": "Error", "bStateError": true}'}),
+    })
+    auser = AsyncUser(user)
+    comments = run(auser.get_comments('/blog/132085.html', via='ajax'))
+    assert sorted(comments) == list(range(1, 11))
+    assert comments[1].context['via'] == 'page'
+
+
+def test_async_get_activity(user):
+    auser = AsyncUser(user)
+    assert run(auser.get_activity()) == user.get_activity()
+
+
+def test_async_vote(form_intercept, set_mock, user):
+    set_mock({'/ajax/vote/topic/': (None, {'data': b'{"iRating": 5, "sMsgTitle": "", "sMsg": "", "bStateError": false}'})})
+
+    @form_intercept('/ajax/vote/topic/')
+    def vote(data, headers):
+        assert headers.get('x-requested-with') == b'XMLHttpRequest'
+        assert [text(x) for x in data.get('security_ls_key')] == ['0123456789abcdef0123456789abcdef']
+        assert [text(x) for x in data.get('idTopic')] == ['132085']
+        assert [text(x) for x in data.get('value')] == ['1']
+
+    auser = AsyncUser(user)
+    assert run(auser.vote(132085, 1)) == 5
+
+
+def test_async_query_interval(user):
+    user.query_interval = 0.05
+    auser = AsyncUser(user)
+
+    async def fetch_all():
+        return await asyncio.gather(*[auser.urlread('/') for _ in range(4)])
+
+    tm = time.time()
+    result = run(fetch_all())
+    tm = time.time() - tm
+
+    assert len(result) == 4
+    assert all(x == result[0] for x in result)
+    # Первый запрос сразу, остальные три — с паузой
+    assert tm >= 0.15
+    # Синхронная пауза через sleep_func не используется
+    assert user.sleeps == [0, 0.0]
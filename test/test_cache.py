@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import os
+import time
+import shutil
+import tempfile
+
+import pytest
+
+import tabun_api as api
+from tabun_api.cache import ResponseCache, CacheEntry, CommentCache
+
+from testutil import UserTest, intercept, set_mock, user
+
+
+@pytest.fixture(scope='function')
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture(scope='function')
+def tmpdir_path():
+    path = tempfile.mkdtemp()
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+def count_requests(intercept, url):
+    calls = []
+
+    @intercept(url)
+    def handler(data, headers):
+        calls.append(headers)
+
+    return calls
+
+
+def test_cache_hit(intercept):
+    user = UserTest(response_cache=ResponseCache(default_ttl=60))
+    calls = count_requests(intercept, '/comments/')
+    data1 = user.urlread('/comments/')
+    data2 = user.urlread('/comments/')
+    assert data1 == data2
+    assert len(calls) == 1
+    assert user.response_cache.stats['hits'] == 1
+    assert user.response_cache.stats['misses'] == 1
+
+    # Парсеры тоже используют кэш
+    calls = count_requests(intercept, '/blog/138983.html')
+    post1 = user.get_post(138983)
+    post2 = user.get_post(138983)
+    assert len(calls) == 1
+    assert post1.post_id == post2.post_id == 138983
+
+
+def test_cache_post_requests_not_cached(intercept):
+    user = UserTest(response_cache=ResponseCache())
+    calls = count_requests(intercept, '/comments/')
+    user.urlread('/comments/', data=b'')
+    user.urlread('/comments/', data=b'')
+    user.urlread('/comments/', headers={'X-Foo': 'bar'})
+    assert len(calls) == 3
+    assert len(user.response_cache) == 0
+
+
+def test_cache_ttl_rules(intercept, clock):
+    cache = ResponseCache(default_ttl=10, ttl_rules=[(r'/comments/', 0), (r'/stream/', 100)])
+    user = UserTest(response_cache=cache)
+    assert cache.get_ttl(api.http_host + '/comments/') == 0
+    assert cache.get_ttl(api.http_host + '/stream/all/') == 100
+    assert cache.get_ttl(api.http_host + '/') == 10
+
+    comments_calls = count_requests(intercept, '/comments/')
+    stream_calls = count_requests(intercept, '/stream/all/')
+    index_calls = count_requests(intercept, '/')
+    for _ in range(2):
+        user.urlread('/comments/')
+        user.urlread('/stream/all/')
+        user.urlread('/')
+    assert (len(comments_calls), len(stream_calls), len(index_calls)) == (2, 1, 1)
+
+    clock[0] += 50
+    user.urlread('/stream/all/')
+    user.urlread('/')
+    assert (len(stream_calls), len(index_calls)) == (1, 2)
+
+
+def test_cache_sessions(intercept):
+    cache = ResponseCache()
+    user1 = UserTest(response_cache=cache)
+    user2 = UserTest(session_id='00000000000000000000000000000000', security_ls_key='0123456789abcdef0123456789abcdef', response_cache=cache)
+    calls = count_requests(intercept, '/comments/')
+    user1.urlread('/comments/')
+    user2.urlread('/comments/')
+    user1.urlread('/comments/', with_cookies=False)
+    user2.urlread('/comments/', with_cookies=False)
+    assert len(calls) == 3
+
+
+def test_cache_revalidation(set_mock, intercept, clock):
+    user = UserTest(response_cache=ResponseCache(default_ttl=10))
+    set_mock({'/comments/': ('comments.html', {'headers': {'ETag': '"abc"', 'Last-Modified': 'Sat, 17 Oct 2026 00:00:00 GMT'}})})
+    calls = count_requests(intercept, '/comments/')
+    data = user.urlread('/comments/')
+    assert 'if-none-match' not in calls[0]
+
+    clock[0] += 20
+    set_mock({'/comments/': (None, {'status': 304, 'status_msg': 'Not Modified', 'data': b''})})
+    assert user.urlread('/comments/') == data
+    assert calls[1]['if-none-match'] == b'"abc"'
+    assert calls[1]['if-modified-since'] == b'Sat, 17 Oct 2026 00:00:00 GMT'
+    assert user.response_cache.stats['revalidated'] == 1
+
+    # После подтверждения страница снова свежая
+    assert user.urlread('/comments/') == data
+    assert len(calls) == 2
+
+
+def test_cache_revalidation_error_304(set_mock, intercept, clock):
+    # Настоящий urllib выкидывает HTTPError на 304
+    user = UserTest(response_cache=ResponseCache(default_ttl=10))
+    cache_key = ResponseCache.make_key(user.get_session_identity(), api.http_host + '/comments/')
+    user.response_cache.set(cache_key, CacheEntry(api.http_host + '/comments/', b'cached', 0, 0, etag='"abc"'))
+
+    def fetch(headers):
+        assert headers == {'If-None-Match': '"abc"'}
+        raise api.TabunError(code=304)
+
+    assert user.response_cache.fetch(cache_key, api.http_host + '/comments/', fetch) == (api.http_host + '/comments/', b'cached')
+
+    def fetch_error(headers):
+        raise api.TabunError(code=502)
+
+    user.response_cache.set(cache_key, CacheEntry(api.http_host + '/comments/', b'cached', 0, 0, etag='"abc"'))
+    with pytest.raises(api.TabunError):
+        user.response_cache.fetch(cache_key, api.http_host + '/comments/', fetch_error)
+
+
+def test_cache_lru():
+    cache = ResponseCache(max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, CacheEntry(key, b'x' * 10, 0, 0))
+    assert cache.get('a') is None
+    assert cache.get('b') is not None  # теперь «c» дольше всех не использовался
+    cache.set('d', CacheEntry('d', b'x' * 10, 0, 0))
+    assert cache.get('c') is None
+    assert cache.get('b') is not None
+    assert cache.stats['evictions'] == 2
+    assert cache.size == 20
+
+    cache = ResponseCache(max_bytes=25)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, CacheEntry(key, b'x' * 10, 0, 0))
+    assert len(cache) == 2
+    assert cache.size == 20
+
+
+def test_cache_disk(tmpdir_path, intercept):
+    calls = count_requests(intercept, '/comments/')
+    user = UserTest(response_cache=ResponseCache(path=tmpdir_path))
+    data = user.urlread('/comments/')
+
+    # Новый кэш в том же каталоге подхватывает сохранённые страницы
+    user = UserTest(response_cache=ResponseCache(path=tmpdir_path))
+    assert user.urlread('/comments/') == data
+    assert len(calls) == 1
+    assert user.response_cache.stats['hits'] == 1
+
+    user.response_cache.clear()
+    assert user.urlread('/comments/') == data
+    assert len(calls) == 2
+
+
+def test_cache_disk_error(tmpdir_path, intercept, monkeypatch):
+    def replace(src, dst):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(os, 'replace', replace)
+
+    # Ошибка записи на диск не мешает самому запросу
+    user = UserTest(response_cache=ResponseCache(path=tmpdir_path))
+    calls = count_requests(intercept, '/comments/')
+    data = user.urlread('/comments/')
+    assert data == user.urlread('/comments/')
+    assert len(calls) == 1
+    assert os.listdir(tmpdir_path) == []
+
+
+def test_comment_cache(monkeypatch):
+    from test_comments import build_comments_page, dump_comment
+
+    user = UserTest(comment_cache=CommentCache())
+    raw_data = build_comments_page(50)
+    comments = user.get_comments('/blog/132085.html', raw_data=raw_data)
+    assert user.comment_cache.stats == {'hits': 0, 'misses': 50, 'evictions': 0}
+
+    calls = []
+    parse_comment = api.parse_comment
+    monkeypatch.setattr(api, 'parse_comment', lambda node, *args, **kwargs: calls.append(node.get('data-id')) or parse_comment(node, *args, **kwargs))
+
+    # Изменились два коммента, остальные берутся из кэша
+    raw_data2 = raw_data.replace('Коммент №12 '.encode('utf-8'), 'Коммент №12 (ред.) '.encode('utf-8'))
+    raw_data2 = raw_data2.replace(b'<span class="vote-count">+5</span>', b'<span class="vote-count">+6</span>', 1)
+    comments2 = user.get_comments('/blog/132085.html', raw_data=raw_data2)
+    assert sorted(calls) == ['12', '5']
+    assert dump_comment(comments2[1]) == dump_comment(comments[1])
+    assert comments2[12] is not comments[12]
+    assert comments2[12].raw_body.startswith('Коммент №12 (ред.)')
+    assert comments2[5].vote_total == 6
+    assert user.comment_cache.stats == {'hits': 48, 'misses': 52, 'evictions': 0}
+
+    uncached = UserTest().get_comments('/blog/132085.html', raw_data=raw_data2)
+    for comment_id, comment in uncached.items():
+        assert dump_comment(comments2[comment_id]) == dump_comment(comment)
+
+
+def test_comment_cache_copies(user):
+    from test_comments import build_comments_page
+
+    user.comment_cache = CommentCache()
+    raw_data = build_comments_page(10)
+    comments = user.get_comments('/blog/132085.html', raw_data=raw_data)
+    comments[1].context['mine'] = True
+    comments[1].raw_body = 'изменено'
+
+    # Закэшированные комменты не делят состояние с прошлыми результатами
+    comments2 = user.get_comments('/blog/132085.html', raw_data=raw_data)
+    assert comments2[1] is not comments[1]
+    assert 'mine' not in comments2[1].context
+    assert comments2[1].raw_body.startswith('Коммент №1 ')
+    comments2[2].context['url'] = 'changed'
+    assert comments[2].context['url'] != 'changed'
+    assert user.comment_cache.stats['hits'] == 10
+
+
+def test_comment_cache_since_id(user, monkeypatch):
+    from test_comments import build_comments_page
+
+    user.comment_cache = CommentCache()
+    raw_data = build_comments_page(50)
+    user.get_comments('/blog/132085.html', raw_data=raw_data)
+
+    # Чтение только новых комментов не выкидывает из кэша остальные
+    assert sorted(user.get_comments('/blog/132085.html', raw_data=raw_data, since_id=45)) == [46, 47, 48, 49, 50]
+    assert len(user.comment_cache) == 50
+
+    calls = []
+    monkeypatch.setattr(api, 'parse_comment', lambda *args, **kwargs: calls.append(args[0]))
+    assert len(user.get_comments('/blog/132085.html', raw_data=raw_data)) == 50
+    assert calls == []
+
+
+def test_comment_cache_lru():
+    cache = CommentCache(max_posts=2, max_comments=25)
+    cache.set_post('a', {1: None, 2: None})
+    cache.set_post('b', {3: None})
+    assert cache.get_post('a')  # теперь «b» дольше всех не использовался
+    cache.set_post('c', {4: None})
+    assert not cache.get_post('b')
+    assert cache.stats['evictions'] == 1
+    assert len(cache) == 3
+
+    cache.set_post('d', dict((i, None) for i in range(23)))
+    assert not cache.get_post('a')
+    assert cache.get_post('c')
+    assert len(cache) == 24
+
+    cache.set_post('e', {5: None, 6: None})
+    assert not cache.get_post('d')  # не влезает в max_comments
+    assert len(cache) == 3
+
+    cache.delete_post('e')
+    assert len(cache) == 1
@@ -13,7 +13,7 @@ import pytest
 import tabun_api as api
 from tabun_api.compat import text, binary
 
-from testutil import UserTest, load_file, form_intercept, set_mock, user, assert_data
+from testutil import UserTest, load_file, form_intercept, set_mock, as_guest, user, assert_data
 
 
 @pytest.mark.parametrize("url,data_file,rev", [
@@ -51,6 +51,286 @@ def test_get_comments_types_ok(user):
             assert isinstance(comment.vote_total, int)
 
 
+def build_comment(comment_id, parent_id=None):
+    if comment_id % 7 == 3:
+        return (
+            '<section data-id="{0}" id="comment_id_{0}" class="comment comment-deleted">'
+            '<div class="comment-info"></div></section>'
+        ).format(comment_id)
+    return (
+        '<section data-id="{0}" id="comment_id_{0}" class="comment{1}">'
+        '<div id="comment_content_id_{0}" class="comment-content"><div class="text">'
+        'Коммент №{0} &amp; <b>жирный</b><br/>\nещё строка</div></div>'
+        '<div class="comment-info">'
+        '<a class="user-with-avatar" href="/profile/user{2}/"><span class="nickname">user{2}</span></a>'
+        '<time datetime="2026-01-02T03:{3:02d}:05+03:00">2 января 2026, 03:{3:02d}</time>'
+        '<div id="vote_area_comment_{0}" class="vote vote-enabled{4}">'
+        '<div class="vote-up"></div><span class="vote-count">+{5}</span><div class="vote-down"></div></div>'
+        '{6}'
+        '<span class="comment-favourite favorite{7}">{8}</span>'
+        '</div></section>'
+    ).format(
+        comment_id,
+        ' comment-new' if comment_id % 5 == 0 else '',
+        comment_id % 13,
+        comment_id % 60,
+        ' voted-up' if comment_id % 4 == 0 else '',
+        comment_id % 11,
+        '<a class="goto goto-comment-parent" href="#comment{}">↑</a>'.format(parent_id) if parent_id else '',
+        ' active' if comment_id % 3 == 0 else '',
+        comment_id % 2 or '',
+    )
+
+
+def build_comments_page(count, depth=5, flat=False):
+    # Страница поста (или ленты при flat=True) с count комментами
+    # в вёрстке нового Табуна, вложенными не глубже depth
+    # (в ленте, как и на Табуне, новые комменты идут первыми)
+    buf = ['<div class="comments" id="comments">\n']
+    if flat:
+        for i in range(count, 0, -1):
+            buf.append(build_comment(i))
+            buf.append('\n')
+    else:
+        stack = []
+        for i in range(1, count + 1):
+            level = i % depth
+            while len(stack) > level:
+                stack.pop()
+                buf.append('</div>\n')
+            buf.append('<div class="comment-wrapper" id="comment_wrapper_id_{}">'.format(i))
+            buf.append(build_comment(i, stack[-1] if stack else None))
+            stack.append(i)
+        buf.append('</div>\n' * len(stack))
+    buf.append('</div>\n')
+
+    raw_data = load_file('132085.html')
+    f1 = raw_data.find(b'<div class="comments')
+    f2 = raw_data.rfind(b'<!-- /content -->')
+    return raw_data[:f1] + ''.join(buf).encode('utf-8') + raw_data[f2:]
+
+
+def dump_comment(comment):
+    result = dict(vars(comment))
+    result.pop('_body')
+    result['raw_body'] = comment.raw_body
+    return result
+
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_get_comments_iterparse(user, flat):
+    raw_data = build_comments_page(200, flat=flat)
+    url = '/comments/' if flat else '/blog/132085.html'
+
+    comments = user.get_comments(url, raw_data=raw_data)
+    comments2 = user.get_comments(url, raw_data=raw_data, engine='iterparse')
+    assert len(comments) == 200
+    assert sorted(comments) == sorted(comments2)
+    for comment_id, comment in comments.items():
+        assert dump_comment(comments2[comment_id]) == dump_comment(comment)
+
+    assert comments[8].parent_id == (None if flat else 7)
+    assert comments[10].deleted and comments[10].raw_body is None
+    assert comments[12].raw_body == 'Коммент №12 &amp; <b>жирный</b><br/>\nещё строка'
+
+
+@pytest.mark.parametrize('engine', ['tree', 'iterparse'])
+def test_get_comments_light(user, engine):
+    raw_data = build_comments_page(50)
+    comments = user.get_comments('/blog/132085.html', raw_data=raw_data)
+    light_comments = user.get_comments('/blog/132085.html', raw_data=raw_data, engine=engine, light=True)
+
+    assert sorted(light_comments) == sorted(comments)
+    for comment_id, comment in comments.items():
+        light_comment = light_comments[comment_id]
+        assert light_comment.raw_body is None
+        expected = dump_comment(comment)
+        expected['raw_body'] = None
+        assert dump_comment(light_comment) == expected
+
+
+@pytest.mark.parametrize('flat', [False, True])
+@pytest.mark.parametrize('engine', ['tree', 'iterparse'])
+def test_get_comments_since_id(user, monkeypatch, flat, engine):
+    raw_data = build_comments_page(50, flat=flat)
+    url = '/comments/' if flat else '/blog/132085.html'
+    comments = user.get_comments(url, raw_data=raw_data)
+
+    calls = []
+    parse_comment = api.parse_comment
+    monkeypatch.setattr(api, 'parse_comment', lambda node, *args, **kwargs: calls.append(node) or parse_comment(node, *args, **kwargs))
+
+    new_comments = user.get_comments(url, raw_data=raw_data, engine=engine, since_id=40)
+    assert sorted(new_comments) == list(range(41, 51))
+    for comment_id, comment in new_comments.items():
+        assert dump_comment(comment) == dump_comment(comments[comment_id])
+    assert len(calls) == 10
+
+    new_comments = user.get_comments(url, raw_data=raw_data, engine=engine, known_ids=range(1, 49))
+    assert sorted(new_comments) == [49, 50]
+
+
+def test_get_comments_since_id_feed(user, set_mock):
+    raw_data = build_comments_page(50, flat=True)
+    set_mock({'/comments/': (None, {'data': raw_data})})
+
+    # В ленте всё после первого известного коммента не нужно
+    new_comments = user.get_comments(known_ids=[45])
+    assert sorted(new_comments) == [46, 47, 48, 49, 50]
+
+
+@pytest.mark.parametrize('engine', ['tree', 'iterparse'])
+def test_get_comments_since_id_broken_feed(user, engine):
+    # После удаления блога с комментами лента обрывается на середине ссылки
+    raw_data = build_comments_page(50, flat=True)
+    raw_data = raw_data[:raw_data.rfind(b'<!-- /content -->')] + b'<ul><li class="comment-link"><a href="'
+
+    comments = user.get_comments('/comments/', raw_data=raw_data, engine=engine)
+    assert sorted(comments) == list(range(1, 51))
+
+    new_comments = user.get_comments('/comments/', raw_data=raw_data, engine=engine, since_id=40)
+    assert sorted(new_comments) == list(range(41, 51))
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_get_comments_iterparse_download(user, set_mock, streaming):
+    raw_data = build_comments_page(50)
+    set_mock({'/blog/132085.html': (None, {'data': raw_data})})
+    user.streaming = streaming
+    user.stream_chunk_size = 1000
+
+    comments = user.get_comments('/blog/132085.html', engine='iterparse')
+    assert sorted(comments) == list(range(1, 51))
+    assert comments[2].context['username'] == 'test'
+
+
+def test_get_comments_iterparse_ignores_other_sections(user):
+    raw_data = build_comments_page(3).replace(
+        b'<div class="comments" id="comments">',
+        b'<div class="comments" id="comments"><div class="comment-form"><section class="comment">?</section></div>',
+    )
+    comments = user.get_comments('/blog/132085.html', raw_data=raw_data, engine='iterparse')
+    assert sorted(comments) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('engine', ['tree', 'iterparse'])
+def test_get_comments_layout(user, engine):
+    raw_data = build_comments_page(30)
+    comments = user.get_comments('/blog/132085.html', raw_data=raw_data, engine=engine)
+    assert comments[2].context['layout'] == 'new'
+
+    # С неправильно указанной вёрсткой результат тот же
+    data = api.utils.find_substring(raw_data, b'<div class="comments', b'<!-- /content -->', extend=True, with_end=False)
+    sections = list(api.utils.parse_html_fragment(api.utils.preprocess_page(data, True))[0].iter('section'))
+    assert len(sections) == 30
+    for sect in sections:
+        if 'comment-deleted' in sect.get('class'):
+            continue
+        comment = api.parse_comment(sect, 132085, 'news', layout='old')
+        expected = comments[comment.comment_id]
+        assert (comment.author, comment.favourite, comment.context['favourited']) == \
+            (expected.author, expected.favourite, expected.context['favourited'])
+
+
+def build_ajax_comments(count):
+    # Ответ ajaxresponsecomment с count комментами
+    comments = {}
+    for i in range(1, count + 1):
+        parent_id = i // 2 or None
+        comments[text(i)] = {'id': i, 'pid': parent_id, 'html': build_comment(i, parent_id)}
+    return json.dumps({'comments': comments, 'iMaxIdComment': count, 'bStateError': False, 'sMsg': '', 'sMsgTitle': ''}).encode('utf-8')
+
+
+def test_get_comments_from(user, set_mock):
+    set_mock({'/blog/ajaxresponsecomment/': (None, {'data': build_ajax_comments(100)})})
+    comments = user.get_comments_from(132085)
+    page_comments = user.get_comments('/comments/', raw_data=build_comments_page(100, flat=True))
+
+    assert sorted(comments) == list(range(1, 101))
+    for comment_id, comment in comments.items():
+        expected = page_comments[comment_id]
+        assert comment.post_id == 132085
+        assert comment.parent_id == (comment_id // 2 or None)
+        assert comment.deleted == expected.deleted
+        for field in ('author', 'raw_body', 'vote_total', 'favourite', 'utctime'):
+            assert getattr(comment, field) == getattr(expected, field), field
+
+
+def test_get_comments_from_broken_html(user, set_mock):
+    # Незакрытые теги в одном комменте не ломают остальные
+    data = json.loads(build_ajax_comments(5).decode('utf-8'))
+    data['comments']['2']['html'] = data['comments']['2']['html'].replace('</section>', '<div><div>')
+    set_mock({'/blog/ajaxresponsecomment/': (None, {'data': json.dumps(data).encode('utf-8')})})
+
+    comments = user.get_comments_from(132085)
+    assert sorted(comments) == [1, 2, 3, 4, 5]
+    assert comments[4].raw_body == 'Коммент №4 &amp; <b>жирный</b><br/>\nещё строка'
+
+
+def test_get_comments_via_ajax(user, set_mock):
+    set_mock({'/blog/ajaxresponsecomment/': (None, {'data': build_ajax_comments(20)})})
+    comments = user.get_comments('/blog/news/132085.html', via='ajax')
+
+    assert sorted(comments) == list(range(1, 21))
+    assert comments[6].parent_id == 3
+    assert comments[6].blog == 'news'
+    assert set(x.context['via'] for x in comments.values()) == {'ajax'}
+
+    comments = user.get_comments('/blog/news/132085.html', via='ajax', since_id=15, known_ids=[17])
+    assert sorted(comments) == [16, 18, 19, 20]
+
+
+def test_get_comments_via_ajax_fallback(user, set_mock):
+    set_mock({
+        '/blog/132085.html': (None, {'data': build_comments_page(10)}),
+        '/blog/ajaxresponsecomment/': (None, {'data': b'{"sMsgTitle": "", "sMsg": "Error", "bStateError": true}'}),
+    })
+    comments = user.get_comments('/blog/132085.html', via='ajax')
+    assert sorted(comments) == list(range(1, 11))
+    assert set(x.context['via'] for x in comments.values()) == {'page'}
+
+    # Ленту комментов через ajax не получить
+    comments = user.get_comments('/comments/', raw_data=build_comments_page(5, flat=True), via='ajax')
+    assert sorted(comments) == list(range(1, 6))
+    assert comments[1].context['via'] == 'page'
+
+
+def test_get_comments_via_ajax_guest(as_guest, set_mock):
+    user = UserTest()
+    assert user.username is None
+    set_mock({'/blog/132085.html': (None, {'data': build_comments_page(10)})})
+    comments = user.get_comments('/blog/132085.html', via='ajax')
+    assert sorted(comments) == list(range(1, 11))
+    assert comments[1].context['via'] == 'page'
+
+
+def test_get_post_and_comments_via_ajax(user, set_mock):
+    set_mock({'/blog/ajaxresponsecomment/': (None, {'data': build_ajax_comments(20)})})
+    post, comments = user.get_post_and_comments(132085, comments_via='ajax')
+    assert post.post_id == 132085
+    assert post.context['comments_via'] == 'ajax'
+    assert sorted(comments) == list(range(1, 21))
+
+    # С переданным кодом страницы, как и в get_comments, ajax не используется
+    post, comments = user.get_post_and_comments(132085, raw_data=build_comments_page(10), comments_via='ajax')
+    assert post.context['comments_via'] == 'page'
+    assert sorted(comments) == list(range(1, 11))
+
+    set_mock({
+        '/blog/132085.html': (None, {'data': build_comments_page(10)}),
+        '/blog/ajaxresponsecomment/': (None, {'data': b'{"sMsgTitle": "", "sMsg": "Error", "bStateError": true}'}),
+    })
+    post, comments = user.get_post_and_comments(132085, comments_via='ajax')
+    assert post.context['comments_via'] == 'page'
+    assert sorted(comments) == list(range(1, 11))
+    assert comments[1].context['via'] == 'page'
+
+
+def test_get_comments_unknown_engine(user):
+    with pytest.raises(ValueError):
+        user.get_comments('/blog/132085.html', raw_data=build_comments_page(1), engine='sax')
+
+
 def test_add_comment_ok(form_intercept, set_mock, user):
     set_mock({'/blog/ajaxaddcomment/': (None, {'data': b'{"sCommentId": 1, "sMsgTitle": "", "sMsg": "", "bStateError": false}'})})
     @form_intercept('/blog/ajaxaddcomment/')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import pytest
+import tabun_api as api
+from tabun_api import utils
+
+from testutil import UserTest, load_file, set_mock, user
+from test_comments import build_comments_page, dump_comment
+
+
+def dump_post(post):
+    result = dict(vars(post))
+    result.pop('_body')
+    result.pop('short')
+    result['raw_body'] = post.raw_body
+    return result
+
+
+@pytest.mark.parametrize('url,data_file', [
+    ('/', 'index.html'),
+    ('/blog/132085.html', '132085.html'),
+    ('/blog/borderline/138982.html', '138982.html'),
+    ('/blog/138983.html', '138983.html'),
+])
+def test_document_get_posts(user, url, data_file):
+    raw_data = load_file(data_file)
+    document = api.PageDocument(user, raw_data, url)
+
+    posts = user.get_posts(url, raw_data=raw_data)
+    posts2 = user.get_posts(raw_data=document)
+    assert [dump_post(x) for x in posts2] == [dump_post(x) for x in posts]
+
+
+def test_document_get_post(user):
+    post = user.get_post(132085)
+    post2 = user.get_post(132085, raw_data=user.get_page_document('/blog/132085.html'))
+    assert dump_post(post2) == dump_post(post)
+
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_document_get_comments(user, flat):
+    raw_data = build_comments_page(50, flat=flat)
+    url = '/comments/' if flat else '/blog/132085.html'
+    document = api.PageDocument(user, raw_data, url)
+
+    comments = user.get_comments(url, raw_data=raw_data)
+    for engine in ('tree', 'iterparse'):
+        comments2 = user.get_comments(raw_data=document, engine=engine)
+        assert sorted(comments2) == sorted(comments)
+        for comment_id, comment in comments.items():
+            assert dump_comment(comments2[comment_id]) == dump_comment(comment)
+
+
+def test_document_parsed_once(user, set_mock, monkeypatch):
+    raw_data = build_comments_page(20)
+    set_mock({'/blog/132085.html': (None, {'data': raw_data})})
+    post, comments = user.get_post_and_comments(132085)
+
+    calls = []
+
+    def counted(name):
+        func = getattr(utils, name)
+        return lambda *args, **kwargs: calls.append(name) or func(*args, **kwargs)
+
+    for name in ('preprocess_page', 'parse_html', 'parse_html_fragment'):
+        monkeypatch.setattr(utils, name, counted(name))
+
+    post2, comments2 = user.get_post_and_comments(132085)
+    assert calls.count('preprocess_page') == 1
+    assert calls.count('parse_html') == 1
+    assert dump_post(post2) == dump_post(post)
+    assert sorted(comments2) == sorted(comments) == list(range(1, 21))
+
+
+def test_document_context(user):
+    document = user.get_page_document('/blog/132085.html')
+    context = document.context
+    assert context == user.get_main_context(load_file('132085.html'), url='/blog/132085.html')
+    assert user.get_main_context(document) == context
+
+    # Контекст можно менять, документ от этого не портится
+    context['username'] = 'foo'
+    assert document.context['username'] == 'test'
+
+
+def test_document_other_methods(user):
+    document = user.get_page_document('/')
+    assert user.get_pagination(document) == user.get_pagination(load_file('index.html'))
+    assert user.update_userinfo(document) == 'test'
+
+    profile = user.get_profile(url='/profile/test/', raw_data=api.PageDocument(user, load_file('profile.html')))
+    assert profile.username == 'test'
+    assert profile.user_id == 666
+
+
+def test_document_invalid_data(user):
+    with pytest.raises(ValueError):
+        api.PageDocument(user, 'text')
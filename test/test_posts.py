@@ -26,6 +26,85 @@ def test_get_posts_data_ok(user):
         assert_data(post, data)
 
 
+@pytest.mark.parametrize('url', ['/', '/blog/138983.html', '/blog/borderline/138982.html'])
+@pytest.mark.parametrize('chunk_size', [100, 16 * 1024])
+def test_get_posts_streaming(user, url, chunk_size):
+    stream_user = UserTest(streaming=True)
+    stream_user.stream_chunk_size = chunk_size
+    posts = user.get_posts(url)
+    stream_posts = stream_user.get_posts(url)
+
+    assert len(stream_posts) == len(posts)
+    for post, stream_post in zip(posts, stream_posts):
+        assert stream_post.post_id == post.post_id
+        assert stream_post.title == post.title
+        assert stream_post.author == post.author
+        assert stream_post.tags == post.tags
+        assert stream_post.short == post.short
+        assert stream_post.raw_body == post.raw_body
+        assert stream_post.context == post.context
+
+
+def test_post_body_lazy(user, monkeypatch):
+    calls = []
+    normalize_body = api.utils.normalize_body
+    monkeypatch.setattr(api.utils, 'normalize_body', lambda *args, **kwargs: calls.append(args) or normalize_body(*args, **kwargs))
+
+    posts = user.get_posts('/')
+    assert not calls
+
+    post = posts[0]
+    raw_body = post.raw_body
+    assert post.body is not None
+    assert len(calls) == 1
+    assert post.raw_body == raw_body
+    assert post.body is post.body
+    assert len(calls) == 1
+
+    post.raw_body = 'foo'
+    assert post.raw_body == 'foo'
+
+
+@pytest.mark.parametrize('url', ['/', '/blog/132085.html', '/blog/138983.html'])
+@pytest.mark.parametrize('streaming', [False, True])
+def test_get_posts_light(user, url, streaming):
+    posts = user.get_posts(url)
+    user.streaming = streaming
+    light_posts = user.get_posts(url, light=True)
+
+    assert len(light_posts) == len(posts)
+    for post, light_post in zip(posts, light_posts):
+        assert light_post.raw_body is None
+        assert light_post.body is None
+        assert light_post.poll is None
+        for field in ('post_id', 'blog', 'author', 'title', 'utctime', 'tags', 'vote_count', 'vote_total',
+                      'comments_count', 'favourite', 'short', 'cut_text', 'context'):
+            assert getattr(light_post, field) == getattr(post, field), field
+
+
+@pytest.mark.parametrize('document', [False, True])
+def test_get_posts_since_id(user, monkeypatch, document):
+    posts = list(reversed(user.get_posts('/')))  # как на странице: новые первыми
+    ids = [x.post_id for x in posts]
+
+    calls = []
+    parse_post = api.parse_post
+    monkeypatch.setattr(api, 'parse_post', lambda *args, **kwargs: calls.append(args) or parse_post(*args, **kwargs))
+
+    def get_new_posts(**kwargs):
+        raw_data = user.get_page_document('/') if document else None
+        return [x.post_id for x in reversed(user.get_posts('/', raw_data=raw_data, **kwargs))]
+
+    # Всё, начиная с первого известного поста, выкидывается
+    assert get_new_posts(known_ids=[ids[3], ids[5]]) == ids[:3]
+    assert len(calls) == 3
+
+    since_id = min(ids[:4])
+    assert get_new_posts(since_id=since_id) == ids[:ids.index(since_id)]
+    assert get_new_posts(known_ids=ids) == []
+    assert get_new_posts(since_id=0) == ids
+
+
 def test_get_posts_data_ok_without_escape(user):
     def noescape(data, may_be_short=False):
         return data
@@ -87,6 +166,21 @@ def test_get_posts_context_user_ok(user):
         assert isinstance(c['unread_comments_count'], int)
 
 
+@pytest.mark.parametrize('layout', [None, 'old', 'new'])
+def test_parse_post_layout(user, layout):
+    # Неправильно указанная вёрстка только замедляет парсинг, но не ломает его
+    data = api.utils.find_substring(load_file('index.html'), b"<article ", b"</article> <!-- /.topic -->", extend=True)
+    items = api.utils.parse_html_fragment(api.utils.escape_topic_contents(data, True))
+    posts = [api.parse_post(x, layout=layout) for x in reversed(items) if not isinstance(x, text) and x.tag == 'article']
+
+    expected = user.get_posts('/')
+    assert expected[0].context['layout'] == 'old'
+    assert len(posts) == len(expected)
+    for post, post2 in zip(posts, expected):
+        assert (post.post_id, post.author, post.blog, post.blog_name, post.private, post.utctime) == \
+            (post2.post_id, post2.author, post2.blog, post2.blog_name, post2.private, post2.utctime)
+
+
 def test_get_posts_context_guest_ok(user, as_guest):
     posts = reversed(user.get_posts('/'))
     for post in posts:
@@ -334,4 +428,28 @@ def test_post_hashsum_part(user):
     assert p[0].hashsum(('title', 'body', 'tags')) == '1364ee5a2fee913325d3b220d43623a5'
 
 
+
+@pytest.mark.parametrize('layout', ['new', 'old'])
+def test_get_stream_topics_wrong_layout(user, set_mock, monkeypatch, layout):
+    # Неверно определённая вёрстка не должна терять посты
+    html = (
+        '<div class="small-list-topic-entry">'
+        '<a class="blog-title-wrapper" href="/blog/news/"><span>Срочно в номер</span></a>'
+        '<a class="topic-entry-title" href="/blog/news/132085.html">Заголовок</a>'
+        '<a class="topic-comments-counter" data-new-comments-count="+2">5</a>'
+        '<span class="user-with-avatar"><span class="nickname">test</span></span>'
+        '<time class="topic-entry-date" datetime="2026-01-02T03:04:05+03:00">2 января 2026</time>'
+        '</div>'
+    )
+    set_mock({'/ajax/stream/topic/': (None, {'data': json.dumps({'sText': html, 'bStateError': False}).encode('utf-8')})})
+    monkeypatch.setattr(api.utils, 'detect_layout', lambda raw_data: layout)
+
+    posts = user.get_stream_topics()
+    assert len(posts) == 1
+    assert posts[0].post_id == 132085
+    assert posts[0].blog == 'news'
+    assert posts[0].author == 'test'
+    assert posts[0].comments_count == 5
+    assert posts[0].context['unread_comments_count'] == 2
+
 # TODO: rss
@@ -72,6 +72,17 @@ def test_get_profile(user, set_mock):
     assert profile.context['can_edit_note'] is True
 
 
+
+def test_get_profile_wrong_layout(user, set_mock, monkeypatch):
+    # Если вёрстка определилась неверно, данные всё равно не теряются
+    set_mock({'/profile/test/': 'profile.html'})
+    monkeypatch.setattr(api.utils, 'detect_layout', lambda raw_data: 'new')
+    profile = user.get_profile('test')
+    assert time.strftime('%Y-%m-%d', profile.birthday) == '1971-02-02'
+    assert time.strftime('%Y-%m-%d %H:%M', profile.registered) == '2012-03-07 03:15'
+    assert time.strftime('%Y-%m-%d %H:%M', profile.last_activity) == '2016-05-22 20:30'
+    assert profile.full is True
+
 def test_get_profile_topics(user, set_mock):
     set_mock({'/profile/test/created/topics/': 'profile_topics.html'})
     profile = user.get_profile(url='/profile/test/created/topics/')
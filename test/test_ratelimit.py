@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+import tabun_api as api
+from tabun_api.ratelimit import IntervalLimiter, TokenBucketLimiter, guess_request_kind
+
+from testutil import UserTest, user
+
+
+@pytest.fixture(scope='function')
+def clock(monkeypatch):
+    state = {'now': 100.0, 'sleeps': []}
+
+    def sleep(n):
+        state['sleeps'].append(n)
+        state['now'] += n
+
+    monkeypatch.setattr(time, 'time', lambda: state['now'])
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return state
+
+
+def test_guess_request_kind():
+    assert guess_request_kind('GET', 'https://tabun.everypony.ru/') == 'page'
+    assert guess_request_kind('POST', 'https://tabun.everypony.ru/ajax/vote/topic/') == 'ajax'
+    assert guess_request_kind('POST', 'https://tabun.everypony.ru/ajax/upload/image/') == 'upload'
+
+
+def test_interval_limiter_reservations(clock):
+    limiter = IntervalLimiter(5)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 5
+    assert limiter.reserve() == 10
+    assert limiter.get_wait_time() == 15
+
+    # nowait не сдвигает уже занятые места в очереди
+    assert limiter.reserve(nowait=True) == 0
+    assert limiter.last_query_time == 110
+
+
+def test_token_bucket_burst(clock):
+    limiter = TokenBucketLimiter(rate=2, burst=3)
+    for _ in range(3):
+        assert limiter.acquire() == 0
+    assert limiter.get_wait_time() == 0.5
+    assert limiter.acquire() == 0.5
+    assert limiter.acquire() == 0.5
+    assert clock['sleeps'] == [0.5, 0.5]
+
+    # После простоя ведро снова наполняется, но не больше burst
+    clock['now'] += 100
+    assert limiter.get_tokens() == 3
+
+
+def test_token_bucket_kinds(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1, kinds={'upload': (0.1, 1)})
+    assert limiter.reserve('page') == 0
+    assert limiter.reserve('ajax') == 0
+    assert limiter.reserve('upload') == 0
+    assert limiter.reserve('page') == 1
+    assert limiter.reserve('upload') == 10
+    assert limiter.reserve('page', nowait=True) == 0
+    assert limiter.get_tokens('page') == -1
+
+
+def test_token_bucket_invalid_params():
+    with pytest.raises(ValueError):
+        TokenBucketLimiter(rate=0)
+    with pytest.raises(ValueError):
+        TokenBucketLimiter(burst=0)
+
+
+def test_limiter_queue_depth(clock):
+    limiter = TokenBucketLimiter(rate=1, burst=1)
+    depths = []
+    clock_sleep = time.sleep
+
+    def sleep(n):
+        depths.append(limiter.queue_depth)
+        clock_sleep(n)
+
+    time.sleep = sleep
+    limiter.acquire()
+    limiter.acquire()
+    assert depths == [1]
+    assert limiter.queue_depth == 0
+
+
+def test_user_default_limiter(user):
+    assert isinstance(user.limiter, IntervalLimiter)
+    assert user.query_interval == 0
+    user.query_interval = 3
+    assert user.limiter.interval == 3
+
+
+def test_user_query_interval_resets_limiter(user):
+    user.limiter = TokenBucketLimiter()
+    assert user.query_interval == 0
+    assert user.last_query_time == 0
+    user.query_interval = 2
+    assert isinstance(user.limiter, IntervalLimiter)
+    assert user.query_interval == 2
+
+
+def make_user(limiter):
+    # С готовой сессией конструктор не отправляет запросов
+    return UserTest(
+        session_id='abcdef9876543210abcdef9876543210',
+        security_ls_key='0123456789abcdef0123456789abcdef',
+        limiter=limiter,
+    )
+
+
+def test_user_token_bucket(clock):
+    user = make_user(TokenBucketLimiter(rate=1, burst=2, kinds={'ajax': (0.5, 1)}))
+    user.urlread('/')
+    user.urlread('/')
+    assert clock['sleeps'] == []
+    user.urlread('/')
+    assert clock['sleeps'] == [1]
+    user.urlread('/', nowait=True)
+    assert clock['sleeps'] == [1]
+    assert user.limiter.get_wait_time('ajax') == 0
+
+
+def test_user_shared_limiter(clock):
+    limiter = IntervalLimiter(4)
+    user1 = make_user(limiter)
+    user2 = make_user(limiter)
+    user1.urlread('/')
+    user2.urlread('/')
+    assert clock['sleeps'] == [4]
+    assert user1.last_query_time == user2.last_query_time == 104
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+import tabun_api as api
+from tabun_api.retry import RetryPolicy, CircuitBreaker, parse_retry_after
+from tabun_api.compat import urequest
+
+from testutil import UserTest, intercept, set_mock, user
+
+
+bad_gateway = ('502.html', {'status': 502, 'status_msg': 'Bad Gateway'})
+
+
+def fail_times(set_mock, intercept, url, count, mock=bad_gateway, ok='index.html'):
+    # Первые count запросов завершаются ошибкой, остальные успешны
+    calls = []
+    set_mock({url: mock})
+
+    @intercept(url)
+    def handler(data, headers):
+        calls.append(data)
+        set_mock({url: mock if len(calls) <= count else ok})
+
+    return calls
+
+
+def test_retry_disabled_by_default(set_mock, intercept, user):
+    calls = fail_times(set_mock, intercept, '/', 1)
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == 502
+    assert len(calls) == 1
+
+
+def test_retry_get(set_mock, intercept):
+    user = UserTest(retry_policy=RetryPolicy(backoff=1, jitter=0))
+    calls = fail_times(set_mock, intercept, '/', 2)
+    assert user.urlread('/') == user.urlread('/')
+    assert len(calls) == 4
+    assert user.sleeps == [2, 3.0]  # 1 + 2
+    assert user.retry_policy.stats == {'retries': 2, 'gave_up': 0}
+
+
+def test_retry_give_up(set_mock, intercept):
+    user = UserTest(retry_policy=RetryPolicy(max_retries=2, backoff=1, jitter=0))
+    calls = fail_times(set_mock, intercept, '/', 100)
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == 502
+    assert len(calls) == 3
+    assert user.retry_policy.stats == {'retries': 2, 'gave_up': 1}
+
+
+def test_retry_not_for_post(set_mock, intercept):
+    user = UserTest(retry_policy=RetryPolicy())
+    calls = fail_times(set_mock, intercept, '/ajax/vote/topic/', 1)
+    with pytest.raises(api.TabunError) as excinfo:
+        user.vote(132085, 1)
+    assert excinfo.value.code == 502
+    assert len(calls) == 1
+    assert user.sleeps == [0, 0.0]
+
+
+def test_retry_not_for_404(set_mock, intercept):
+    user = UserTest(retry_policy=RetryPolicy())
+    calls = fail_times(set_mock, intercept, '/', 1, mock=('404.html', {'status': 404, 'status_msg': 'Not Found'}))
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == 404
+    assert len(calls) == 1
+
+
+def test_retry_after(set_mock, intercept):
+    user = UserTest(retry_policy=RetryPolicy(max_retry_after=60))
+    unavailable = (None, {'status': 503, 'status_msg': 'Service Unavailable', 'headers': {'Retry-After': '7'}})
+    calls = fail_times(set_mock, intercept, '/', 1, mock=unavailable)
+    user.urlread('/')
+    assert len(calls) == 2
+    assert user.sleeps == [1, 7.0]
+
+    # Слишком долго ждать не будем
+    unavailable[1]['headers']['Retry-After'] = '3600'
+    calls = fail_times(set_mock, intercept, '/', 1, mock=unavailable)
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == 503
+    assert len(calls) == 1
+
+
+def test_retry_cloudflare_challenge(user):
+    exc = urequest.HTTPError(api.http_host + '/', 503, 'Service Unavailable', {'CF-RAY': '1234'}, None)
+    error = api.TabunError(code=503, exc=exc)
+    user.avoid_cf = False
+    assert user._can_retry(error)
+    user.avoid_cf = True
+    assert not user._can_retry(error)
+
+
+def test_retry_backoff():
+    policy = RetryPolicy(max_retries=5, backoff=0.5, max_backoff=3, jitter=0)
+    error = api.TabunError(code=api.TabunError.TIMEOUT)
+    assert [policy.get_delay(i, error) for i in range(6)] == [0.5, 1.0, 2.0, 3, 3, None]
+
+    policy = RetryPolicy(backoff=2, jitter=0.5)
+    for _ in range(20):
+        assert 1.0 <= policy.get_delay(0, error) <= 2.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('Sat, 17 Oct 2026 00:02:00 GMT', now=1792195200) == 120
+    assert parse_retry_after('Sat, 17 Oct 2026 00:00:00 GMT', now=1792195300) == 0
+    assert parse_retry_after('garbage') is None
+    assert parse_retry_after(None) is None
+
+
+def test_circuit_breaker(set_mock, intercept, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    user = UserTest(retry_policy=RetryPolicy(max_retries=0, circuit_breaker=breaker))
+    calls = fail_times(set_mock, intercept, '/', 3)
+
+    for _ in range(2):
+        with pytest.raises(api.TabunError) as excinfo:
+            user.urlread('/')
+        assert excinfo.value.code == 502
+    assert breaker.state == 'open'
+
+    # Сервер лежит — даже не пытаемся
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == api.TabunError.CIRCUIT_OPEN
+    assert len(calls) == 2
+
+    # Пробный запрос неудачен — снова размыкаемся
+    now[0] += 31
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/')
+    assert excinfo.value.code == 502
+    assert breaker.state == 'open'
+
+    # А теперь удачен
+    now[0] += 31
+    user.urlread('/')
+    assert breaker.state == 'closed'
+    assert len(calls) == 4
+
+
+def test_circuit_breaker_unexpected_error(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    policy = RetryPolicy(max_retries=0, circuit_breaker=breaker)
+    request = urequest.Request(api.http_host + '/')
+
+    def fail(exc):
+        def func():
+            raise exc
+        return func
+
+    with pytest.raises(ValueError):
+        policy.call(request, fail(ValueError('oops')))
+    assert breaker.state == 'open'
+
+    # Пробный запрос упал не с TabunError — автомат не должен застрять
+    now[0] += 31
+    with pytest.raises(ValueError):
+        policy.call(request, fail(ValueError('oops')))
+    assert breaker.state == 'open'
+
+    now[0] += 31
+    with pytest.raises(KeyboardInterrupt):
+        policy.call(request, fail(KeyboardInterrupt()))
+    assert breaker.state == 'open'
+
+    assert policy.call(request, lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_circuit_breaker_cloudflare_challenge():
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = RetryPolicy(circuit_breaker=breaker)
+    request = urequest.Request(api.http_host + '/')
+    exc = urequest.HTTPError(api.http_host + '/', 503, 'Service Unavailable', {'CF-RAY': '1234'}, None)
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise api.TabunError(code=503, exc=exc)
+
+    with pytest.raises(api.TabunError):
+        policy.call(request, func, lambda x: None, lambda e: False)
+    assert len(calls) == 1
+    assert breaker.state == 'closed'
+
+
+def test_circuit_breaker_half_open_not_found(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    policy = RetryPolicy(max_retries=0, circuit_breaker=breaker)
+    request = urequest.Request(api.http_host + '/')
+
+    def fail(code):
+        def func():
+            raise api.TabunError(code=code)
+        return func
+
+    with pytest.raises(api.TabunError):
+        policy.call(request, fail(502))
+    assert breaker.state == 'open'
+
+    # 404 и 403 ничего не говорят о здоровье сервера и автомат не замыкают
+    now[0] += 31
+    for code in (404, 403):
+        with pytest.raises(api.TabunError) as excinfo:
+            policy.call(request, fail(code))
+        assert excinfo.value.code == code
+        assert breaker.state == 'open'
+
+    assert policy.call(request, lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed'
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import time
+import zlib
+import gzip
+import threading
+from io import BytesIO
+
+import pytest
+import tabun_api as api
+from tabun_api.compat import PY2
+
+if PY2:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), LocalHandler)
+        self.connections = set()
+        self.close_after_response = False
+        self.drop_after_response = False
+        self.encoding = None
+        self.status = 200
+        self.body_size = 0
+        self.body_prefix = b''
+        self.request_headers = []
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        self.server.request_headers.append(dict((k.lower(), v) for k, v in self.headers.items()))
+        body = b'<html><body>' + self.path.encode('utf-8') + self.server.body_prefix + b'x' * self.server.body_size + b'</body></html>'
+        encoding = self.server.encoding
+        if encoding and encoding.split('-')[0] in (self.headers.get('Accept-Encoding') or ''):
+            body = compress(body, encoding)
+        else:
+            encoding = None
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding.split('-')[0])
+        if self.server.close_after_response:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.drop_after_response:
+            # Закрываем соединение молча, как это делают серверы по таймауту
+            self.close_connection = True
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        fp = BytesIO()
+        with gzip.GzipFile(fileobj=fp, mode='wb') as gz:
+            gz.write(data)
+        return fp.getvalue()
+    if encoding == 'deflate':
+        return zlib.compress(data)
+    if encoding == 'deflate-raw':
+        obj = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return obj.compress(data) + obj.flush()
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data)
+    raise ValueError(encoding)
+
+
+@pytest.fixture(scope='function')
+def server():
+    srv = LocalServer()
+    thread = threading.Thread(target=srv.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    try:
+        yield srv
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def make_user(server, connection_pool=True, **kwargs):
+    return api.User(
+        session_id='abcdef9876543210abcdef9876543210',
+        security_ls_key='0123456789abcdef0123456789abcdef',
+        http_host='http://127.0.0.1:{}'.format(server.server_address[1]),
+        avoid_cf=False,
+        connection_pool=connection_pool,
+        **kwargs
+    )
+
+
+def test_connection_pool_disabled_by_default(server):
+    user = make_user(server, connection_pool=None)
+    assert user.connection_pool is None
+    for i in range(3):
+        assert user.urlread('/foo/{}'.format(i)) == '<html><body>/foo/{}</body></html>'.format(i).encode('utf-8')
+    assert len(server.connections) == 3
+
+
+def test_connection_pool_reuse(server):
+    user = make_user(server)
+    for i in range(5):
+        assert user.urlread('/foo/{}'.format(i)) == '<html><body>/foo/{}</body></html>'.format(i).encode('utf-8')
+    assert user.urlread('/bar/', data=b'test') == b'test'
+
+    assert len(server.connections) == 1
+    assert user.connection_pool.stats['created'] == 1
+    assert user.connection_pool.stats['reused'] == 5
+    assert len(user.connection_pool) == 1
+
+
+def test_connection_pool_shared(server):
+    pool = api.ConnectionPool()
+    user1 = make_user(server, pool)
+    user2 = make_user(server, pool)
+    user1.urlread('/')
+    user2.urlread('/')
+    assert len(server.connections) == 1
+
+
+def test_connection_pool_connection_close(server):
+    server.close_after_response = True
+    user = make_user(server)
+    for _ in range(3):
+        user.urlread('/')
+    assert len(server.connections) == 3
+    assert len(user.connection_pool) == 0
+
+
+def test_connection_pool_stale(server):
+    server.drop_after_response = True
+    user = make_user(server)
+    for _ in range(3):
+        assert user.urlread('/') == b'<html><body>/</body></html>'
+    assert len(server.connections) == 3
+    assert user.connection_pool.stats['created'] == 3
+    assert user.connection_pool.stats['stale'] == 2
+
+
+def test_connection_pool_idle_timeout(server):
+    user = make_user(server, api.ConnectionPool(idle_timeout=0.0))
+    user.urlread('/')
+    time.sleep(0.01)
+    user.urlread('/')
+    assert len(server.connections) == 2
+    assert user.connection_pool.stats['evicted'] >= 1
+
+
+def test_connection_pool_unread_response_is_not_reused(server):
+    user = make_user(server)
+    resp = user.urlopen('/')
+    resp.close()
+    assert len(user.connection_pool) == 0
+    user.urlread('/')
+    assert len(server.connections) == 2
+
+
+def test_early_close(server):
+    server.body_prefix = b'<!-- /content -->'
+    server.body_size = 1024 * 1024
+    user = make_user(server, early_close=True)
+
+    data = user.urlread('/', until=user.content_end)
+    assert data.startswith(b'<html><body>/<!-- /content -->')
+    assert len(data) <= user.stream_chunk_size
+    # Недочитанное соединение закрыто и в пул не вернулось
+    assert len(user.connection_pool) == 0
+
+    assert len(user.urlread('/')) == 1024 * 1024 + 44
+    assert len(server.connections) == 2
+    assert len(user.connection_pool) == 1
+
+
+def test_early_close_disabled(server):
+    server.body_prefix = b'<!-- /content -->'
+    server.body_size = 100 * 1024
+    user = make_user(server)
+    assert len(user.urlread('/', until=user.content_end)) == 100 * 1024 + 44
+    assert len(user.connection_pool) == 1
+
+
+def test_connection_pool_maxsize(server):
+    user = make_user(server, api.ConnectionPool(maxsize=1))
+    resp1 = user.urlopen('/1')
+    resp2 = user.urlopen('/2')
+    assert user.saferead(resp1) == b'<html><body>/1</body></html>'
+    assert user.saferead(resp2) == b'<html><body>/2</body></html>'
+    assert len(user.connection_pool) == 1
+    assert user.connection_pool.stats['evicted'] == 1
+
+
+def test_connection_pool_errors(server):
+    user = make_user(server)
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    user.connection_pool.clear()
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('http://127.0.0.1:{}/'.format(port))
+    assert excinfo.value.code == api.TabunError.URL_ERROR
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'deflate', 'deflate-raw'])
+@pytest.mark.parametrize('connection_pool', [None, True])
+def test_decompression(server, encoding, connection_pool):
+    server.encoding = encoding
+    server.body_size = 300000
+    user = make_user(server, connection_pool=connection_pool)
+    expected = b'<html><body>/foo/' + b'x' * 300000 + b'</body></html>'
+
+    assert user.urlread('/foo/') == expected
+    assert 'gzip' in server.request_headers[-1]['accept-encoding']
+
+    resp = user.urlopen('/foo/')
+    assert resp.headers.get('Content-Encoding') is None
+    assert resp.read(12) == b'<html><body>'
+    assert user.saferead(resp) == expected[12:]
+
+    stats = user.decompress_handler.stats
+    assert stats['responses'] == 2
+    assert stats['decompressed_bytes'] == 2 * len(expected)
+    assert 0 < stats['compressed_bytes'] < len(expected) // 10
+
+    if connection_pool:
+        assert len(server.connections) == 1
+
+
+def test_decompression_disabled(server):
+    server.encoding = 'gzip'
+    user = make_user(server, connection_pool=None, compression=False)
+    assert user.decompress_handler is None
+    assert user.urlread('/') == b'<html><body>/</body></html>'
+    assert 'accept-encoding' not in server.request_headers[-1] or 'gzip' not in server.request_headers[-1]['accept-encoding']
+
+
+def test_decompression_override_header(server):
+    server.encoding = 'gzip'
+    user = make_user(server, connection_pool=None, override_headers={'Accept-Encoding': 'identity'})
+    assert user.urlread('/') == b'<html><body>/</body></html>'
+    assert server.request_headers[-1]['accept-encoding'] == 'identity'
+
+
+def test_decompression_error_page(server):
+    server.encoding = 'gzip'
+    server.status = 404
+    user = make_user(server, connection_pool=None)
+    with pytest.raises(api.TabunError) as excinfo:
+        user.urlread('/missing/')
+    assert excinfo.value.code == 404
+    assert excinfo.value.data == b'<html><body>/missing/</body></html>'
+
+
+def test_decompression_brotli(server):
+    pytest.importorskip('brotli')
+    server.encoding = 'br'
+    user = make_user(server, connection_pool=None)
+    assert 'br' in user.decompress_handler.encodings
+    assert user.urlread('/') == b'<html><body>/</body></html>'
+
+
+@pytest.mark.parametrize('body', [
+    b'\x1f\x8bnotgzipdata' * 10,
+    compress(b'<html><body>' + b'x' * 100000 + b'</body></html>', 'gzip')[:-20],
+])
+def test_decompression_broken_body(body):
+    from tabun_api.transport import _DecodingReader, _ZlibDecoder
+    user = api.User(session_id='abcdef9876543210abcdef9876543210', security_ls_key='0123456789abcdef0123456789abcdef', avoid_cf=False)
+    reader = _DecodingReader(BytesIO(body), _ZlibDecoder('gzip'), lambda x, y: None)
+    with pytest.raises(api.TabunError) as excinfo:
+        user._netwrap(reader.read)
+    assert 'decompress' in excinfo.value.message
+
+
+def test_decompression_bounded_chunks():
+    from tabun_api.transport import _DecodingReader, _ZlibDecoder
+    expected = b'<html><body>' + b'x' * 5000000 + b'</body></html>'
+    reader = _DecodingReader(BytesIO(compress(expected, 'gzip')), _ZlibDecoder('gzip'), lambda x, y: None)
+
+    chunks = []
+    while True:
+        chunk = reader.read(1000)
+        assert len(reader._buf) <= reader.chunk_size
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert b''.join(chunks) == expected
+
+
+def test_connection_pool_connect_discard():
+    class Conn(object):
+        sock = None
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    pool = api.ConnectionPool()
+    conn, reused = pool.connect('key', Conn)
+    assert not reused
+    assert pool.stats['created'] == 1
+
+    pool.discard(conn, stale=True)
+    assert conn.closed
+    assert pool.stats['stale'] == 1
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+import tabun_api as api
+from tabun_api import utils
+
+
+def make_comment(comment_id, parent_id=None):
+    return api.Comment(time.gmtime(0), 'news', 1, comment_id, 'user', None, 0, parent_id)
+
+
+def make_comments(pairs):
+    return dict((x, make_comment(x, p)) for x, p in pairs)
+
+
+def dump_lists(items):
+    return [(c.comment_id, dump_lists(children)) for c, children in items]
+
+
+def test_comment_tree():
+    tree = api.CommentTree(make_comments([(1, None), (2, 1), (3, 1), (4, 2), (5, None), (6, 4)]))
+    assert len(tree) == 6
+    assert 4 in tree and 7 not in tree
+    assert tree[4].comment_id == 4
+    assert [c.comment_id for c in tree.roots] == [1, 5]
+    assert [c.comment_id for c in tree.children(1)] == [2, 3]
+    assert tree.parent(4).comment_id == 2
+    assert tree.parent(1) is None
+    assert tree.depth(6) == 3
+    assert [c.comment_id for c in tree.path(6)] == [1, 2, 4, 6]
+    assert [(c.comment_id, d) for c, d in tree.walk()] == [(1, 0), (2, 1), (4, 2), (6, 3), (3, 1), (5, 0)]
+    assert [c.comment_id for c in tree.subtree(2)] == [2, 4, 6]
+    assert [c.comment_id for c in tree] == [1, 2, 4, 6, 3, 5]
+    assert tree.orphans == []
+
+    # Дельта из get_comments_from
+    assert tree.update(make_comments([(7, 3), (8, 5), (3, 1)])) == [7, 8]
+    assert [c.comment_id for c in tree.children(3)] == [7]
+    assert tree.depth(8) == 1
+
+
+def test_comment_tree_orphans():
+    tree = api.CommentTree(make_comments([(1, None), (3, 2), (4, 3)]))
+    assert tree.orphans == [3]
+    assert [c.comment_id for c in tree.roots] == [1, 3]
+    assert tree.depth(4) == 1
+
+    # Родитель пришёл позже, сирота переезжает к нему вместе с ответами
+    tree.add(make_comment(2, 1))
+    assert tree.orphans == []
+    assert [c.comment_id for c in tree.roots] == [1]
+    assert [c.comment_id for c in tree.path(4)] == [1, 2, 3, 4]
+
+
+def test_comment_tree_cycle():
+    tree = api.CommentTree()
+    tree.add(make_comment(1, 2))
+    tree.add(make_comment(2, 1))
+    assert tree.orphans == [1]
+    assert [c.comment_id for c in tree] == [1, 2]
+
+
+def test_comment_tree_deep():
+    tree = api.CommentTree(make_comments([(i, i - 1 or None) for i in range(1, 5001)]))
+    walk = list(tree.walk())
+    assert len(walk) == 5000
+    assert walk[-1][1] == 4999
+    assert tree.depth(5000) == 4999
+    assert len(tree.as_lists()) == 1
+
+
+def test_generate_comments_tree():
+    comments = make_comments([(1, None), (2, 1), (3, 1), (4, 2), (5, None), (7, 6)])
+    tree, orphans = utils.generate_comments_tree(comments)
+    assert dump_lists(tree) == [(1, [(2, [(4, [])]), (3, [])]), (5, []), (7, [])]
+    assert orphans == [7]
+
+
+def test_generate_comments_tree_unusual_parents():
+    # В отличие от CommentTree, ответ на коммент с большим id и коммент,
+    # ссылающийся сам на себя, остаются сиротами
+    comments = make_comments([(1, None), (2, 3), (3, 1), (4, 4)])
+    tree, orphans = utils.generate_comments_tree(comments)
+    assert dump_lists(tree) == [(1, [(3, [])]), (2, []), (4, [])]
+    assert orphans == [2, 4]
+
+    tree = api.CommentTree(comments)
+    assert dump_lists(tree.as_lists()) == [(1, [(3, [(2, [])])]), (4, [])]
+    assert tree.orphans == []
+
+
+def test_comment_tree_strict_order():
+    tree = api.CommentTree(strict_order=True)
+    tree.add(make_comment(1))
+    tree.add(make_comment(3, 2))
+    tree.add(make_comment(2, 1))
+
+    # Родитель появился позже, но сирота остаётся в корне
+    assert dump_lists(tree.as_lists()) == [(1, [(2, [])]), (3, [])]
+    assert tree.orphans == [3]
+
+
+def test_generate_comments_tree_random():
+    import random
+
+    def reference(comms):
+        # Построение дерева до появления CommentTree
+        tree_dict = {}
+        tree = []
+        orphans = []
+        for comment in sorted(comms.values(), key=lambda x: x.comment_id):
+            item = (comment, [])
+            tree_dict[comment.comment_id] = item
+            if not comment.parent_id:
+                tree.append(item)
+                continue
+            parent = tree_dict.get(comment.parent_id)
+            if not parent or parent is item:
+                tree.append(item)
+                orphans.append(comment.comment_id)
+            else:
+                parent[1].append(item)
+        return tree, orphans
+
+    rnd = random.Random(42)
+    for _ in range(20):
+        ids = rnd.sample(range(1, 300), 100)
+        comments = make_comments((x, rnd.choice([None, rnd.randint(1, 300)])) for x in ids)
+        tree, orphans = utils.generate_comments_tree(comments)
+        expected_tree, expected_orphans = reference(comments)
+        assert dump_lists(tree) == dump_lists(expected_tree)
+        assert orphans == expected_orphans
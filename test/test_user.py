@@ -5,6 +5,9 @@
 
 from __future__ import unicode_literals
 
+import time
+import threading
+
 import pytest
 import tabun_api as api
 from tabun_api.compat import PY2
@@ -203,6 +206,12 @@ def test_init_proxy_unknown():
         UserTest(proxy='blablabla,localhost,9999')
 
 
+def test_init_proxy_connection_pool():
+    with pytest.raises(ValueError):
+        UserTest(proxy='socks5://localhost:9999', connection_pool=True)
+    assert UserTest(proxy='', connection_pool=True).connection_pool is not None
+
+
 def test_check_login(user):
     user.security_ls_key = None
     with pytest.raises(api.TabunError):
@@ -392,6 +401,276 @@ def _get_cf_data(set_cookie_1=True, set_cookie_2=True):
     }
 
 
+class ConcurrencyCounter(object):
+    def __init__(self, func, delay=0.05):
+        self.func = func
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+        try:
+            time.sleep(self.delay)
+            return self.func(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.current -= 1
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+@pytest.mark.parametrize('max_in_flight,expected', [
+    (1, 1),
+    (3, 3),
+    (None, 6),
+])
+def test_send_request_max_in_flight(max_in_flight, expected):
+    user = UserTest(max_in_flight=max_in_flight)
+    counter = ConcurrencyCounter(user.test_open)
+    user.test_open = counter
+    results = []
+
+    def fetch():
+        results.append(user.urlread('/'))
+
+    run_threads(fetch, 6)
+    assert len(results) == 6
+    assert all(x == results[0] for x in results)
+    assert counter.max == expected
+
+
+def test_concurrent_session_updates(user):
+    user.extra_cookies['a'] = '1'
+    cookies = []
+    orig_build_request = user.build_request
+
+    def build_request(*args, **kwargs):
+        req = orig_build_request(*args, **kwargs)
+        cookies.append(req.get_header('Cookie'))
+        return req
+
+    user.build_request = build_request
+
+    def update():
+        for i in range(50):
+            user.urlread('/')
+            with user.lock:
+                user.extra_cookies['a'] = str(i)
+                user.security_ls_key = 'key' + str(i)
+
+    run_threads(update, 4)
+    assert len(cookies) == 200
+    assert user.extra_cookies['a'] == '49'
+
+
+def test_early_close(user):
+    full = user.urlread('/')
+    early_user = UserTest(early_close=True)
+    early_user.stream_chunk_size = 100
+
+    data = early_user.urlread('/', until=early_user.content_end)
+    assert len(data) < len(full)
+    assert full.startswith(data)
+    assert early_user.content_end in data[-100 - len(early_user.content_end):]
+    assert early_user.urlread('/') == full
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_early_close_parsers(set_mock, user, streaming):
+    set_mock({'/profile/test/': 'profile.html'})
+    early_user = UserTest(early_close=True, streaming=streaming)
+    early_user.stream_chunk_size = 100
+
+    posts = early_user.get_posts('/')
+    assert [x.post_id for x in posts] == [x.post_id for x in user.get_posts('/')]
+    # Шапка с именем пользователя тоже скачалась
+    assert posts[0].context['username'] == 'test'
+
+    assert early_user.get_profile('test').username == user.get_profile('test').username
+    assert early_user.get_profile('test').context == user.get_profile('test').context
+    assert early_user.get_activity() == user.get_activity()
+
+
+def test_fetch_many_posts(user):
+    urls = ['/', '/blog/132085.html', '/blog/138983.html']
+    results = list(user.fetch_many(urls, ordered=True))
+    assert [x[0] for x in results] == urls
+    for url, result, exc in results:
+        assert exc is None
+        assert [p.post_id for p in result] == [p.post_id for p in user.get_posts(url)]
+
+
+def test_fetch_many_errors(user):
+    urls = ['/', '/nonexistent/', '/stream/all/']
+    results = dict((url, (result, exc)) for url, result, exc in user.fetch_many(urls, kind='raw', workers=2))
+    assert sorted(results.keys()) == sorted(urls)
+    assert results['/'][0] == user.urlread('/')
+    assert results['/'][1] is None
+    assert results['/nonexistent/'][0] is None
+    assert isinstance(results['/nonexistent/'][1], api.TabunError)
+    assert results['/nonexistent/'][1].code == 404
+    assert results['/stream/all/'][1] is None
+
+
+def test_fetch_many_profile(set_mock, user):
+    set_mock({'/profile/test/': 'profile.html'})
+    url, result, exc = list(user.fetch_many(['/profile/test/'], kind='profile'))[0]
+    assert exc is None
+    assert result.username == user.get_profile('test').username
+
+
+def test_fetch_many_custom_parser(user):
+    def parser(url, raw_data):
+        return url, len(raw_data)
+
+    result = list(user.fetch_many(['/blog/borderline/138982.html'], kind=parser))
+    assert result == [('/blog/borderline/138982.html', (api.http_host + '/blog/borderline/138982.html', len(user.urlread('/blog/borderline/138982.html'))), None)]
+
+    with pytest.raises(ValueError):
+        list(user.fetch_many(['/'], kind='foo'))
+
+
+def test_fetch_many_concurrent():
+    user = UserTest(max_in_flight=4)
+    counter = ConcurrencyCounter(user.test_open)
+    user.test_open = counter
+    results = list(user.fetch_many(['/'] * 8, kind='raw', workers=4))
+    assert len(results) == 8
+    assert all(x[2] is None for x in results)
+    assert counter.max == 4
+
+
+def test_fetch_many_query_interval(user):
+    user.query_interval = 0.05
+    tm = time.time()
+    results = list(user.fetch_many(['/'] * 4, kind='raw', workers=4))
+    assert len(results) == 4
+    assert time.time() - tm >= 0.15
+
+
+def test_parse_blog_url():
+    assert api.parse_blog_url('https://tabun.everypony.ru/blog/borderline/') == 'borderline'
+    assert api.parse_blog_url('/blog/news?page=2') == 'news'
+    assert api.parse_blog_url('/blog/borderline/138982.html') is None
+    assert api.parse_blog_url(None) is None
+
+
+class Barrier(object):
+    # threading.Barrier нет во втором питоне
+    def __init__(self, count):
+        self.count = count
+        self.cond = threading.Condition()
+
+    def wait(self):
+        with self.cond:
+            self.count -= 1
+            if self.count <= 0:
+                self.cond.notify_all()
+            while self.count > 0:
+                self.cond.wait()
+
+
+def test_single_flight_disabled_by_default(user):
+    assert user.single_flight is None
+
+
+def test_single_flight_urlread():
+    user = UserTest(max_in_flight=None, single_flight=True)
+    counter = ConcurrencyCounter(user.test_open, delay=0.2)
+    user.test_open = counter
+    barrier = Barrier(5)
+    results = []
+
+    def fetch():
+        barrier.wait()
+        results.append(user.urlread('/'))
+
+    run_threads(fetch, 5)
+    assert len(results) == 5
+    assert all(x == results[0] for x in results)
+    assert counter.max == 1
+    assert user.single_flight.stats['misses'] == 1
+    assert user.single_flight.stats['hits'] == 4
+    assert user.single_flight.stats['saved_bytes'] == 4 * len(results[0])
+
+    # Запросы после завершения выполняются заново
+    user.urlread('/')
+    assert user.single_flight.stats['misses'] == 2
+
+
+def test_single_flight_get_post():
+    user = UserTest(max_in_flight=None, single_flight=True)
+    user.test_open = ConcurrencyCounter(user.test_open, delay=0.2)
+    barrier = Barrier(3)
+    posts = []
+
+    def fetch():
+        barrier.wait()
+        posts.append(user.get_post(138982, 'borderline'))
+
+    run_threads(fetch, 3)
+    assert len(posts) == 3
+    assert posts[0].post_id == posts[1].post_id == posts[2].post_id == 138982
+    assert user.single_flight.stats['hits'] == 2
+
+    # Каждый поток получает свой объект, и изменения в одном не видны в других
+    assert len(set(id(x) for x in posts)) == 3
+    assert posts[1].raw_body == posts[0].raw_body
+    posts[0].raw_body = 'изменено'
+    posts[0].context['mine'] = True
+    assert posts[1].raw_body != 'изменено'
+    assert 'mine' not in posts[2].context
+
+
+def test_single_flight_errors():
+    user = UserTest(max_in_flight=None, single_flight=True)
+    user.test_open = ConcurrencyCounter(user.test_open, delay=0.2)
+    barrier = Barrier(3)
+    errors = []
+
+    def fetch():
+        barrier.wait()
+        try:
+            user.urlread('/nonexistent/')
+        except api.TabunError as exc:
+            errors.append(exc.code)
+
+    run_threads(fetch, 3)
+    assert errors == [404, 404, 404]
+    assert user.single_flight.stats['misses'] == 1
+
+
+def test_single_flight_sessions():
+    single_flight = api.SingleFlight()
+    user1 = UserTest(single_flight=single_flight)
+    user2 = UserTest(session_id='00000000000000000000000000000000', security_ls_key='0123456789abcdef0123456789abcdef', single_flight=single_flight)
+    assert user1.get_session_identity() != user2.get_session_identity()
+    for user in (user1, user2):
+        user.test_open = ConcurrencyCounter(user.test_open, delay=0.2)
+    barrier = Barrier(2)
+
+    def fetch(user):
+        barrier.wait()
+        user.urlread('/')
+
+    threads = [threading.Thread(target=fetch, args=(x,)) for x in (user1, user2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert single_flight.stats['hits'] == 0
+
+
 def test_cloudflare_solution_ok(set_mock, as_guest, intercept):
     cfdata = _get_cf_data()
 
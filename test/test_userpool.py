@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+
+import tabun_api as api
+from tabun_api.userpool import UserPool
+
+import testutil
+from testutil import UserTest, intercept, set_mock, form_intercept, as_guest, user
+
+
+@pytest.fixture(scope='function')
+def pool():
+    yield UserPool([UserTest(), UserTest(), UserTest()])
+
+
+def test_userpool_writer_default(pool):
+    assert len(pool) == 3
+    assert pool.writer is pool.sessions[0].user
+    assert pool.http_host == pool.writer.http_host
+    assert pool.username == 'test'
+
+
+def test_userpool_set_writer(pool):
+    writer = UserTest()
+    pool.writer = writer
+    assert len(pool) == 4
+    assert pool.writer is writer
+
+    pool.remove(writer)
+    assert len(pool) == 3
+    assert pool.writer is pool.sessions[0].user
+
+
+def test_userpool_empty():
+    pool = UserPool()
+    with pytest.raises(api.TabunError) as excinfo:
+        pool.get_posts('/')
+    assert excinfo.value.code == api.TabunError.NO_SESSIONS
+    with pytest.raises(api.TabunError):
+        pool.writer  # pylint: disable=pointless-statement
+
+
+def test_userpool_read_round_robin(pool):
+    # Без параллельных запросов нагрузка распределяется по числу запросов
+    for _ in range(6):
+        assert pool.get_post(138983)
+    assert [x.requests for x in pool.sessions] == [2, 2, 2]
+    assert [x.in_flight for x in pool.sessions] == [0, 0, 0]
+
+
+def test_userpool_least_loaded(pool, set_mock, intercept):
+    started = threading.Event()
+    release = threading.Event()
+    first = pool.sessions[0]
+
+    @intercept('/blog/138983.html')
+    def handler(data, headers):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pool.get_post(138983)))
+    thread.start()
+    try:
+        assert started.wait(5)
+        assert first.in_flight == 1
+        # Занятая сессия не выбирается, пока у других нет запросов
+        pool.get_post(138983)
+        pool.get_post(138983)
+        assert first.requests == 1
+        assert [x.requests for x in pool.sessions[1:]] == [1, 1]
+    finally:
+        release.set()
+        thread.join()
+    assert result and first.in_flight == 0
+
+
+def test_userpool_writes_pinned(pool, set_mock, form_intercept):
+    writer = pool.writer
+    set_mock({'/ajax/vote/topic/': (None, {'data': b'{"iRating": 5, "sMsgTitle": "", "sMsg": "", "bStateError": false}'})})
+    sent = []
+
+    @form_intercept('/ajax/vote/topic/')
+    def handler(data, headers):
+        sent.append(data)
+
+    for _ in range(3):
+        assert pool.vote(138983, 1) == 5
+    assert len(sent) == 3
+    assert [x.requests for x in pool.sessions] == [0, 0, 0]
+    assert pool.vote.__self__ is writer
+
+
+def test_userpool_logged_out(pool):
+    for _ in range(3):
+        pool.get_post(138983)
+    assert len(pool.get_healthy_sessions()) == 3
+
+    testutil.guest_mode = True
+    try:
+        # Сервер забыл сессию: имя пользователя пропало из шапки
+        post = pool.get_post(138983)
+        assert post.context['username'] is None
+    finally:
+        testutil.guest_mode = False
+
+    healthy = pool.get_healthy_sessions()
+    assert len(healthy) == 2
+    assert pool.sessions[0] not in healthy
+    for _ in range(4):
+        pool.get_post(138983)
+    assert pool.sessions[0].requests == 2
+
+
+def test_userpool_logged_out_activity(pool):
+    last_id, items = pool.get_activity()
+    assert items and items[0].context['username'] == 'test'
+    assert len(pool.get_healthy_sessions()) == 3
+
+    # get_activity возвращает кортеж (last_id, items)
+    testutil.guest_mode = True
+    try:
+        last_id, items = pool.get_activity()
+        assert items[0].context['username'] is None
+    finally:
+        testutil.guest_mode = False
+    assert len(pool.get_healthy_sessions()) == 2
+
+
+def test_userpool_check_health(pool, as_guest):
+    assert pool.check_health() == 0
+    with pytest.raises(api.TabunError) as excinfo:
+        pool.get_post(138983)
+    assert excinfo.value.code == api.TabunError.NO_SESSIONS
+
+    testutil.guest_mode = False
+    assert pool.check_health(pool.sessions[1].user) == 1
+    assert pool.get_healthy_sessions() == [pool.sessions[1]]
+
+
+def test_userpool_failures_cooldown(pool, set_mock):
+    pool.max_failures = 2
+    set_mock({'/blog/1.html': ('502.html', {'status': 502, 'status_msg': 'Bad Gateway'})})
+
+    for _ in range(6):
+        with pytest.raises(api.TabunError) as excinfo:
+            pool.get_post(1)
+        assert excinfo.value.code == 502
+    assert pool.get_healthy_sessions() == []
+
+    for session in pool.sessions:
+        session.disabled_until -= pool.cooldown
+    assert len(pool.get_healthy_sessions()) == 3
+
+
+def test_userpool_not_found_is_not_failure(pool, set_mock):
+    pool.max_failures = 1
+    set_mock({'/blog/1.html': ('404.html', {'status': 404, 'status_msg': 'Not Found'})})
+    for _ in range(3):
+        with pytest.raises(api.TabunError) as excinfo:
+            pool.get_post(1)
+        assert excinfo.value.code == 404
+    assert len(pool.get_healthy_sessions()) == 3
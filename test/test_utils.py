@@ -246,6 +246,79 @@ def test_html_escape_single_bytes():
     assert utils.html_escape(b'&lt;"<>\'', True) == b'&amp;lt;&quot;&lt;&gt;&#39;'
 
 
+def test_html_escape_unchanged():
+    assert utils.html_escape(b'abc') == b'abc'
+    assert utils.html_escape('abc', True) == 'abc'
+
+
+def preprocess_page_fixtures():
+    import os
+    from testutil import data_dir
+    return sorted(x for x in os.listdir(data_dir) if x.endswith('.html'))
+
+
+@pytest.mark.parametrize('name', preprocess_page_fixtures())
+@pytest.mark.parametrize('may_be_short', [False, True])
+def test_preprocess_page(name, may_be_short):
+    from testutil import load_file
+
+    data = load_file(name)
+    data = data + data.replace(b'</body>', b'<div class="topic-content text">a &amp; b</div><footer></footer></body>')
+    cfdata = utils.replace_cloudflare_emails(data)
+
+    assert utils.preprocess_page(data, may_be_short) == utils.escape_comment_contents(utils.escape_topic_contents(cfdata, may_be_short))
+    assert utils.preprocess_page(data, may_be_short, comments=False) == utils.escape_topic_contents(cfdata, may_be_short)
+
+
+def test_preprocess_page_light():
+    from testutil import load_file
+
+    data = utils.preprocess_page(load_file('132085.html'), True, light=True)
+    node = utils.parse_html(data)
+    bodies = node.xpath('//div[@class="topic-content text"] | //div[@class="comment-content"]/div[@class="text"]')
+    assert bodies
+    for body in bodies:
+        assert body.get('data-escaped') == '1'
+        assert not body.text
+        assert len(body) == 0
+
+
+@pytest.mark.parametrize('name', ['index.html', '132085.html', 'comments.html', 'profile.html', 'activity_items.html'])
+def test_detect_layout_old(name):
+    from testutil import load_file
+
+    assert utils.detect_layout(load_file(name)) == 'old'
+
+
+def test_detect_layout():
+    assert utils.detect_layout(b'<a rel="author">x</a><a class="user-with-avatar">y</a>') == 'new'
+    assert utils.detect_layout(b'<a class="blog-title-wrapper" href="/blog/x/">x</a>') == 'new'
+    assert utils.detect_layout(b'<a class="comment-author">x</a>') == 'old'
+    assert utils.detect_layout(b'<div>x</div>') is None
+    assert utils.detect_layout(b'') is None
+
+
+def test_streaming_fragment_parser_layout():
+    data = b'<div class="x"><a class="comment-author"></a></div><!-- /end -->'
+    parser = utils.StreamingFragmentParser(b'<div class="x"', b'<!-- /end -->', b'</div>')
+    assert parser.layout is None
+    for i in range(0, len(data), 10):
+        parser.feed(data[i:i + 10])
+    parser.close()
+    assert parser.layout == 'old'
+
+
+def test_preprocess_page_broken_section():
+    # section, пересекающий тело поста, обрабатывается как раньше
+    data = (
+        b'<section class="comment"><div class="comment-content"><div class="text">'
+        b'<div class="topic-content text"><section>1</section></div><footer></footer>'
+        b'</div></div><div class="comment-info"></div></section>'
+    )
+    expected = utils.escape_comment_contents(utils.escape_topic_contents(data))
+    assert utils.preprocess_page(data) == expected
+
+
 def test_get_cookies_dict():
     from io import BytesIO
     if PY2:
@@ -316,3 +389,69 @@ def test_build_proxy_params_complex():
         'username': 'admin',
         'password': '123456',
     }
+
+
+def serialize_fragments(items):
+    return [x if isinstance(x, text) else lxml.html.tostring(x, encoding='unicode' if not PY2 else None) for x in items]
+
+
+@pytest.mark.parametrize('name,start,end,unit_end,extend,with_end', [
+    ('index.html', b'<article ', b'</article> <!-- /.topic -->', b'</article>', True, True),
+    ('138983.html', b'<article ', b'</article> <!-- /.topic -->', b'</article>', True, True),
+    ('comments.html', b'<div class="comments', b'<!-- /content -->', b'</section>', True, False),
+    ('132085.html', b'<div class="comments', b'<!-- /content -->', b'</section>', True, False),
+    ('activity.html', b'<div id="content"', b'<!-- /content', b'</li>', False, False),
+])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000, 1 << 30])
+def test_streaming_fragment_parser(name, start, end, unit_end, extend, with_end, chunk_size):
+    from testutil import load_file
+
+    def preprocess(data):
+        return utils.escape_comment_contents(utils.escape_topic_contents(utils.replace_cloudflare_emails(data), True))
+
+    raw_data = load_file(name)
+    data = utils.find_substring(raw_data, start, end, extend=extend, with_end=with_end)
+    expected = serialize_fragments(utils.parse_html_fragment(preprocess(data)))
+
+    parser = utils.StreamingFragmentParser(start, end, unit_end, extend=extend, with_end=with_end, preprocess=preprocess)
+    for i in range(0, len(raw_data), chunk_size):
+        parser.feed(raw_data[i:i + chunk_size])
+    assert parser.get_data() == raw_data
+    assert serialize_fragments(parser.close()) == expected
+
+
+def test_streaming_fragment_parser_not_found():
+    parser = utils.StreamingFragmentParser(b'<div id="content"', b'<!-- /content', b'</li>')
+    parser.feed(b'<html><body><div id="content"><ul><li>1</li>')
+    parser.feed(b'<li>2</li></ul></div></body></html>')
+    assert parser.close() is None
+
+    parser = utils.StreamingFragmentParser(b'<div id="content"', b'<!-- /content', b'</li>')
+    parser.feed(b'<html><body></body></html>')
+    assert parser.close() is None
+
+
+def test_streaming_fragment_parser_on_element():
+    from testutil import load_file
+
+    raw_data = load_file('index.html')
+    elements = []
+    received = []
+
+    def on_element(element):
+        elements.append(element)
+        received.append(len(parser.get_data()))
+
+    parser = utils.StreamingFragmentParser(
+        b'<article ', b'</article> <!-- /.topic -->', b'</article>', extend=True,
+        on_element=on_element, tag='article',
+    )
+    for i in range(0, len(raw_data), 1000):
+        parser.feed(raw_data[i:i + 1000])
+    # Первые посты распарсены задолго до конца страницы
+    assert received[0] < len(raw_data) // 2
+
+    articles = [x for x in parser.close() if not isinstance(x, text) and x.tag == 'article']
+    assert len(articles) == 6
+    assert len(elements) == len(articles)
+    assert all(x is y for x, y in zip(elements, articles))
@@ -71,3 +71,48 @@ def test_replace_cloudflare_emails_unicode(input_html, output_html):
 )
 def test_replace_cloudflare_emails_bytes(input_html, output_html):
     assert utils.replace_cloudflare_emails(input_html.encode('utf-8')) == output_html.encode('utf-8')
+
+
+def replace_cloudflare_emails_regex(data):
+    # Старая реализация на регулярках, для сравнения
+    result = utils.cf_email_b.sub(lambda x: utils.decode_cf_email(x.groups()[1]), data)
+    result = utils.cf_email_a_b.sub(utils.decode_cf_email_for_link, result)
+    return utils.cf_email_s_b.sub(b'', result)
+
+
+adversarial_cases = [
+    ('class_without_payload', b' data-cfemail="x"', b'<span class="__cf_email__">x</span>'),
+    ('unclosed_scripts', b'<script>', b'x' * 100 + b'getAttribute(\'data-cfemail\')<script>'),
+    ('unclosed_link_tags', b'<a ', b'href="/cdn-cgi/l/email-protection#zz" <a '),
+    ('unclosed_payload', b'<b class="__cf_email__" data-cfemail="', b'abcdef' * 10),
+]
+
+
+@pytest.mark.parametrize(
+    'head,unit',
+    [pytest.param(*x[1:], id=x[0]) for x in adversarial_cases]
+)
+def test_replace_cloudflare_emails_adversarial(head, unit):
+    data = head + unit * 200
+    assert utils.replace_cloudflare_emails(data) == replace_cloudflare_emails_regex(data) == data
+
+    # На регулярках это заняло бы минуты
+    data = head + unit * 50000
+    assert utils.replace_cloudflare_emails(data) == data
+
+
+def test_replace_cloudflare_emails_mixed():
+    data = ''.join(x[1] + 'текст' for x in test_cases).encode('utf-8') * 3
+    assert utils.replace_cloudflare_emails(data) == replace_cloudflare_emails_regex(data)
+    assert utils.replace_cloudflare_emails(data.decode('utf-8')) == replace_cloudflare_emails_regex(data).decode('utf-8')
+
+
+def test_replace_cloudflare_emails_without_markers():
+    data = b'<a href="/blog/">class="__cf_email__"</a><script>x</script>'
+    assert utils.replace_cloudflare_emails(data) is data
+
+
+def test_decode_cf_email():
+    assert utils.decode_cf_email(b'572738343f233617322132252e2738392e792522') == b'pochta@everypony.ru'
+    assert utils.decode_cf_email('572738343f233617322132252e2738392e792522') == 'pochta@everypony.ru'
+    assert utils.decode_cf_email(b'57') == b''
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pylint: disable=W0611, W0613, W0621, E1101
+
+from __future__ import unicode_literals
+
+import lxml.html
+from lxml import etree
+
+from tabun_api import xpaths
+
+
+def iter_groups(group):
+    yield group
+    for name in ('new', 'old'):
+        if hasattr(group, name):
+            for x in iter_groups(getattr(group, name)):
+                yield x
+
+
+def test_xpaths_compiled():
+    for name in xpaths.__all__[2:]:
+        groups = list(iter_groups(getattr(xpaths, name)))
+        assert any(group.expressions for group in groups)
+        for group in groups:
+            for key, expression in group.expressions.items():
+                xp = getattr(group, key)
+                assert isinstance(xp, etree.XPath)
+                assert xp.path == expression
+
+
+def test_xpaths_call():
+    node = lxml.html.fromstring(
+        '<section><div class="comment-info"><a class="user-with-avatar"><span class="nickname"> nick </span></a>'
+        '</div></section>'
+    )
+    info = xpaths.comment.info(node)[0]
+    assert info.get('class') == 'comment-info'
+    assert xpaths.comment.new.nickname(xpaths.comment.new.author(info)[0]) == [' nick ']
+    assert xpaths.comment.old.author(info) == []
+
+
+def test_xpaths_select():
+    new_node = lxml.html.fromstring('<div><a class="user-with-avatar"></a></div>')
+    old_node = lxml.html.fromstring('<div><a class="comment-author"></a></div>')
+    empty_node = lxml.html.fromstring('<div><a></a></div>')
+
+    for layout in (None, 'new', 'old'):
+        assert xpaths.select(xpaths.comment, 'author', new_node, layout)[0] == 'new'
+        assert xpaths.select(xpaths.comment, 'author', old_node, layout)[0] == 'old'
+        assert xpaths.select(xpaths.comment, 'author', empty_node, layout) == (None, [])
+
+
+def test_xpaths_variables():
+    node = lxml.html.fromstring('<div><b id="vote_total_user_1">+1</b><b id="vote_total_user_2">+2</b></div>')
+    assert xpaths.profile.vote_total(node, id='vote_total_user_2') == ['+2']
+
+
+def test_xpaths_set():
+    group = xpaths.XPathGroup('test', title='h1/text()')
+    node = lxml.html.fromstring('<div><h1>a</h1><h2>b</h2></div>')
+    assert group.title(node) == ['a']
+    group.set('title', 'h2/text()')
+    assert group.title(node) == ['b']
+    assert group.expressions == {'title': 'h2/text()'}